@@ -3,23 +3,35 @@
 import os
 import sys
 from typing import Final
-from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
 from ragxiv.database import (
     open_db_connection,
     create_embedding_table,
+    create_vector_index,
     PostgresParams,
+    VectorIndexParams,
     create_user_feedback_table,
 )
 from ragxiv.config import get_config
+from ragxiv.embedding import load_embedding_model
 
 load_dotenv(".env")
 
 config = get_config()
 if config:
     config_ingestion = config["ingestion"]
+    config_index = config["index"]
 
 EMBEDDING_MODEL_NAME: Final = config_ingestion["embedding_model_name"]
+EMBEDDING_PRECISION: Final = config_ingestion["embedding_precision"]
+VECTOR_INDEX_PARAMS = VectorIndexParams(
+    method=config_index["method"],
+    m=config_index["m"],
+    ef_construction=config_index["ef_construction"],
+    lists=config_index["lists"],
+    binary_quantization=config_index.get("binary_quantization", False),
+)
+PARTITION_BY_CATEGORY: Final = config_ingestion.get("partition_by_category", False)
 
 TABLE_EMBEDDING_ARTICLE = f"embedding_article_{EMBEDDING_MODEL_NAME}".replace("-", "_")
 TABLE_EMBEDDING_ABSTRACT = f"embedding_abstract_{EMBEDDING_MODEL_NAME}".replace(
@@ -33,7 +45,7 @@ POSTGRES_HOST = os.environ["POSTGRES_HOST"]
 POSTGRES_PORT = os.environ["POSTGRES_PORT"]
 
 # Get embedding model info
-embedding_transformer = SentenceTransformer(EMBEDDING_MODEL_NAME)
+embedding_transformer = load_embedding_model(EMBEDDING_MODEL_NAME)
 word_embedding_dimension = embedding_transformer.get_sentence_embedding_dimension()
 
 postgres_connection_params = PostgresParams(
@@ -58,12 +70,26 @@ if conn:
         conn=conn,
         table_name=TABLE_EMBEDDING_ARTICLE,
         embedding_dimension=word_embedding_dimension,
+        precision=EMBEDDING_PRECISION,
+        partition_by_category=PARTITION_BY_CATEGORY,
     )
     create_embedding_table(
         conn=conn,
         table_name=TABLE_EMBEDDING_ABSTRACT,
         embedding_dimension=word_embedding_dimension,
+        precision=EMBEDDING_PRECISION,
+        partition_by_category=PARTITION_BY_CATEGORY,
     )
+    # IVFFlat indexes are built by update_database.py once data is loaded
+    if VECTOR_INDEX_PARAMS["method"] == "hnsw":
+        for table_name in [TABLE_EMBEDDING_ARTICLE, TABLE_EMBEDDING_ABSTRACT]:
+            create_vector_index(
+                conn=conn,
+                table_name=table_name,
+                similarity_metric="<#>",
+                precision=EMBEDDING_PRECISION,
+                index_params=VECTOR_INDEX_PARAMS,
+            )
     create_user_feedback_table(
         conn=conn,
     )
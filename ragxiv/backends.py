@@ -0,0 +1,197 @@
+"""CPU inference backends for sentence-transformers embedding models"""
+
+import os
+from typing import List, Literal, Union
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+from sentence_transformers.models import Normalize, Pooling
+
+EmbeddingBackend = Literal["torch", "onnx", "int8"]
+
+# Default backend parameters
+EMBEDDING_BACKEND: EmbeddingBackend = "torch"
+ONNX_MODELS_DIR = "onnx_models"
+ONNX_OPSET_VERSION = 14
+
+
+def model_key(model_name: str, backend: EmbeddingBackend = EMBEDDING_BACKEND) -> str:
+    """Identifier of a model and backend pair, used as cache key
+
+    Backends produce slightly different vectors, so their embeddings must
+    not be mixed up in caches.
+    """
+    if backend == "torch":
+        return model_name
+    return f"{model_name}-{backend}"
+
+
+class OnnxSentenceTransformer:
+    """Sentence Transformer whose transformer runs on ONNX Runtime
+
+    Tokenization, pooling and normalization replicate the modules of the
+    original SentenceTransformer, and `encode` follows its signature so
+    that it can be used interchangeably for query and chunk encoding.
+    """
+
+    def __init__(self, model_name: str, directory: str = ONNX_MODELS_DIR):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError(
+                "The onnx embedding backend requires onnxruntime (pip install onnxruntime)"
+            ) from e
+
+        model = SentenceTransformer(model_name, device="cpu")
+        self.tokenizer = model.tokenizer
+        self.max_seq_length = model.max_seq_length
+        self._dimension = model.get_sentence_embedding_dimension()
+        pooling = [module for module in model if isinstance(module, Pooling)][0]
+        self._pooling_mode = pooling.get_pooling_mode_str()
+        self._normalize = any(isinstance(module, Normalize) for module in model)
+
+        path = os.path.join(directory, model_name, "model.onnx")
+        if not os.path.exists(path):
+            export_onnx(model=model, path=path)
+        del model
+
+        self._session = onnxruntime.InferenceSession(
+            path, providers=["CPUExecutionProvider"]
+        )
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._dimension
+
+    def encode(
+        self,
+        sentences: str | List[str],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        **kwargs,
+    ) -> np.ndarray:
+        """Encode sentences into embeddings
+
+        Args:
+            sentences (str | List[str]): Sentence or list of sentences
+            batch_size (int, optional): Number of sentences per forward
+                pass. Defaults to 32.
+            convert_to_numpy (bool, optional): Kept for compatibility with
+                SentenceTransformer.encode; output is always np.ndarray.
+
+        Returns:
+            np.ndarray: Embedding of a single sentence, or matrix with one
+                embedding per sentence
+        """
+        single_sentence = isinstance(sentences, str)
+        if isinstance(sentences, str):
+            sentences = [sentences]
+
+        embeddings = np.empty(shape=(len(sentences), self._dimension), dtype=np.float32)
+        for start in range(0, len(sentences), batch_size):
+            batch = sentences[start : start + batch_size]
+            features = self.tokenizer(
+                batch,
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            attention_mask = features["attention_mask"].astype(np.int64)
+            token_embeddings = self._session.run(
+                ["token_embeddings"],
+                {
+                    "input_ids": features["input_ids"].astype(np.int64),
+                    "attention_mask": attention_mask,
+                },
+            )[0]
+            embeddings[start : start + len(batch)] = self._pool(
+                token_embeddings, attention_mask
+            )
+
+        if self._normalize:
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings[0] if single_sentence else embeddings
+
+    def _pool(self, token_embeddings: np.ndarray, attention_mask: np.ndarray):
+        mask = attention_mask[:, :, None].astype(np.float32)
+        if self._pooling_mode == "cls":
+            return token_embeddings[:, 0]
+        elif self._pooling_mode == "mean":
+            return (token_embeddings * mask).sum(axis=1) / np.clip(
+                mask.sum(axis=1), 1e-9, None
+            )
+        elif self._pooling_mode == "max":
+            return np.where(mask > 0, token_embeddings, -1e9).max(axis=1)
+        else:
+            raise ValueError(f"Pooling mode {self._pooling_mode} not implemented")
+
+
+EncoderModel = Union[SentenceTransformer, OnnxSentenceTransformer]
+
+
+def export_onnx(model: SentenceTransformer, path: str):
+    """Export the transformer module of a SentenceTransformer to ONNX
+
+    Args:
+        model (SentenceTransformer): Model to be exported
+        path (str): Output path of the .onnx file
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    transformer = model[0]
+    auto_model = transformer.auto_model.eval()
+    dummy_features = transformer.tokenizer(
+        ["Portfolio optimization under transaction costs"], return_tensors="pt"
+    )
+    with torch.no_grad():
+        torch.onnx.export(
+            auto_model,
+            (dummy_features["input_ids"], dummy_features["attention_mask"]),
+            path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["token_embeddings"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "token_embeddings": {0: "batch", 1: "sequence"},
+            },
+            opset_version=ONNX_OPSET_VERSION,
+        )
+
+
+def load_int8_model(model_name: str) -> SentenceTransformer:
+    """SentenceTransformer with dynamically int8-quantized linear layers
+
+    Args:
+        model_name (str): Name of the embedding model
+
+    Returns:
+        SentenceTransformer: Quantized model, running on CPU
+    """
+    model = SentenceTransformer(model_name, device="cpu")
+    return torch.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def load_model_backend(model_name: str, backend: EmbeddingBackend) -> EncoderModel:
+    """Load an embedding model on the selected inference backend
+
+    Args:
+        model_name (str): Name of the embedding model
+        backend (EmbeddingBackend): Inference backend
+
+    Raises:
+        ValueError: The selected backend has not been implemented yet
+
+    Returns:
+        EncoderModel: Model exposing SentenceTransformer's encode method
+    """
+    if backend == "torch":
+        model = SentenceTransformer(model_name)
+    elif backend == "onnx":
+        model = OnnxSentenceTransformer(model_name)
+    elif backend == "int8":
+        model = load_int8_model(model_name)
+    else:
+        raise ValueError(f"EmbeddingBackend {backend} not implemented")
+    return model
@@ -0,0 +1,369 @@
+"""Cache embeddings so that the same text is not encoded twice"""
+
+import os
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, TypedDict
+import numpy as np
+
+QUERY_CACHE_MAX_ENTRIES = 4096
+
+
+class CacheStats(TypedDict):
+    hits: int
+    misses: int
+    memory_hits: int
+    disk_hits: int
+    hit_rate: float
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a query so that trivially different strings share a key
+
+    Args:
+        query (str): Raw user question
+
+    Returns:
+        str: Query without leading, trailing or repeated whitespace
+    """
+    return " ".join(query.split())
+
+
+class QueryEmbeddingCache:
+    """Two-tier cache of query embeddings
+
+    Embeddings are keyed by model name plus normalized query text. The
+    first tier is an in-memory LRU; the second, optional tier is a sqlite
+    file that persists embeddings between runs.
+    """
+
+    def __init__(
+        self, max_entries: int = QUERY_CACHE_MAX_ENTRIES, path: Optional[str] = None
+    ):
+        self.max_entries = max_entries
+        self.path = path
+        self._memory: OrderedDict[Tuple[str, str], np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits_memory = 0
+        self._hits_disk = 0
+        self._misses = 0
+
+        self._disk = None
+        if path:
+            self._disk = sqlite3.connect(path, check_same_thread=False)
+            self._disk.execute(
+                """
+                CREATE TABLE IF NOT EXISTS query_embedding (
+                    model TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    PRIMARY KEY (model, query)
+                )"""
+            )
+            self._disk.commit()
+
+    def get(self, model_name: str, query: str) -> Optional[np.ndarray]:
+        """Look up a query embedding
+
+        Args:
+            model_name (str): Name of the embedding model
+            query (str): Query text
+
+        Returns:
+            Optional[np.ndarray]: Cached embedding or None if not found
+        """
+        key = (model_name, normalize_query(query))
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._hits_memory += 1
+                return self._memory[key]
+
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT embedding FROM query_embedding WHERE model = ? AND query = ?",
+                    key,
+                ).fetchone()
+                if row is not None:
+                    embedding = np.frombuffer(row[0], dtype=np.float32)
+                    self._store_memory(key, embedding)
+                    self._hits_disk += 1
+                    return embedding
+
+            self._misses += 1
+            return None
+
+    def put(self, model_name: str, query: str, embedding: np.ndarray):
+        """Store a query embedding in every tier
+
+        Args:
+            model_name (str): Name of the embedding model
+            query (str): Query text
+            embedding (np.ndarray): Query embedding
+        """
+        key = (model_name, normalize_query(query))
+        embedding = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._store_memory(key, embedding)
+            if self._disk is not None:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO query_embedding (model, query, embedding) VALUES (?, ?, ?)",
+                    (*key, embedding.tobytes()),
+                )
+                self._disk.commit()
+
+    def _store_memory(self, key: Tuple[str, str], embedding: np.ndarray):
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> CacheStats:
+        """Hit and miss counters since creation or last reset"""
+        with self._lock:
+            hits = self._hits_memory + self._hits_disk
+            total = hits + self._misses
+            return CacheStats(
+                hits=hits,
+                misses=self._misses,
+                memory_hits=self._hits_memory,
+                disk_hits=self._hits_disk,
+                hit_rate=hits / total if total else 0.0,
+            )
+
+    def reset_stats(self):
+        with self._lock:
+            self._hits_memory = 0
+            self._hits_disk = 0
+            self._misses = 0
+
+    def clear(self):
+        """Remove every cached embedding, including the persistent tier"""
+        with self._lock:
+            self._memory.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM query_embedding")
+                self._disk.commit()
+
+    def close(self):
+        with self._lock:
+            if self._disk is not None:
+                self._disk.close()
+                self._disk = None
+
+
+QUERY_EMBEDDING_CACHE = QueryEmbeddingCache()
+
+
+def chunk_hash(chunk: str) -> str:
+    """Content address of a chunk"""
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+
+class ChunkEmbeddingCache:
+    """Persistent, content-addressed cache of chunk embeddings
+
+    Embeddings are keyed by sha256(chunk text) and model name, so chunks
+    that are identical between chunk settings or paper versions are only
+    encoded once. Each model gets its own directory containing:
+    - vectors.f32: append-only float32 matrix, read through np.memmap
+    - index.sqlite: maps chunk hashes to rows of vectors.f32
+    """
+
+    def __init__(self, directory: str, model_name: str):
+        self.model_name = model_name
+        self.directory = os.path.join(directory, model_name)
+        os.makedirs(self.directory, exist_ok=True)
+        self._vectors_path = os.path.join(self.directory, "vectors.f32")
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._vectors: Optional[np.memmap] = None
+
+        self._index = sqlite3.connect(
+            os.path.join(self.directory, "index.sqlite"), check_same_thread=False
+        )
+        self._index.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_index (hash TEXT PRIMARY KEY, row INTEGER NOT NULL)"
+        )
+        self._index.execute(
+            "CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._index.commit()
+        row = self._index.execute(
+            "SELECT value FROM metadata WHERE key = 'dimension'"
+        ).fetchone()
+        self.dimension: Optional[int] = int(row[0]) if row else None
+
+    def _number_rows(self) -> int:
+        if self.dimension is None or not os.path.exists(self._vectors_path):
+            return 0
+        return os.path.getsize(self._vectors_path) // (4 * self.dimension)
+
+    def _indexed_rows(self) -> int:
+        """Rows of vectors.f32 referenced by the index"""
+        max_row = self._index.execute("SELECT max(row) FROM chunk_index").fetchone()[0]
+        return 0 if max_row is None else max_row + 1
+
+    def _map_vectors(self, min_rows: int) -> np.memmap:
+        """Memory-map vectors.f32, remapping if it has grown since last use"""
+        if self._vectors is None or self._vectors.shape[0] < min_rows:
+            self._vectors = np.memmap(
+                self._vectors_path,
+                dtype=np.float32,
+                mode="r",
+                shape=(self._number_rows(), self.dimension),
+            )
+        return self._vectors
+
+    def _lookup_rows(self, hashes: List[str]) -> Dict[str, int]:
+        """Rows of vectors.f32 for the chunk hashes already stored"""
+        rows: Dict[str, int] = {}
+        unique_hashes = list(set(hashes))
+        # Stay below sqlite's limit of bound parameters per statement
+        for start in range(0, len(unique_hashes), 500):
+            batch = unique_hashes[start : start + 500]
+            placeholders = ", ".join("?" * len(batch))
+            rows.update(
+                self._index.execute(
+                    f"SELECT hash, row FROM chunk_index WHERE hash IN ({placeholders})",
+                    batch,
+                ).fetchall()
+            )
+        return rows
+
+    def get_many(self, chunks: List[str]) -> List[Optional[np.ndarray]]:
+        """Look up the embeddings of a list of chunks
+
+        Args:
+            chunks (List[str]): List of strings containing the different
+                document chunks
+
+        Returns:
+            List[Optional[np.ndarray]]: Cached embedding of each chunk, or
+                None for chunks that have not been encoded yet
+        """
+        hashes = [chunk_hash(chunk) for chunk in chunks]
+        with self._lock:
+            rows = self._lookup_rows(hashes)
+            embeddings: List[Optional[np.ndarray]] = [None] * len(chunks)
+            if rows:
+                vectors = self._map_vectors(min_rows=max(rows.values()) + 1)
+                for i, hash_chunk in enumerate(hashes):
+                    if hash_chunk in rows:
+                        embeddings[i] = np.array(vectors[rows[hash_chunk]])
+
+            hits = sum(embedding is not None for embedding in embeddings)
+            self._hits += hits
+            self._misses += len(chunks) - hits
+            return embeddings
+
+    def put_many(self, chunks: List[str], embeddings: np.ndarray):
+        """Append new chunk embeddings to the cache
+
+        Args:
+            chunks (List[str]): List of strings containing the different
+                document chunks
+            embeddings (np.ndarray): Matrix with one embedding per chunk
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = embeddings.shape[1]
+                self._index.execute(
+                    "INSERT INTO metadata (key, value) VALUES ('dimension', ?)",
+                    (str(self.dimension),),
+                )
+            elif embeddings.shape[1] != self.dimension:
+                raise ValueError(
+                    f"Expected embeddings of dimension {self.dimension}, got {embeddings.shape[1]}"
+                )
+
+            # Skip chunks already stored (or repeated within this call)
+            new_hashes: Dict[str, int] = {}
+            for i, chunk in enumerate(chunks):
+                hash_chunk = chunk_hash(chunk)
+                if hash_chunk not in new_hashes:
+                    new_hashes[hash_chunk] = i
+            for hash_chunk in self._lookup_rows(list(new_hashes)):
+                del new_hashes[hash_chunk]
+            if not new_hashes:
+                self._index.commit()
+                return
+
+            # A crash between the append and the commit of the index leaves
+            # vectors (or part of one) that no hash points to. They are cut,
+            # so that new vectors land on the rows the index gives them
+            first_row = self._indexed_rows()
+            if first_row > self._number_rows():
+                first_row = self._number_rows()
+                self._index.execute(
+                    "DELETE FROM chunk_index WHERE row >= ?", (first_row,)
+                )
+            size = first_row * 4 * self.dimension
+            if os.path.exists(self._vectors_path) and (
+                os.path.getsize(self._vectors_path) != size
+            ):
+                self._vectors = None
+                os.truncate(self._vectors_path, size)
+
+            # Append vectors first so that the index never points past the file
+            with open(self._vectors_path, "ab") as file:
+                file.write(embeddings[list(new_hashes.values())].tobytes())
+            self._index.executemany(
+                "INSERT INTO chunk_index (hash, row) VALUES (?, ?)",
+                [
+                    (hash_chunk, first_row + i)
+                    for i, hash_chunk in enumerate(new_hashes)
+                ],
+            )
+            self._index.commit()
+
+    def stats(self) -> CacheStats:
+        """Hit and miss counters since creation or last reset"""
+        with self._lock:
+            total = self._hits + self._misses
+            return CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                memory_hits=0,
+                disk_hits=self._hits,
+                hit_rate=self._hits / total if total else 0.0,
+            )
+
+    def reset_stats(self):
+        with self._lock:
+            self._hits = 0
+            self._misses = 0
+
+    def close(self):
+        with self._lock:
+            self._vectors = None
+            self._index.close()
+
+
+def configure_query_cache(
+    max_entries: int = QUERY_CACHE_MAX_ENTRIES, path: Optional[str] = None
+) -> QueryEmbeddingCache:
+    """Replace the process-wide query embedding cache
+
+    Args:
+        max_entries (int, optional): Size of the in-memory LRU tier.
+            Defaults to QUERY_CACHE_MAX_ENTRIES.
+        path (Optional[str], optional): sqlite file used as persistent
+            tier. If None, only the in-memory tier is used. Defaults to None.
+
+    Returns:
+        QueryEmbeddingCache: The new process-wide cache
+    """
+    global QUERY_EMBEDDING_CACHE
+    QUERY_EMBEDDING_CACHE.close()
+    QUERY_EMBEDDING_CACHE = QueryEmbeddingCache(max_entries=max_entries, path=path)
+    return QUERY_EMBEDDING_CACHE
+
+
+def get_query_cache() -> QueryEmbeddingCache:
+    """Return the process-wide query embedding cache"""
+    return QUERY_EMBEDDING_CACHE
@@ -1,12 +1,122 @@
 """Interact with PostgreSQL database"""
 
 import re
+import time
+import asyncio
+import weakref
 import datetime
+import contextlib
+import numpy as np
 import psycopg
-from pgvector.psycopg import register_vector
-from typing import List, Literal, Optional, TypedDict
-from sentence_transformers import SentenceTransformer
-from ragxiv.embedding import PaperEmbedding
+from pgvector.psycopg import register_vector, register_vector_async
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    Literal,
+    NotRequired,
+    Optional,
+    Tuple,
+    TypedDict,
+)
+from ragxiv.config import ARXIV_FIELDS
+from ragxiv.backends import EMBEDDING_BACKEND, EmbeddingBackend, EncoderModel
+from ragxiv.embedding import (
+    EMBEDDING_BATCH_SIZE,
+    PaperEmbedding,
+    encode_queries,
+    encode_query,
+    encode_query_async,
+)
+from ragxiv.ingest import PaperID
+from ragxiv.reduction import (
+    REDUCTION_OVERSAMPLING,
+    Projection,
+    apply_projection,
+    list_projection_versions,
+    load_projection,
+    reduced_column_name,
+)
+
+
+EmbeddingPrecision = Literal["vector", "halfvec"]
+SimilarityMetric = Literal["<#>", "<=>", "<->", "<+>"]
+InsertMethod = Literal["auto", "copy", "executemany"]
+IndexMethod = Literal["hnsw", "ivfflat"]
+IterativeScan = Literal["off", "relaxed_order", "strict_order"]
+TextWeight = Literal["A", "B", "C", "D"]
+TextQueryMode = Literal["any", "websearch"]
+
+# Default storage parameters
+EMBEDDING_PRECISION: EmbeddingPrecision = "vector"
+
+# Default vector index parameters (see pgvector documentation)
+INDEX_METHOD: IndexMethod = "hnsw"
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 64
+IVFFLAT_LISTS = 100
+
+# Iterative index scan used by filtered searches, so that rows discarded by
+# the filter do not leave fewer than max_documents results (pgvector>=0.8)
+ITERATIVE_SCAN: IterativeScan = "strict_order"
+
+# Tables shared by every embedding model: paper metadata and chunk text
+ARTICLES_TABLE = "articles"
+CHUNKS_TABLE = "chunks"
+ABSTRACT_CHUNK_SET = "abstract"
+
+# Default full-text search parameters: stored tsvector column, weight of
+# its lexemes, and number of matches ranked per keyword search, the most
+# recently stored ones (None ranks every match)
+TEXT_SEARCH_COLUMN = "content_tsv"
+TEXT_WEIGHT: TextWeight = "D"
+TEXT_QUERY_MODE: TextQueryMode = "any"
+TEXT_SEARCH_MAX_CANDIDATES: Optional[int] = 1000
+
+# Default bulk load parameters: writes with fewer rows than COPY_MIN_ROWS
+# use executemany, since starting a COPY is not worth it for a few rows
+INSERT_METHOD: InsertMethod = "auto"
+COPY_MIN_ROWS = 500
+INSERT_BATCH_SIZE = 1000
+
+# Queries searched per statement by semantic_search_postgres_batch
+SEARCH_BATCH_SIZE = 256
+
+# Index maintenance: index methods dropped before a bulk load and rebuilt
+# afterwards, table remembering their definitions meanwhile, and memory and
+# parallel workers of the rebuild
+BULK_LOAD_INDEX_METHODS = ("hnsw", "ivfflat", "gin")
+DEFERRED_INDEXES_TABLE = "deferred_indexes"
+MAINTENANCE_WORK_MEM = "1GB"
+MAINTENANCE_WORKERS = 4
+
+# Default connection pool parameters
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 10
+POOL_TIMEOUT = 30.0
+
+# Connections where the pgvector types have already been registered
+VECTOR_REGISTERED_CONNECTIONS: (
+    "weakref.WeakSet[psycopg.Connection | psycopg.AsyncConnection]"
+) = weakref.WeakSet()
+
+# pgvector operator class matching each distance operator
+OPERATOR_CLASS_SUFFIX = {
+    "<#>": "ip_ops",
+    "<=>": "cosine_ops",
+    "<->": "l2_ops",
+    "<+>": "l1_ops",
+    "<~>": "hamming_ops",
+}
+
+# Sign-binarized copy of the embeddings (1 bit per dimension, 32x smaller
+# than float32), searched by Hamming distance before an exact re-rank.
+# Candidates fetched per requested result by default
+BINARY_EMBEDDING_COLUMN = "embedding_binary"
+BINARY_OVERSAMPLING = 10
 
 
 class PostgresParams(TypedDict):
@@ -17,18 +127,76 @@ class PostgresParams(TypedDict):
     database: str
 
 
+class VectorIndexParams(TypedDict):
+    method: IndexMethod
+    m: NotRequired[int]
+    ef_construction: NotRequired[int]
+    lists: NotRequired[int]
+    binary_quantization: NotRequired[bool]
+
+
+class PoolStats(TypedDict):
+    pool_size: int
+    pool_available: int
+    pool_max: int
+    utilization: float
+    requests: int
+    requests_waiting: int
+    mean_wait_ms: float
+    errors: int
+
+
+class SearchFilters(TypedDict, total=False):
+    published_after: Optional[datetime.datetime]
+    published_before: Optional[datetime.datetime]
+    primary_categories: Optional[List[str]]
+    categories: Optional[List[str]]
+
+
 class SemanticSearch(TypedDict):
     query: str
     table: str
-    similarity_metric: Literal["<#>", "<=>", "<->", "<+>"]
-    embedding_model: str | SentenceTransformer
+    similarity_metric: SimilarityMetric
+    embedding_model: str | EncoderModel
     max_documents: int
+    embedding_backend: NotRequired[EmbeddingBackend]
+    embedding_precision: NotRequired[EmbeddingPrecision]
+    reduction_version: NotRequired[Optional[int]]
+    reduction_oversampling: NotRequired[int]
+    binary_quantization: NotRequired[bool]
+    binary_oversampling: NotRequired[int]
+    ef_search: NotRequired[Optional[int]]
+    probes: NotRequired[Optional[int]]
+    iterative_scan: NotRequired[IterativeScan]
+    max_chunks_per_article: NotRequired[Optional[int]]
+    include_embedding: NotRequired[bool]
+    filters: NotRequired[Optional[SearchFilters]]
 
 
 class TextSearch(TypedDict):
     query: str
     table: str
     max_documents: int
+    query_mode: NotRequired[TextQueryMode]
+    max_candidates: NotRequired[Optional[int]]
+    include_embedding: NotRequired[bool]
+    filters: NotRequired[Optional[SearchFilters]]
+
+
+class SearchResult(TypedDict):
+    article_id: str
+    chunk_id: int
+    content: str
+    score: float
+    embedding: NotRequired[np.ndarray]
+
+
+class IndexReport(TypedDict):
+    table: str
+    index: str
+    method: str
+    seconds: float
+    size_mb: float
 
 
 class UserFeedback(TypedDict):
@@ -83,16 +251,274 @@ def open_db_connection(
     return conn
 
 
+def open_db_pool(
+    connection_params: PostgresParams,
+    min_size: int = POOL_MIN_SIZE,
+    max_size: int = POOL_MAX_SIZE,
+    timeout: float = POOL_TIMEOUT,
+    autocommit: bool = True,
+) -> ConnectionPool:
+    """Open a pool of connections to PostgreSQL database
+
+    Every connection registers the pgvector types once, when it is created,
+    so that queries running on the pool do not repeat the catalog lookup.
+    Use it with `with pool.connection() as conn:`, or pass it to functions
+    accepting a connection or a pool (see `db_connection`).
+
+    Args:
+        connection_params (PostgresParams): Connection parameters for
+            opening connections to PostgreSQL database
+        min_size (int, optional): Connections kept open. Defaults to
+            POOL_MIN_SIZE.
+        max_size (int, optional): Maximum number of connections. Defaults
+            to POOL_MAX_SIZE.
+        timeout (float, optional): Seconds a client waits for a connection
+            before failing, also used to wait for the pool to be ready.
+            Defaults to POOL_TIMEOUT.
+        autocommit (bool, optional): Wether to create connections using
+            autocommit model. Defaults to True.
+
+    Returns:
+        ConnectionPool: Open connection pool
+    """
+    conninfo = psycopg.conninfo.make_conninfo(
+        host=connection_params["host"],
+        port=connection_params["port"],
+        user=connection_params["user"],
+        password=connection_params["pwd"],
+        dbname=connection_params["database"],
+    )
+    pool = ConnectionPool(
+        conninfo=conninfo,
+        min_size=min_size,
+        max_size=max_size,
+        timeout=timeout,
+        kwargs={"autocommit": autocommit},
+        configure=ensure_vector_registered,
+        open=True,
+    )
+    pool.wait(timeout=timeout)
+    print(f"Connection pool ready - {min_size} to {max_size} connections")
+    return pool
+
+
+async def open_db_pool_async(
+    connection_params: PostgresParams,
+    min_size: int = POOL_MIN_SIZE,
+    max_size: int = POOL_MAX_SIZE,
+    timeout: float = POOL_TIMEOUT,
+    autocommit: bool = True,
+) -> AsyncConnectionPool:
+    """Open a pool of async connections to PostgreSQL database
+
+    Async counterpart of `open_db_pool`, for the `*_async` search
+    functions. Each search checks out its own connection, so independent
+    searches run concurrently when awaited with asyncio.gather.
+
+    Args:
+        connection_params (PostgresParams): Connection parameters for
+            opening connections to PostgreSQL database
+        min_size (int, optional): Connections kept open. Defaults to
+            POOL_MIN_SIZE.
+        max_size (int, optional): Maximum number of connections. Defaults
+            to POOL_MAX_SIZE.
+        timeout (float, optional): Seconds a client waits for a connection
+            before failing, also used to wait for the pool to be ready.
+            Defaults to POOL_TIMEOUT.
+        autocommit (bool, optional): Wether to create connections using
+            autocommit model. Defaults to True.
+
+    Returns:
+        AsyncConnectionPool: Open connection pool
+    """
+    conninfo = psycopg.conninfo.make_conninfo(
+        host=connection_params["host"],
+        port=connection_params["port"],
+        user=connection_params["user"],
+        password=connection_params["pwd"],
+        dbname=connection_params["database"],
+    )
+    # Async pools must be opened from a running event loop
+    pool = AsyncConnectionPool(
+        conninfo=conninfo,
+        min_size=min_size,
+        max_size=max_size,
+        timeout=timeout,
+        kwargs={"autocommit": autocommit},
+        configure=ensure_vector_registered_async,
+        open=False,
+    )
+    await pool.open(wait=True, timeout=timeout)
+    print(f"Async connection pool ready - {min_size} to {max_size} connections")
+    return pool
+
+
+def ensure_vector_registered(conn: psycopg.Connection):
+    """Register the pgvector types on a connection, only the first time"""
+    if conn not in VECTOR_REGISTERED_CONNECTIONS:
+        register_vector(conn)
+        VECTOR_REGISTERED_CONNECTIONS.add(conn)
+
+
+async def ensure_vector_registered_async(conn: psycopg.AsyncConnection):
+    """Register the pgvector types on an async connection, only the first time"""
+    if conn not in VECTOR_REGISTERED_CONNECTIONS:
+        await register_vector_async(conn)
+        VECTOR_REGISTERED_CONNECTIONS.add(conn)
+
+
+@contextlib.contextmanager
+def db_connection(
+    conn: psycopg.Connection | ConnectionPool,
+) -> Iterator[psycopg.Connection]:
+    """Connection to use from either a connection or a pool
+
+    A pool checks out one of its connections and returns it on exit, so
+    concurrent callers sharing the pool each get their own connection.
+    """
+    if isinstance(conn, ConnectionPool):
+        with conn.connection() as pool_conn:
+            yield pool_conn
+    else:
+        yield conn
+
+
+@contextlib.asynccontextmanager
+async def async_db_connection(
+    conn: psycopg.AsyncConnection | AsyncConnectionPool,
+) -> AsyncIterator[psycopg.AsyncConnection]:
+    """Async connection to use from either an async connection or pool
+
+    Async counterpart of `db_connection`.
+    """
+    if isinstance(conn, AsyncConnectionPool):
+        async with conn.connection() as pool_conn:
+            yield pool_conn
+    else:
+        yield conn
+
+
+def get_pool_stats(pool: ConnectionPool) -> PoolStats:
+    """Wait time and utilization of a connection pool
+
+    Counters accumulate since the pool was opened.
+    """
+    stats = pool.get_stats()
+    requests = stats.get("requests_num", 0)
+    pool_size = stats.get("pool_size", 0)
+    pool_available = stats.get("pool_available", 0)
+    pool_stats = PoolStats(
+        pool_size=pool_size,
+        pool_available=pool_available,
+        pool_max=stats.get("pool_max", pool.max_size),
+        utilization=(pool_size - pool_available) / pool.max_size,
+        requests=requests,
+        requests_waiting=stats.get("requests_waiting", 0),
+        mean_wait_ms=stats.get("requests_wait_ms", 0) / requests if requests else 0.0,
+        errors=stats.get("requests_errors", 0),
+    )
+    return pool_stats
+
+
+def create_content_tables(
+    conn: psycopg.Connection, text_weight: TextWeight = TEXT_WEIGHT
+):
+    """
+    Create the tables shared by every embedding model
+
+    - articles: one row per paper, with an integer key, its arXiv id
+      (arxiv_id) and metadata (authors, entry_url, published,
+      primary_category, categories)
+    - chunks: text of every chunk (abstracts and article chunks), stored
+      once and referenced by the embedding tables of each model. Each chunk
+      is keyed by its paper (article_id), the chunking it comes from
+      (chunk_set, see `ABSTRACT_CHUNK_SET` and `chunk_set_name`) and its
+      position in the paper (chunk_index), so reloading a paper updates its
+      chunks instead of duplicating them. It holds the full-text search
+      column content_tsv.
+
+    Args:
+        conn (psycopg.Connection): Connection to the database
+        text_weight (TextWeight, optional): Weight of the lexemes of the
+            full-text search column. Defaults to TEXT_WEIGHT.
+    """
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {ARTICLES_TABLE} (
+            id serial PRIMARY KEY,
+            arxiv_id text NOT NULL UNIQUE,
+            authors text[],
+            entry_url text,
+            published timestamptz,
+            primary_category text,
+            categories text[]
+        )"""
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {CHUNKS_TABLE} (
+            id bigserial PRIMARY KEY,
+            article_id integer NOT NULL REFERENCES {ARTICLES_TABLE} (id) ON DELETE CASCADE,
+            chunk_set text NOT NULL DEFAULT '',
+            chunk_index integer,
+            content text NOT NULL
+        )"""
+    )
+    # Chunk keys of tables created before chunks had an ordinal. Their rows
+    # keep a NULL chunk_index, which the unique index does not constrain
+    # (see `deduplicate_chunks`)
+    conn.execute(
+        f"""
+        ALTER TABLE {CHUNKS_TABLE}
+            ADD COLUMN IF NOT EXISTS chunk_set text NOT NULL DEFAULT '',
+            ADD COLUMN IF NOT EXISTS chunk_index integer
+        """
+    )
+    conn.execute(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {CHUNKS_TABLE}_article_chunk_idx ON {CHUNKS_TABLE} (article_id, chunk_set, chunk_index)"
+    )
+
+    # Index the metadata used by search filters
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS {ARTICLES_TABLE}_published_idx ON {ARTICLES_TABLE} (published)"
+    )
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS {ARTICLES_TABLE}_primary_category_idx ON {ARTICLES_TABLE} (primary_category)"
+    )
+    if not is_index_deferred(conn=conn, index_name=f"{ARTICLES_TABLE}_categories_idx"):
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {ARTICLES_TABLE}_categories_idx ON {ARTICLES_TABLE} USING GIN (categories)"
+        )
+
+    # Index article keys, used to filter chunks by paper
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS {CHUNKS_TABLE}_article_id_idx ON {CHUNKS_TABLE} (article_id)"
+    )
+
+    # Add full-text search column and its index
+    add_text_search_column(conn=conn, table_name=CHUNKS_TABLE, weight=text_weight)
+
+
 def create_embedding_table(
-    conn: psycopg.Connection, table_name: str, embedding_dimension: int
+    conn: psycopg.Connection,
+    table_name: str,
+    embedding_dimension: int,
+    precision: EmbeddingPrecision = EMBEDDING_PRECISION,
+    text_weight: TextWeight = TEXT_WEIGHT,
+    partition_by_category: bool = False,
+    partition_categories: List[str] = ARXIV_FIELDS,
 ):
     """
-    Create a table for storing both text and vector embeddings
+    Create a table for storing the vector embeddings of a model
 
-    The table contains the following fields:
-    - article_id: string that specified the identified of the paper
-    - content: string that contains the raw text
-    - embedding: vector that contains the embedding of the raw text
+    The articles and chunks tables are created first if they do not exist
+    (see `create_content_tables`). The embedding table contains the
+    following fields:
+    - chunk_id: key of the embedded chunk in the chunks table
+    - primary_category: arXiv primary category of the paper of the chunk,
+      copied from the articles table so that searches filtered by category
+      do not need a join (and can prune partitions)
+    - embedding: vector (or halfvec) that contains the embedding of the raw text
 
     Args:
         conn (psycopg.Connection): Connection to the database
@@ -102,197 +528,2196 @@ def create_embedding_table(
             the name of the embedding model used.
         embedding_dimension (int): Integer specifying the dimension of
             the embedding vectors
+        precision (EmbeddingPrecision, optional): pgvector type of the
+            embedding column; 'halfvec' stores 2-byte floats, halving table
+            and index size. Defaults to EMBEDDING_PRECISION.
+        text_weight (TextWeight, optional): Weight of the lexemes of the
+            full-text search column of the chunks table. Defaults to
+            TEXT_WEIGHT.
+        partition_by_category (bool, optional): Create the table list
+            partitioned by primary_category, with one partition per
+            category in `partition_categories` plus a default one. Vector
+            indexes are then built per partition, and searches filtered by
+            primary category only scan the matching partitions. Only
+            applies when the table does not exist yet. Defaults to False.
+        partition_categories (List[str], optional): Categories with their
+            own partition. Defaults to ARXIV_FIELDS.
     """
+    create_content_tables(conn=conn, text_weight=text_weight)
+
+    table_exists = conn.execute(
+        "SELECT to_regclass(%s) IS NOT NULL", (table_name,)
+    ).fetchone()[0]
+
     # Execute create table statement
-    create_sql = f"""
-    CREATE TABLE IF NOT EXISTS {table_name} (
-        id bigserial PRIMARY KEY,
-        article_id text,
-        content text,
-        embedding vector({embedding_dimension})
-    )"""
-    conn.execute(create_sql)
+    if table_exists:
+        # Tables created before the column existed
+        conn.execute(
+            f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS primary_category text NOT NULL DEFAULT ''"
+        )
+    elif partition_by_category:
+        create_sql = f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            chunk_id bigint NOT NULL REFERENCES {CHUNKS_TABLE} (id) ON DELETE CASCADE,
+            primary_category text NOT NULL DEFAULT '',
+            embedding {precision}({embedding_dimension}),
+            PRIMARY KEY (chunk_id, primary_category)
+        ) PARTITION BY LIST (primary_category)"""
+        conn.execute(create_sql)
+        for category in partition_categories:
+            partition_name = (
+                f"{table_name}_{re.sub(r'[^a-z0-9]', '_', category.lower())}"
+            )
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {partition_name} PARTITION OF {table_name} FOR VALUES IN ('{category}')"
+            )
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table_name}_other PARTITION OF {table_name} DEFAULT"
+        )
+    else:
+        create_sql = f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            chunk_id bigint PRIMARY KEY REFERENCES {CHUNKS_TABLE} (id) ON DELETE CASCADE,
+            primary_category text NOT NULL DEFAULT '',
+            embedding {precision}({embedding_dimension})
+        )"""
+        conn.execute(create_sql)
+
+    # Register pg_vector vector
+    ensure_vector_registered(conn)
+
+
+def refresh_embedding_categories(conn: psycopg.Connection, table_name: str) -> int:
+    """Copy the primary category of each paper to its rows in an embedding
+    table, for rows embedded before the metadata of the paper was stored
+
+    Args:
+        conn (psycopg.Connection): Connection to the database
+        table_name (str): Name of the embedding table
 
-    # Execute create index statement
-    index_sql = f"""
-    CREATE INDEX ON {table_name} USING GIN (to_tsvector('english', content))
+    Returns:
+        int: Number of rows updated
     """
-    conn.execute(index_sql)
+    with conn.cursor() as curs:
+        curs.execute(
+            f"""
+            UPDATE {table_name} e SET primary_category = a.primary_category
+            FROM {CHUNKS_TABLE} c JOIN {ARTICLES_TABLE} a ON a.id = c.article_id
+            WHERE c.id = e.chunk_id
+                AND a.primary_category IS NOT NULL
+                AND e.primary_category IS DISTINCT FROM a.primary_category
+            """
+        )
+        return curs.rowcount
 
-    # Register pg_vector vector
-    register_vector(conn)
 
+def metadata_filter_sql(
+    filters: Optional[SearchFilters], alias: str = "e"
+) -> Tuple[str, List[str], dict]:
+    """SQL to restrict an embedding table to papers matching some filters
 
-def create_user_feedback_table(
-    conn: psycopg.Connection, table_name: str = "user_feedback"
-):
+    Args:
+        filters (Optional[SearchFilters]): Publication date range, primary
+            categories (any of) and categories (overlap with any of the
+            paper categories). Missing or None values do not filter.
+        alias (str, optional): Alias of the embedding table in the query.
+            Defaults to "e".
 
-    # Execute create table statement
-    create_sql = f"""
-    CREATE TABLE IF NOT EXISTS {table_name} (
-        feedback_id SERIAL PRIMARY KEY,            -- Unique identifier for each feedback entry
-        unique_user_id VARCHAR(255) NOT NULL,      -- Unique identifier for the user
-        user_question TEXT NOT NULL,               -- The question asked by the user
-        answer TEXT NOT NULL,                      -- The answer generated by the system
-        thumbs SMALLINT,                           -- User rating: -1 for thumbs down, 1 for thumbs up, or NULL if not provided
-        documents_retrieved TEXT,                  -- A list of document identifiers or titles retrieved for the query
-        similarity FLOAT,                          -- Similarity score between the query and retrieved documents
-        relevance TEXT,                            -- User's feedback on the relevance of the answer
-        llm_model VARCHAR(255),                    -- Name of the LLM model used to generate the answer
-        embedding_model VARCHAR(255),              -- Name of the embedding model used for document retrieval
-        elapsed_time INTERVAL,                     -- Time elapsed between user query and LLM response
-        feedback_timestamp TIMESTAMP DEFAULT NOW() -- Timestamp when the feedback was submitted
-    )"""
-    conn.execute(create_sql)
+    Returns:
+        Tuple[str, List[str], dict]: JOIN clause with the articles table
+            (empty if only the primary category is filtered), conditions to
+            combine with AND, and their named parameters
+    """
+    filters = filters or SearchFilters()
+    conditions = []
+    params: Dict[str, Any] = {}
+    primary_categories = filters.get("primary_categories")
+    if primary_categories:
+        conditions.append(f"{alias}.primary_category = ANY(%(primary_categories)s)")
+        params["primary_categories"] = list(primary_categories)
 
+    article_conditions = []
+    if filters.get("published_after") is not None:
+        article_conditions.append("fa_meta.published >= %(published_after)s")
+        params["published_after"] = filters["published_after"]
+    if filters.get("published_before") is not None:
+        article_conditions.append("fa_meta.published < %(published_before)s")
+        params["published_before"] = filters["published_before"]
+    categories = filters.get("categories")
+    if categories:
+        article_conditions.append("fa_meta.categories && %(categories)s::text[]")
+        params["categories"] = list(categories)
 
-def insert_embedding_data(
-    conn: psycopg.Connection, table_name: str, paper_embedding: List[PaperEmbedding]
+    join_sql = ""
+    if article_conditions:
+        join_sql = f"""
+            JOIN {CHUNKS_TABLE} fc_meta ON fc_meta.id = {alias}.chunk_id
+            JOIN {ARTICLES_TABLE} fa_meta ON fa_meta.id = fc_meta.article_id
+        """
+    return join_sql, conditions + article_conditions, params
+
+
+def add_text_search_column(
+    conn: psycopg.Connection,
+    table_name: str = CHUNKS_TABLE,
+    weight: TextWeight = TEXT_WEIGHT,
 ):
-    """Insert paper embeddings into a PostgreSQL table
+    """Add a stored generated tsvector column with a GIN index to a table
+
+    Postgres keeps the column up to date on every insert or update, so
+    keyword searches neither parse the content of each row at query time
+    nor compute to_tsvector twice (to filter and to rank). Adding the
+    column to an existing table rewrites it once; afterwards this is a
+    no-op.
 
     Args:
         conn (psycopg.Connection): Connection to the database
-        table_name (str): Table name where data will be inserted.
-        paper_embedding (List[PaperEmbedding]): List of paper embeddings
-            that will be stored in the database
+        table_name (str, optional): Name of the table with a content
+            column. Defaults to CHUNKS_TABLE.
+        weight (TextWeight, optional): Weight label of the lexemes ('A' is
+            the highest), used by ts_rank_cd when results from tables with
+            different weights are compared. Defaults to TEXT_WEIGHT.
     """
-    register_vector(conn)
+    conn.execute(
+        f"""
+        ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {TEXT_SEARCH_COLUMN} tsvector
+        GENERATED ALWAYS AS (setweight(to_tsvector('english', coalesce(content, '')), '{weight}')) STORED
+        """
+    )
+    index_name = f"{table_name}_{TEXT_SEARCH_COLUMN}_idx"
+    if not is_index_deferred(conn=conn, index_name=index_name):
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} USING GIN ({TEXT_SEARCH_COLUMN})"
+        )
 
-    # Insert values sequentially
-    with conn.cursor() as curs:
-        for row in paper_embedding:
-            curs.execute(
-                f"INSERT INTO {table_name} (article_id, content, embedding) VALUES (%s, %s, %s)",
-                (row["id"], row["content"], row["embeddings"]),
-            )
 
+def vector_operator_class(
+    similarity_metric: SimilarityMetric | Literal["<~>"],
+    precision: EmbeddingPrecision | Literal["bit"] = EMBEDDING_PRECISION,
+) -> str:
+    """pgvector index operator class for a distance operator and column type
 
-def insert_user_feedback(
-    conn: psycopg.Connection, feedback: UserFeedback, table_name: str = "user_feedback"
-):
+    Args:
+        similarity_metric (SimilarityMetric | Literal["<~>"]): Distance
+            operator used in ORDER BY ('<~>' is the Hamming distance)
+        precision (EmbeddingPrecision | Literal["bit"], optional): pgvector
+            type of the embedding column. Defaults to EMBEDDING_PRECISION.
+
+    Returns:
+        str: Operator class, e.g. 'vector_ip_ops', 'halfvec_cosine_ops' or
+            'bit_hamming_ops'
     """
-    Insert a new record into the user_feedback table.
+    return f"{precision}_{OPERATOR_CLASS_SUFFIX[similarity_metric]}"
 
-    Parameters:
-        conn (psycopg.Connection): Connection object to the PostgreSQL database.
-        feedback (UserFeedback): Instance of UserFeedback containing feedback data.
-        table_name (str): The name of the table where the feedback will be inserted (default is 'user_feedback').
+
+def create_vector_index(
+    conn: psycopg.Connection,
+    table_name: str,
+    similarity_metric: SimilarityMetric | Literal["<~>"],
+    precision: EmbeddingPrecision | Literal["bit"] = EMBEDDING_PRECISION,
+    column: str = "embedding",
+    index_params: Optional[VectorIndexParams] = None,
+    replace: bool = False,
+):
+    """Create an approximate nearest neighbour index on an embedding column
+
+    HNSW indexes can be created on an empty table. IVFFlat computes its
+    lists from the rows present when it is built, so it should be created
+    (or rebuilt with `replace=True`) once the table has been loaded.
+    Indexes dropped by `defer_indexes` are left to
+    `rebuild_deferred_indexes`, so a load in between does not build them.
+
+    Args:
+        conn (psycopg.Connection): Connection to the database
+        table_name (str): Name of the embedding table
+        similarity_metric (SimilarityMetric): Distance operator that
+            queries will use
+        precision (EmbeddingPrecision, optional): pgvector type of the
+            embedding column. Defaults to EMBEDDING_PRECISION.
+        column (str, optional): Name of the indexed column.
+            Defaults to "embedding".
+        index_params (Optional[VectorIndexParams], optional): Index method
+            and build parameters (m and ef_construction for 'hnsw', lists
+            for 'ivfflat'). If None, an HNSW index with HNSW_M and
+            HNSW_EF_CONSTRUCTION is created. Defaults to None.
+        replace (bool, optional): Drop the existing index of the column
+            before creating it. Defaults to False.
+
+    Raises:
+        ValueError: The selected index method has not been implemented yet
     """
+    if index_params is None:
+        index_params = VectorIndexParams(method=INDEX_METHOD)
 
-    insert_sql = f"""
-    INSERT INTO {table_name} (
-        unique_user_id, user_question, answer, thumbs, documents_retrieved, similarity, relevance,
-        llm_model, embedding_model, elapsed_time, feedback_timestamp
-    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    method = index_params["method"]
+    if method == "hnsw":
+        storage_parameters = (
+            f"m = {index_params.get('m', HNSW_M)}, "
+            f"ef_construction = {index_params.get('ef_construction', HNSW_EF_CONSTRUCTION)}"
+        )
+    elif method == "ivfflat":
+        storage_parameters = f"lists = {index_params.get('lists', IVFFLAT_LISTS)}"
+    else:
+        raise ValueError(f"IndexMethod {method} not implemented")
+
+    operator_class = vector_operator_class(
+        similarity_metric=similarity_metric, precision=precision
+    )
+    index_name = f"{table_name}_{column}_idx"
+    if is_index_deferred(conn=conn, index_name=index_name):
+        print(f"{index_name} is deferred, build it with `maintain_database.py rebuild`")
+        return
+    if replace:
+        conn.execute(f"DROP INDEX IF EXISTS {index_name}")
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} USING {method} ({column} {operator_class}) WITH ({storage_parameters})"
+    )
+
+
+def vector_search_settings(
+    semantic_search_params: SemanticSearch, filtered: bool = False
+) -> dict:
+    """pgvector settings applied to a single semantic search
+
+    Args:
+        semantic_search_params (SemanticSearch): Search parameters, with
+            optional ef_search (HNSW), probes (IVFFlat) and iterative_scan
+        filtered (bool, optional): Whether the search has a WHERE clause,
+            in which case iterative index scans are enabled (ITERATIVE_SCAN
+            unless the search sets iterative_scan). Defaults to False.
+
+    Returns:
+        dict: Setting names and values, to be applied with SET LOCAL
     """
+    settings: Dict[str, int | str] = {}
+    ef_search = semantic_search_params.get("ef_search")
+    if ef_search is not None:
+        settings["hnsw.ef_search"] = ef_search
+    probes = semantic_search_params.get("probes")
+    if probes is not None:
+        settings["ivfflat.probes"] = probes
 
-    # Use feedback data to populate SQL parameters
-    with conn.cursor() as cursor:
-        cursor.execute(
-            insert_sql,
-            (
-                feedback["user_id"],
-                feedback["question"],
-                feedback["answer"],
-                feedback["thumbs"],
-                feedback["documents_retrieved"],
-                feedback["similarity"],
-                feedback["relevance"],
-                feedback["llm_model"],
-                feedback["embedding_model"],
-                feedback["elapsed_time"],
-                feedback["feedback_timestamp"]
-                or datetime.datetime.now(),  # Use current time if not provided
-            ),
+    iterative_scan = semantic_search_params.get(
+        "iterative_scan", ITERATIVE_SCAN if filtered else None
+    )
+    if iterative_scan is not None:
+        settings["hnsw.iterative_scan"] = iterative_scan
+        # IVFFlat only supports relaxed ordering
+        settings["ivfflat.iterative_scan"] = (
+            "off" if iterative_scan == "off" else "relaxed_order"
         )
-        conn.commit()  # Commit the transaction to save the changes
+    return settings
 
 
-def get_article_id_data(conn: psycopg.Connection, table_name: str) -> List[str]:
-    """Get article ids already present in the database
+def add_binary_embedding_column(
+    conn: psycopg.Connection,
+    table_name: str,
+    index_params: Optional[VectorIndexParams] = None,
+):
+    """Add the sign-binarized embeddings of a table and their Hamming index
+
+    The column is generated from the embedding column with pgvector's
+    binary_quantize (1 for positive components), so rows inserted later
+    get it too. Searches with binary_quantization=True use it as a first
+    stage and re-rank its candidates on the full embeddings. Existing rows
+    are rewritten, so this takes a while on large tables.
 
     Args:
         conn (psycopg.Connection): Connection to the database
-        table_name (str): Table name where data will be inserted.
-        paper_embedding (List[PaperEmbedding]): List of paper embeddings
-            that will be stored in the database
+        table_name (str): Name of the embedding table
+        index_params (Optional[VectorIndexParams], optional): Method and
+            build parameters of the index (see `create_vector_index`).
+            Defaults to None.
+    """
+    # The type modifier of vector and halfvec columns is their dimension
+    embedding_dimension = conn.execute(
+        """
+        SELECT atttypmod FROM pg_attribute
+        WHERE attrelid = to_regclass(%s) AND attname = 'embedding'
+        """,
+        (table_name,),
+    ).fetchone()[0]
+    conn.execute(
+        f"""
+        ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {BINARY_EMBEDDING_COLUMN}
+        bit({embedding_dimension})
+        GENERATED ALWAYS AS (binary_quantize(embedding)::bit({embedding_dimension})) STORED
+        """
+    )
+    create_vector_index(
+        conn=conn,
+        table_name=table_name,
+        similarity_metric="<~>",
+        precision="bit",
+        column=BINARY_EMBEDDING_COLUMN,
+        index_params=index_params,
+    )
+
+
+def get_embedding_data(
+    conn: psycopg.Connection, table_name: str, max_rows: Optional[int] = None
+) -> np.ndarray:
+    """Get the embeddings stored in a table
+
+    Args:
+        conn (psycopg.Connection): Connection to the database
+        table_name (str): Name of the embedding table
+        max_rows (Optional[int], optional): If given, return a random
+            sample of at most `max_rows` embeddings. Defaults to None.
 
     Returns:
-        List[str]: List of strings containing the different
-            document ids
+        np.ndarray: float32 matrix with one embedding per row
     """
+    ensure_vector_registered(conn)
+    sample_query = f" ORDER BY random() LIMIT {int(max_rows)}" if max_rows else ""
     with conn.cursor() as curs:
-        query = f"SELECT DISTINCT article_id FROM {table_name}"
-        curs.execute(query)
+        curs.execute(f"SELECT embedding::vector FROM {table_name}{sample_query}")
         data = curs.fetchall()
+    return np.array([row[0] for row in data], dtype=np.float32)
 
-        # Format as list of strings
-        document_ids = [docs[0] for docs in data]
-        return document_ids
 
+def add_reduced_embedding_column(
+    conn: psycopg.Connection, table_name: str, projection: Projection
+) -> str:
+    """Add the column that stores the reduced embeddings of a projection
 
-def semantic_search_postgres(
+    Args:
+        conn (psycopg.Connection): Connection to the database
+        table_name (str): Name of the embedding table
+        projection (Projection): Projection fitted for `table_name`
+
+    Returns:
+        str: Name of the reduced embedding column
+    """
+    column = reduced_column_name(projection)
+    conn.execute(
+        f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {column} vector({projection['output_dimension']})"
+    )
+    return column
+
+
+def backfill_reduced_embeddings(
     conn: psycopg.Connection,
-    semantic_search_params: SemanticSearch,
-    filter_id: Optional[List[str]] = None,
-):
-    # Cosine distance: <#>
-    # negative inner product: <=>
-    # L2 distance: <->
-    # L1 distance: <+>
-    embedding_model = semantic_search_params["embedding_model"]
-    if isinstance(embedding_model, str):
-        from sentence_transformers import SentenceTransformer
-
-        try:
-            embedding_model = SentenceTransformer(embedding_model)
-        except Exception as e:
-            print(e)
-            raise ValueError(f"Unable to load embedding model {embedding_model}")
-    query = semantic_search_params["query"]
-    table_name = semantic_search_params["table"]
-    max_documents = semantic_search_params["max_documents"]
-    similarity_metric = semantic_search_params["similarity_metric"]
+    table_name: str,
+    projection: Projection,
+    batch_size: int = 1000,
+) -> int:
+    """Project the embeddings that do not have a reduced embedding yet
+
+    Args:
+        conn (psycopg.Connection): Connection to the database
+        table_name (str): Name of the embedding table
+        projection (Projection): Projection fitted for `table_name`
+        batch_size (int, optional): Rows projected per round trip.
+            Defaults to 1000.
 
-    query_embedding = embedding_model.encode(query)
+    Returns:
+        int: Number of rows updated
+    """
+    ensure_vector_registered(conn)
+    column = add_reduced_embedding_column(
+        conn=conn, table_name=table_name, projection=projection
+    )
+    rows_updated = 0
+    while True:
+        with conn.cursor() as curs:
+            curs.execute(
+                f"SELECT chunk_id, embedding::vector FROM {table_name} WHERE {column} IS NULL LIMIT {batch_size}"
+            )
+            data = curs.fetchall()
+            if not data:
+                break
+            reduced = apply_projection(
+                projection, np.array([row[1] for row in data], dtype=np.float32)
+            )
+            curs.executemany(
+                f"UPDATE {table_name} SET {column} = %s WHERE chunk_id = %s",
+                [(reduced[i], row[0]) for i, row in enumerate(data)],
+            )
+        rows_updated += len(data)
+    return rows_updated
 
-    register_vector(conn)
 
-    filter_id_query = ""
-    if filter_id:
-        fields = ", ".join([f"'{w}'" for w in filter_id])
-        filter_id_query = f" WHERE article_id IN ({fields})"
+def backfill_saved_projections(
+    conn: psycopg.Connection,
+    table_name: str,
+    similarity_metric: SimilarityMetric = "<#>",
+) -> Dict[int, int]:
+    """Project the rows of a table on every projection saved for it
 
-    with conn.cursor() as cur:
-        cur.execute(
-            f"SELECT article_id, content, embedding FROM {table_name} {filter_id_query} ORDER BY embedding {similarity_metric} %s LIMIT {max_documents}",
-            (query_embedding,),
+    Searches may use any configured reduction_version, so after a load
+    every reduced column is backfilled (see `backfill_reduced_embeddings`)
+    and gets its vector index if it has none, e.g. when the table has just
+    been created.
+
+    Args:
+        conn (psycopg.Connection): Connection to the database
+        table_name (str): Name of the embedding table
+        similarity_metric (SimilarityMetric, optional): Distance operator of
+            the reduced searches. Defaults to "<#>".
+
+    Returns:
+        Dict[int, int]: Number of rows updated for each projection version
+    """
+    rows_updated = {}
+    for version in list_projection_versions(table=table_name):
+        projection = load_projection(table=table_name, version=version)
+        if projection is None:
+            continue
+        rows_updated[version] = backfill_reduced_embeddings(
+            conn=conn, table_name=table_name, projection=projection
         )
-        return cur.fetchall(), query_embedding
+        create_vector_index(
+            conn=conn,
+            table_name=table_name,
+            similarity_metric=similarity_metric,
+            precision="vector",
+            column=reduced_column_name(projection),
+        )
+    return rows_updated
 
 
-def keyword_search_postgres(conn: psycopg.Connection, text_search_params: TextSearch):
-    """Not very useful keyword search (same weight to each word)"""
+def get_table_indexes(
+    conn: psycopg.Connection,
+    table_name: str,
+    methods: Tuple[str, ...] = BULK_LOAD_INDEX_METHODS,
+) -> List[Tuple[str, str, str]]:
+    """Indexes of a table built with some access methods
 
-    query = text_search_params["query"]
-    table_name = text_search_params["table"]
-    max_documents = text_search_params["max_documents"]
+    Args:
+        conn (psycopg.Connection): Connection to the database
+        table_name (str): Name of the table
+        methods (Tuple[str, ...], optional): Index access methods.
+            Defaults to BULK_LOAD_INDEX_METHODS.
+
+    Returns:
+        List[Tuple[str, str, str]]: Name, access method and definition
+            (CREATE INDEX statement) of each index
+    """
+    return conn.execute(
+        """
+        SELECT i.relname, am.amname, pg_get_indexdef(i.oid)
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        JOIN pg_am am ON am.oid = i.relam
+        WHERE x.indrelid = to_regclass(%s) AND am.amname = ANY(%s)
+        ORDER BY i.relname
+        """,
+        (table_name, list(methods)),
+    ).fetchall()
 
-    # Sanitize query: remove invalid characters and sanitize the input for to_tsquery
-    query = re.sub(r"[^a-zA-Z0-9\s]", "", query)
-    # query = re.sub(r'\s+', ' & ', query)  # Replace spaces with `&` for AND
 
-    query_use = query.replace(" ", " | ")
+def get_index_size(conn: psycopg.Connection, index_name: str) -> int:
+    """Size in bytes of an index, including the partitions of a
+    partitioned index"""
+    return conn.execute(
+        "SELECT coalesce(sum(pg_relation_size(relid)), 0) FROM pg_partition_tree(to_regclass(%s))",
+        (index_name,),
+    ).fetchone()[0]
 
-    # Remove the trailing operator (and other redundant ones)
-    query_use = re.sub(r"\|\s*$", "", query_use)  # Remove trailing `|`
-    query_use = query_use.replace(" |  | ", " | ")
-    # query_use = re.sub(r'\s*\|\s*', ' | ', query_use)  # Ensure correct spacing around `|`
 
-    with conn.cursor() as cur:
-        cur.execute(
-            f"SELECT article_id, content, embedding FROM {table_name}, to_tsquery('english', %s) query WHERE to_tsvector('english', content) @@ query ORDER BY ts_rank_cd(to_tsvector('english', content), query) DESC LIMIT {max_documents}",
-            (query_use,),
-        )
-        return cur.fetchall()
+def set_maintenance_settings(
+    conn: psycopg.Connection,
+    maintenance_work_mem: str = MAINTENANCE_WORK_MEM,
+    parallel_workers: int = MAINTENANCE_WORKERS,
+):
+    """Memory and parallel workers of the index builds of a session
+
+    HNSW builds are much faster while the graph fits in
+    maintenance_work_mem, and both HNSW (pgvector>=0.6) and btree/GIN
+    builds can use parallel maintenance workers (up to
+    max_parallel_workers and max_worker_processes).
+
+    Args:
+        conn (psycopg.Connection): Connection to the database
+        maintenance_work_mem (str, optional): Memory of each build, e.g.
+            '2GB'. Defaults to MAINTENANCE_WORK_MEM.
+        parallel_workers (int, optional): Workers helping each build.
+            Defaults to MAINTENANCE_WORKERS.
+    """
+    conn.execute(
+        "SELECT set_config('maintenance_work_mem', %s, false)",
+        (maintenance_work_mem,),
+    )
+    conn.execute(
+        "SELECT set_config('max_parallel_maintenance_workers', %s, false)",
+        (str(parallel_workers),),
+    )
+
+
+def defer_indexes(
+    conn: psycopg.Connection,
+    table_name: str,
+    methods: Tuple[str, ...] = BULK_LOAD_INDEX_METHODS,
+) -> List[str]:
+    """Drop the vector and GIN indexes of a table before a bulk load
+
+    Their definitions are saved in DEFERRED_INDEXES_TABLE, so that
+    `rebuild_deferred_indexes` builds them again once the rows are loaded,
+    in one pass instead of updating them row by row.
+
+    Args:
+        conn (psycopg.Connection): Connection to the database
+        table_name (str): Name of the table
+        methods (Tuple[str, ...], optional): Access methods of the indexes
+            dropped. Defaults to BULK_LOAD_INDEX_METHODS.
+
+    Returns:
+        List[str]: Names of the indexes dropped
+    """
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {DEFERRED_INDEXES_TABLE} (
+            index_name text PRIMARY KEY,
+            table_name text NOT NULL,
+            definition text NOT NULL,
+            deferred_at timestamptz NOT NULL DEFAULT now()
+        )"""
+    )
+    indexes = get_table_indexes(conn=conn, table_name=table_name, methods=methods)
+    with conn.transaction():
+        for index_name, _, definition in indexes:
+            conn.execute(
+                f"""
+                INSERT INTO {DEFERRED_INDEXES_TABLE} (index_name, table_name, definition)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (index_name) DO UPDATE
+                SET table_name = EXCLUDED.table_name, definition = EXCLUDED.definition
+                """,
+                (index_name, table_name, definition),
+            )
+            conn.execute(f"DROP INDEX {index_name}")
+    return [index_name for index_name, _, _ in indexes]
+
+
+def is_index_deferred(conn: psycopg.Connection, index_name: str) -> bool:
+    """Whether an index has been dropped by `defer_indexes` and not rebuilt
+    yet, in which case schema updates leave it to `rebuild_deferred_indexes`
+    instead of building it during the load"""
+    if (
+        conn.execute("SELECT to_regclass(%s)", (DEFERRED_INDEXES_TABLE,)).fetchone()[0]
+        is None
+    ):
+        return False
+    return (
+        conn.execute(
+            f"SELECT 1 FROM {DEFERRED_INDEXES_TABLE} WHERE index_name = %s",
+            (index_name,),
+        ).fetchone()
+        is not None
+    )
+
+
+def rebuild_deferred_indexes(
+    conn: psycopg.Connection, table_name: Optional[str] = None
+) -> List[IndexReport]:
+    """Build the indexes dropped by `defer_indexes`
+
+    Indexes are built one at a time, with the maintenance settings of the
+    session (see `set_maintenance_settings`). Each one is removed from
+    DEFERRED_INDEXES_TABLE once built, so an interrupted rebuild can be
+    resumed. Indexes of partitioned tables are built on every partition.
+    Indexes created meanwhile are left as they are and reported as
+    already existing.
+
+    Args:
+        conn (psycopg.Connection): Connection to the database
+        table_name (Optional[str], optional): Only rebuild the indexes of
+            this table. Defaults to None.
+
+    Returns:
+        List[IndexReport]: Build time and size of each index
+    """
+    if (
+        conn.execute("SELECT to_regclass(%s)", (DEFERRED_INDEXES_TABLE,)).fetchone()[0]
+        is None
+    ):
+        return []
+
+    deferred = conn.execute(
+        f"""
+        SELECT index_name, table_name, definition FROM {DEFERRED_INDEXES_TABLE}
+        WHERE %(table_name)s::text IS NULL OR table_name = %(table_name)s
+        ORDER BY table_name, index_name
+        """,
+        {"table_name": table_name},
+    ).fetchall()
+
+    index_reports = []
+    for index_name, index_table, definition in deferred:
+        already_built = (
+            conn.execute("SELECT to_regclass(%s)", (index_name,)).fetchone()[0]
+            is not None
+        )
+        ini_time = time.perf_counter()
+        if not already_built:
+            # pg_get_indexdef defines partitioned indexes ON ONLY the parent
+            # table, which would build them invalid and without partitions
+            conn.execute(re.sub(r" ON ONLY ", " ON ", definition, count=1))
+        elapsed_time = time.perf_counter() - ini_time
+        conn.execute(
+            f"DELETE FROM {DEFERRED_INDEXES_TABLE} WHERE index_name = %s",
+            (index_name,),
+        )
+        if already_built:
+            print(f"{index_name} already exists, not rebuilt")
+            continue
+
+        match_method = re.search(r" USING (\w+) ", definition)
+        method = match_method.group(1) if match_method else ""
+        index_reports.append(
+            IndexReport(
+                table=index_table,
+                index=index_name,
+                method=method,
+                seconds=elapsed_time,
+                size_mb=get_index_size(conn=conn, index_name=index_name) / 2**20,
+            )
+        )
+    return index_reports
+
+
+def reindex_concurrently(
+    conn: psycopg.Connection,
+    table_name: str,
+    methods: Tuple[str, ...] = BULK_LOAD_INDEX_METHODS,
+) -> List[IndexReport]:
+    """Rebuild the indexes of a table without blocking reads or writes
+
+    REINDEX CONCURRENTLY builds a new copy of each index next to the old
+    one and swaps them, so searches keep using the old index meanwhile.
+    It takes longer than a plain rebuild and needs room for both copies.
+
+    Args:
+        conn (psycopg.Connection): Connection to the database, in
+            autocommit mode
+        table_name (str): Name of the table
+        methods (Tuple[str, ...], optional): Access methods of the indexes
+            rebuilt. Defaults to BULK_LOAD_INDEX_METHODS.
+
+    Raises:
+        ValueError: The connection is not in autocommit mode
+
+    Returns:
+        List[IndexReport]: Build time and size of each index
+    """
+    if not conn.autocommit:
+        raise ValueError("REINDEX CONCURRENTLY requires an autocommit connection")
+
+    index_reports = []
+    for index_name, method, _ in get_table_indexes(
+        conn=conn, table_name=table_name, methods=methods
+    ):
+        ini_time = time.perf_counter()
+        conn.execute(f"REINDEX INDEX CONCURRENTLY {index_name}")
+        elapsed_time = time.perf_counter() - ini_time
+        index_reports.append(
+            IndexReport(
+                table=table_name,
+                index=index_name,
+                method=method,
+                seconds=elapsed_time,
+                size_mb=get_index_size(conn=conn, index_name=index_name) / 2**20,
+            )
+        )
+    return index_reports
+
+
+def create_user_feedback_table(
+    conn: psycopg.Connection, table_name: str = "user_feedback"
+):
+
+    # Execute create table statement
+    create_sql = f"""
+    CREATE TABLE IF NOT EXISTS {table_name} (
+        feedback_id SERIAL PRIMARY KEY,            -- Unique identifier for each feedback entry
+        unique_user_id VARCHAR(255) NOT NULL,      -- Unique identifier for the user
+        user_question TEXT NOT NULL,               -- The question asked by the user
+        answer TEXT NOT NULL,                      -- The answer generated by the system
+        thumbs SMALLINT,                           -- User rating: -1 for thumbs down, 1 for thumbs up, or NULL if not provided
+        documents_retrieved TEXT,                  -- A list of document identifiers or titles retrieved for the query
+        similarity FLOAT,                          -- Similarity score between the query and retrieved documents
+        relevance TEXT,                            -- User's feedback on the relevance of the answer
+        llm_model VARCHAR(255),                    -- Name of the LLM model used to generate the answer
+        embedding_model VARCHAR(255),              -- Name of the embedding model used for document retrieval
+        elapsed_time INTERVAL,                     -- Time elapsed between user query and LLM response
+        feedback_timestamp TIMESTAMP DEFAULT NOW() -- Timestamp when the feedback was submitted
+    )"""
+    conn.execute(create_sql)
+
+
+def insert_article_metadata(
+    conn: psycopg.Connection, papers: List[PaperID]
+) -> Dict[str, int]:
+    """Insert (or update) the metadata of papers in the articles table
+
+    Args:
+        conn (psycopg.Connection): Connection to the database
+        papers (List[PaperID]): Metadata of the papers, as returned by
+            `retrieve_arxiv_metadata`
+
+    Returns:
+        Dict[str, int]: Key in the articles table of each arXiv id
+    """
+    with conn.cursor() as curs:
+        curs.executemany(
+            f"""
+            INSERT INTO {ARTICLES_TABLE} (arxiv_id, authors, entry_url, published, primary_category, categories)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (arxiv_id) DO UPDATE SET
+                authors = EXCLUDED.authors,
+                entry_url = EXCLUDED.entry_url,
+                published = EXCLUDED.published,
+                primary_category = EXCLUDED.primary_category,
+                categories = EXCLUDED.categories
+            """,
+            [
+                (
+                    paper["id"],
+                    paper["authors"],
+                    paper["entry_url"],
+                    paper["published"],
+                    paper["primary_category"],
+                    paper["categories"],
+                )
+                for paper in papers
+            ],
+        )
+    return get_article_keys(conn=conn, arxiv_ids=[paper["id"] for paper in papers])
+
+
+def get_article_keys(conn: psycopg.Connection, arxiv_ids: List[str]) -> Dict[str, int]:
+    """Key in the articles table of each arXiv id
+
+    Papers that are not in the articles table yet are added without
+    metadata (see `insert_article_metadata`).
+
+    Args:
+        conn (psycopg.Connection): Connection to the database
+        arxiv_ids (List[str]): arXiv ids of the papers
+
+    Returns:
+        Dict[str, int]: Key in the articles table of each arXiv id
+    """
+    unique_ids = list(dict.fromkeys(arxiv_ids))
+    with conn.cursor() as curs:
+        curs.execute(
+            f"INSERT INTO {ARTICLES_TABLE} (arxiv_id) SELECT unnest(%s::text[]) ON CONFLICT (arxiv_id) DO NOTHING",
+            (unique_ids,),
+        )
+        curs.execute(
+            f"SELECT arxiv_id, id FROM {ARTICLES_TABLE} WHERE arxiv_id = ANY(%s)",
+            (unique_ids,),
+        )
+        return dict(curs.fetchall())
+
+
+def get_chunk_ids(
+    conn: psycopg.Connection,
+    paper_chunks: List[Tuple[str, int, str]],
+    chunk_set: str,
+) -> List[int]:
+    """Key in the chunks table of each (arXiv id, chunk index, content) tuple
+
+    Chunks are upserted on (article_id, chunk_set, chunk_index): a chunk
+    already stored for the same paper and position is reused, and its text
+    is updated if it changed; the rest are inserted. Loading the same paper
+    twice, for instance after a retry, does not duplicate its chunks.
+
+    Args:
+        conn (psycopg.Connection): Connection to the database
+        paper_chunks (List[Tuple[str, int, str]]): arXiv id, position in the
+            paper and text of each chunk
+        chunk_set (str): Chunking the chunks come from (see
+            `ABSTRACT_CHUNK_SET` and `chunk_set_name`)
+
+    Returns:
+        List[int]: Chunk key of each element of `paper_chunks`
+    """
+    article_keys = get_article_keys(
+        conn=conn, arxiv_ids=[arxiv_id for arxiv_id, _, _ in paper_chunks]
+    )
+    # ON CONFLICT can not update the same row twice in one statement, so
+    # the last text of each key wins
+    keyed_chunks = {
+        (article_keys[arxiv_id], chunk_index): content
+        for arxiv_id, chunk_index, content in paper_chunks
+    }
+
+    with conn.cursor() as curs:
+        # Unchanged chunks are not rewritten, which keeps the full-text
+        # index and the table free of dead rows on reloads
+        curs.execute(
+            f"""
+            INSERT INTO {CHUNKS_TABLE} (article_id, chunk_set, chunk_index, content)
+            SELECT article_id, %(chunk_set)s, chunk_index, content
+            FROM unnest(%(article_ids)s::integer[], %(chunk_indexes)s::integer[], %(contents)s::text[])
+                AS t (article_id, chunk_index, content)
+            ON CONFLICT (article_id, chunk_set, chunk_index) DO UPDATE
+                SET content = EXCLUDED.content
+                WHERE {CHUNKS_TABLE}.content IS DISTINCT FROM EXCLUDED.content
+            """,
+            {
+                "chunk_set": chunk_set,
+                "article_ids": [key[0] for key in keyed_chunks],
+                "chunk_indexes": [key[1] for key in keyed_chunks],
+                "contents": list(keyed_chunks.values()),
+            },
+        )
+        curs.execute(
+            f"""
+            SELECT article_id, chunk_index, id FROM {CHUNKS_TABLE}
+            WHERE chunk_set = %s AND article_id = ANY(%s) AND chunk_index IS NOT NULL
+            """,
+            (chunk_set, list(set(article_keys.values()))),
+        )
+        chunk_ids = {(row[0], row[1]): row[2] for row in curs.fetchall()}
+    return [
+        chunk_ids[(article_keys[arxiv_id], chunk_index)]
+        for arxiv_id, chunk_index, _ in paper_chunks
+    ]
+
+
+def chunk_indexes(paper_embedding: List[PaperEmbedding]) -> List[int]:
+    """Position of each chunk in its paper
+
+    The `chunk_index` of the row if set, otherwise the order of the row among
+    the rows of the same paper in `paper_embedding`.
+    """
+    counts: Dict[str, int] = {}
+    indexes = []
+    for row in paper_embedding:
+        position = counts.get(row["id"], 0)
+        counts[row["id"]] = position + 1
+        indexes.append(row.get("chunk_index", position))
+    return indexes
+
+
+def get_reduced_columns(conn: psycopg.Connection, table_name: str) -> List[str]:
+    """Reduced embedding columns of a table (see `reduced_column_name`)"""
+    rows = conn.execute(
+        """
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = to_regclass(%s) AND attnum > 0 AND NOT attisdropped
+            AND attname ~ '^embedding_reduced_v[0-9]+$'
+        ORDER BY attname
+        """,
+        (table_name,),
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def embedding_upsert_sql(table_name: str, reduced_columns: List[str] = []) -> str:
+    """ON CONFLICT clause of the writes of chunk embeddings
+
+    The embedding of an already stored chunk is replaced, and the row is
+    only rewritten when its embedding or category changed. A replaced
+    embedding resets the `reduced_columns` of the row to NULL, so that
+    `backfill_reduced_embeddings` projects the new embedding (the binary
+    column is generated, so Postgres recomputes it).
+    """
+    reset_reduced = "".join(
+        f""",
+                {column} = CASE
+                    WHEN {table_name}.embedding IS DISTINCT FROM EXCLUDED.embedding
+                    THEN NULL ELSE {table_name}.{column} END"""
+        for column in reduced_columns
+    )
+    return f"""
+        ON CONFLICT ON CONSTRAINT {table_name}_pkey DO UPDATE
+            SET embedding = EXCLUDED.embedding,
+                primary_category = EXCLUDED.primary_category{reset_reduced}
+            WHERE ({table_name}.embedding, {table_name}.primary_category)
+                IS DISTINCT FROM (EXCLUDED.embedding, EXCLUDED.primary_category)
+        """
+
+
+def insert_embedding_data(
+    conn: psycopg.Connection,
+    table_name: str,
+    paper_embedding: List[PaperEmbedding],
+    precision: EmbeddingPrecision = EMBEDDING_PRECISION,
+    method: InsertMethod = INSERT_METHOD,
+    batch_size: int = INSERT_BATCH_SIZE,
+    chunk_set: Optional[str] = None,
+) -> int:
+    """Upsert paper embeddings into a PostgreSQL table
+
+    The text of each chunk is stored once in the chunks table, keyed by
+    paper, `chunk_set` and position (see `get_chunk_ids`), and the embedding
+    table references it. Rows are upserted, so the load is idempotent:
+    running it again with the same papers updates the stored rows instead of
+    failing or duplicating them. Reduced embeddings of replaced vectors are
+    reset, to be projected again by `backfill_reduced_embeddings`. Chunks
+    that appear twice in `paper_embedding` are written once. The primary
+    category of each paper is copied from the articles table, so paper
+    metadata should be inserted first (see `insert_article_metadata` and
+    `refresh_embedding_categories`). Stored rows of a chunk with another
+    category are deleted before the write: the key of tables partitioned
+    by category includes it, so the upsert alone would keep both rows.
+
+    Large writes are streamed with a binary COPY into a staging table and
+    merged from there, small ones are sent with batched executemany.
+
+    Args:
+        conn (psycopg.Connection): Connection to the database
+        table_name (str): Table name where data will be inserted.
+        paper_embedding (List[PaperEmbedding]): List of paper embeddings
+            that will be stored in the database. Rows without chunk_index
+            are numbered in order within their paper.
+        precision (EmbeddingPrecision, optional): pgvector type of the
+            embedding column. Defaults to EMBEDDING_PRECISION.
+        method (InsertMethod, optional): 'copy', 'executemany' or 'auto',
+            which uses COPY only for at least COPY_MIN_ROWS rows. Defaults
+            to INSERT_METHOD.
+        batch_size (int, optional): Rows sent per executemany call.
+            Defaults to INSERT_BATCH_SIZE.
+        chunk_set (Optional[str], optional): Chunking the chunks come from.
+            Defaults to `table_name`.
+
+    Raises:
+        ValueError: The selected insert method has not been implemented yet
+
+    Returns:
+        int: Number of rows inserted or updated
+    """
+    if not paper_embedding:
+        return 0
+
+    chunk_ids = get_chunk_ids(
+        conn=conn,
+        paper_chunks=[
+            (row["id"], chunk_index, row["content"])
+            for row, chunk_index in zip(paper_embedding, chunk_indexes(paper_embedding))
+        ],
+        chunk_set=chunk_set or table_name,
+    )
+    with conn.cursor() as curs:
+        curs.execute(
+            f"""
+            SELECT c.id, coalesce(a.primary_category, '')
+            FROM {CHUNKS_TABLE} c JOIN {ARTICLES_TABLE} a ON a.id = c.article_id
+            WHERE c.id = ANY(%s)
+            """,
+            (list(set(chunk_ids)),),
+        )
+        chunk_categories = dict(curs.fetchall())
+
+    # ON CONFLICT can not update the same row twice in one statement, so
+    # the last embedding of each chunk wins
+    chunk_embeddings = list(
+        {
+            chunk_id: (
+                chunk_id,
+                chunk_categories[chunk_id],
+                as_float32(row["embeddings"]),
+            )
+            for chunk_id, row in zip(chunk_ids, paper_embedding)
+        }.values()
+    )
+
+    if method == "auto":
+        method = "copy" if len(chunk_embeddings) >= COPY_MIN_ROWS else "executemany"
+
+    if method == "copy":
+        return copy_embedding_data(
+            conn=conn,
+            table_name=table_name,
+            chunk_embeddings=chunk_embeddings,
+            precision=precision,
+        )
+    elif method == "executemany":
+        ensure_vector_registered(conn)
+        upsert_sql = embedding_upsert_sql(
+            table_name, reduced_columns=get_reduced_columns(conn, table_name)
+        )
+        rows = 0
+        with conn.transaction(), conn.cursor() as curs:
+            curs.execute(
+                f"""
+                DELETE FROM {table_name} e
+                USING unnest(%s::bigint[], %s::text[]) AS t (chunk_id, primary_category)
+                WHERE e.chunk_id = t.chunk_id AND e.primary_category <> t.primary_category
+                """,
+                (
+                    [row[0] for row in chunk_embeddings],
+                    [row[1] for row in chunk_embeddings],
+                ),
+            )
+            for start in range(0, len(chunk_embeddings), batch_size):
+                curs.executemany(
+                    f"""
+                    INSERT INTO {table_name} (chunk_id, primary_category, embedding)
+                    VALUES (%s, %s, %s::{precision})
+                    {upsert_sql}
+                    """,
+                    chunk_embeddings[start : start + batch_size],
+                )
+                rows += curs.rowcount
+        return rows
+    else:
+        raise ValueError(f"InsertMethod {method} not implemented")
+
+
+def copy_embedding_data(
+    conn: psycopg.Connection,
+    table_name: str,
+    chunk_embeddings: List[Tuple[int, str, np.ndarray]],
+    precision: EmbeddingPrecision = EMBEDDING_PRECISION,
+) -> int:
+    """Bulk upsert chunk embeddings with COPY ... FROM STDIN (FORMAT BINARY)
+
+    COPY can not resolve conflicts, so rows are copied into a temporary
+    staging table and merged into `table_name` with a single INSERT ... ON
+    CONFLICT, in one transaction that drops the staging table at the end.
+    Vectors are sent with pgvector's binary encoding, so they are neither
+    formatted as text on the client nor parsed on the server.
+
+    Args:
+        conn (psycopg.Connection): Connection to the database
+        table_name (str): Table name where data will be inserted.
+        chunk_embeddings (List[Tuple[int, str, np.ndarray]]): Chunk key,
+            primary category and float32 embedding of each row, without
+            repeated chunk keys
+        precision (EmbeddingPrecision, optional): pgvector type of the
+            embedding column. Defaults to EMBEDDING_PRECISION.
+
+    Returns:
+        int: Number of rows inserted or updated
+    """
+    ensure_vector_registered(conn)
+    upsert_sql = embedding_upsert_sql(
+        table_name, reduced_columns=get_reduced_columns(conn, table_name)
+    )
+
+    staging_table = f"{table_name}_staging"
+    with conn.transaction():
+        with conn.cursor() as curs:
+            curs.execute(
+                f"""
+                CREATE TEMP TABLE {staging_table} (
+                    chunk_id bigint,
+                    primary_category text,
+                    embedding {precision}
+                )
+                """
+            )
+            with curs.copy(
+                f"COPY {staging_table} (chunk_id, primary_category, embedding) FROM STDIN WITH (FORMAT BINARY)"
+            ) as copy:
+                copy.set_types(["int8", "text", precision])
+                for row in chunk_embeddings:
+                    copy.write_row(row)
+            curs.execute(
+                f"""
+                DELETE FROM {table_name} e USING {staging_table} s
+                WHERE e.chunk_id = s.chunk_id AND e.primary_category <> s.primary_category
+                """
+            )
+            curs.execute(
+                f"""
+                INSERT INTO {table_name} (chunk_id, primary_category, embedding)
+                SELECT chunk_id, primary_category, embedding FROM {staging_table}
+                {upsert_sql}
+                """
+            )
+            rows = curs.rowcount
+            curs.execute(f"DROP TABLE {staging_table}")
+    return rows
+
+
+def deduplicate_chunks(conn: psycopg.Connection) -> Dict[str, int]:
+    """Merge the duplicated chunks of tables loaded before chunks were keyed
+
+    Chunks stored without chunk_index are not protected by the unique index
+    on (article_id, chunk_set, chunk_index), so loading a paper twice stored
+    its text twice. Chunks with the same paper and text are merged into one:
+    a keyed chunk if there is any, otherwise the oldest. The embedding rows
+    of the removed chunks are moved to the kept chunk, or deleted when it
+    already has one in the same table. Everything runs in one transaction.
+
+    Args:
+        conn (psycopg.Connection): Connection to the database
+
+    Returns:
+        Dict[str, int]: Rows removed from the chunks table and from each
+            embedding table
+    """
+    with conn.transaction():
+        with conn.cursor() as curs:
+            # Embedding tables referencing the chunks (partitions inherit the
+            # foreign key of their parent table)
+            curs.execute(
+                """
+                SELECT conrelid::regclass::text FROM pg_constraint
+                WHERE contype = 'f' AND confrelid = %s::regclass AND conparentid = 0
+                """,
+                (CHUNKS_TABLE,),
+            )
+            embedding_tables = [row[0] for row in curs.fetchall()]
+
+            curs.execute(
+                f"""
+                CREATE TEMP TABLE chunk_duplicates AS
+                SELECT id, keep_id FROM (
+                    SELECT id, chunk_index, first_value(id) OVER (
+                        PARTITION BY article_id, content
+                        ORDER BY chunk_index IS NULL, id
+                    ) AS keep_id
+                    FROM {CHUNKS_TABLE}
+                ) c
+                WHERE id <> keep_id AND chunk_index IS NULL
+                """
+            )
+            curs.execute("CREATE INDEX ON chunk_duplicates (id)")
+
+            removed = {}
+            for table_name in embedding_tables:
+                # Keep a single embedding per kept chunk: the one already
+                # stored for it, else the one of its first duplicate
+                curs.execute(
+                    f"""
+                    DELETE FROM {table_name} e USING chunk_duplicates d
+                    WHERE e.chunk_id = d.id AND (
+                        EXISTS (SELECT 1 FROM {table_name} k WHERE k.chunk_id = d.keep_id)
+                        OR EXISTS (
+                            SELECT 1 FROM {table_name} o
+                            JOIN chunk_duplicates od ON od.id = o.chunk_id
+                            WHERE od.keep_id = d.keep_id AND od.id < d.id
+                        )
+                    )
+                    """
+                )
+                removed[table_name] = curs.rowcount
+                curs.execute(
+                    f"""
+                    UPDATE {table_name} e SET chunk_id = d.keep_id
+                    FROM chunk_duplicates d WHERE e.chunk_id = d.id
+                    """
+                )
+
+            curs.execute(
+                f"DELETE FROM {CHUNKS_TABLE} c USING chunk_duplicates d WHERE c.id = d.id"
+            )
+            removed[CHUNKS_TABLE] = curs.rowcount
+            curs.execute("DROP TABLE chunk_duplicates")
+    return removed
+
+
+def as_float32(embedding: np.ndarray) -> np.ndarray:
+    """Embedding as a flat float32 array, as expected by pgvector's dumpers"""
+    return np.asarray(embedding, dtype=np.float32).reshape(-1)
+
+
+USER_FEEDBACK_COLUMNS = (
+    "unique_user_id, user_question, answer, thumbs, documents_retrieved, similarity, relevance, "
+    "llm_model, embedding_model, elapsed_time, feedback_timestamp"
+)
+
+
+def user_feedback_row(feedback: UserFeedback) -> tuple:
+    """Values of a feedback record, in the order of USER_FEEDBACK_COLUMNS"""
+    return (
+        feedback["user_id"],
+        feedback["question"],
+        feedback["answer"],
+        feedback["thumbs"],
+        feedback["documents_retrieved"],
+        feedback["similarity"],
+        feedback["relevance"],
+        feedback["llm_model"],
+        feedback["embedding_model"],
+        feedback["elapsed_time"],
+        feedback["feedback_timestamp"]
+        or datetime.datetime.now(),  # Use current time if not provided
+    )
+
+
+def insert_user_feedback(
+    conn: psycopg.Connection | ConnectionPool,
+    feedback: UserFeedback,
+    table_name: str = "user_feedback",
+):
+    """
+    Insert a new record into the user_feedback table.
+
+    Interactive code should submit feedback to a `ragxiv.feedback.FeedbackWriter`
+    instead, which writes it in the background.
+
+    Parameters:
+        conn (psycopg.Connection | ConnectionPool): Connection object to the PostgreSQL database,
+            or a pool to check out a connection from.
+        feedback (UserFeedback): Instance of UserFeedback containing feedback data.
+        table_name (str): The name of the table where the feedback will be inserted (default is 'user_feedback').
+    """
+
+    insert_sql = f"""
+    INSERT INTO {table_name} ({USER_FEEDBACK_COLUMNS})
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """
+
+    # Use feedback data to populate SQL parameters
+    with db_connection(conn) as conn, conn.cursor() as cursor:
+        cursor.execute(insert_sql, user_feedback_row(feedback))
+        conn.commit()  # Commit the transaction to save the changes
+
+
+def copy_user_feedback(
+    conn: psycopg.Connection | ConnectionPool,
+    feedbacks: List[UserFeedback],
+    table_name: str = "user_feedback",
+) -> int:
+    """Insert a batch of feedback records with a single COPY
+
+    The batch is written in one transaction, so either every record is
+    stored or none is.
+
+    Args:
+        conn (psycopg.Connection | ConnectionPool): Connection to the
+            database, or a pool to check out a connection from
+        feedbacks (List[UserFeedback]): Feedback records
+        table_name (str, optional): Feedback table. Defaults to
+            "user_feedback".
+
+    Returns:
+        int: Number of records inserted
+    """
+    if not feedbacks:
+        return 0
+    with db_connection(conn) as conn, conn.transaction(), conn.cursor() as curs:
+        with curs.copy(
+            f"COPY {table_name} ({USER_FEEDBACK_COLUMNS}) FROM STDIN"
+        ) as copy:
+            for feedback in feedbacks:
+                copy.write_row(user_feedback_row(feedback))
+    return len(feedbacks)
+
+
+def get_article_id_data(
+    conn: psycopg.Connection, table_name: Optional[str] = None
+) -> List[str]:
+    """Get article ids already present in the database
+
+    Args:
+        conn (psycopg.Connection): Connection to the database
+        table_name (Optional[str], optional): If given, only papers with
+            chunks embedded in this table are returned. Defaults to None.
+
+    Returns:
+        List[str]: List of strings containing the different
+            document ids
+    """
+    with conn.cursor() as curs:
+        if table_name is None:
+            curs.execute(f"SELECT arxiv_id FROM {ARTICLES_TABLE}")
+        else:
+            curs.execute(
+                f"""
+                SELECT a.arxiv_id FROM {ARTICLES_TABLE} a
+                WHERE EXISTS (
+                    SELECT 1 FROM {CHUNKS_TABLE} c
+                    JOIN {table_name} e ON e.chunk_id = c.id
+                    WHERE c.article_id = a.id
+                )
+                """
+            )
+        data = curs.fetchall()
+
+        # Format as list of strings
+        document_ids = [docs[0] for docs in data]
+        return document_ids
+
+
+def get_article_ids_missing_metadata(conn: psycopg.Connection) -> List[str]:
+    """Get the ids of papers stored without their publication date or
+    primary category, e.g. those copied by scripts/migrate_normalized_schema.py
+
+    Args:
+        conn (psycopg.Connection): Connection to the database
+
+    Returns:
+        List[str]: arXiv ids of the papers
+    """
+    with conn.cursor() as curs:
+        curs.execute(
+            f"""
+            SELECT arxiv_id FROM {ARTICLES_TABLE}
+            WHERE published IS NULL OR primary_category IS NULL
+            """
+        )
+        return [row[0] for row in curs.fetchall()]
+
+
+def search_projection(semantic_search_params: SemanticSearch) -> Optional[Projection]:
+    """Projection of the reduced column searched first, if any
+
+    Raises:
+        ValueError: The reduction_version has no saved projection
+    """
+    if semantic_search_params.get("reduction_version") is None:
+        return None
+    table_name = semantic_search_params["table"]
+    projection = load_projection(
+        table=table_name, version=semantic_search_params["reduction_version"]
+    )
+    if projection is None:
+        raise ValueError(
+            f"Projection v{semantic_search_params['reduction_version']} not found for {table_name}"
+        )
+    return projection
+
+
+def first_stage_search(
+    semantic_search_params: SemanticSearch,
+    projection: Optional[Projection],
+    query_sql: str,
+    query_reduced_sql: str,
+) -> Optional[Tuple[str, int]]:
+    """Ordering and oversampling of the candidate search of a two-stage
+    semantic search, or None if the full embeddings are searched directly
+
+    Candidates come from the reduced column (reduction_version) or the
+    binary column (binary_quantization), and are re-ranked on the full
+    embeddings.
+
+    Args:
+        semantic_search_params (SemanticSearch): Search parameters
+        projection (Optional[Projection]): Projection of the reduced column
+        query_sql (str): SQL of the query vector
+        query_reduced_sql (str): SQL of the reduced query vector
+
+    Raises:
+        ValueError: Both a reduction and binary quantization are requested
+    """
+    similarity_metric = semantic_search_params["similarity_metric"]
+    precision = semantic_search_params.get("embedding_precision", EMBEDDING_PRECISION)
+    binary_quantization = semantic_search_params.get("binary_quantization", False)
+    if projection is not None and binary_quantization:
+        raise ValueError(
+            "reduction_version and binary_quantization can not be combined"
+        )
+
+    if projection is not None:
+        order_sql = f"{reduced_column_name(projection)} {similarity_metric} {query_reduced_sql}::vector"
+        oversampling = semantic_search_params.get(
+            "reduction_oversampling", REDUCTION_OVERSAMPLING
+        )
+    elif binary_quantization:
+        order_sql = (
+            f"{BINARY_EMBEDDING_COLUMN} <~> binary_quantize({query_sql}::{precision})"
+        )
+        oversampling = semantic_search_params.get(
+            "binary_oversampling", BINARY_OVERSAMPLING
+        )
+    else:
+        return None
+    return order_sql, oversampling
+
+
+def semantic_search_query(
+    semantic_search_params: SemanticSearch,
+    query_embedding: np.ndarray,
+    filter_id: Optional[List[str]] = None,
+) -> Tuple[str, dict, dict]:
+    """SQL statement of a semantic search, shared by the sync and async APIs
+
+    Args:
+        semantic_search_params (SemanticSearch): Search parameters
+        query_embedding (np.ndarray): Embedding of the query
+        filter_id (Optional[List[str]], optional): Only search the chunks
+            of these arXiv ids, keeping at most max_chunks_per_article
+            chunks of each if it is set. Defaults to None.
+
+    Raises:
+        ValueError: The reduction_version has no saved projection, or it
+            is combined with binary_quantization
+
+    Returns:
+        Tuple[str, dict, dict]: Statement, its named parameters and the
+            pgvector settings to apply for the search
+    """
+    # Cosine distance: <#>
+    # negative inner product: <=>
+    # L2 distance: <->
+    # L1 distance: <+>
+    table_name = semantic_search_params["table"]
+    max_documents = semantic_search_params["max_documents"]
+    similarity_metric = semantic_search_params["similarity_metric"]
+    precision = semantic_search_params.get("embedding_precision", EMBEDDING_PRECISION)
+    projection = search_projection(semantic_search_params)
+    first_stage = first_stage_search(
+        semantic_search_params=semantic_search_params,
+        projection=projection,
+        query_sql="%(query)s",
+        query_reduced_sql="%(query_reduced)s",
+    )
+
+    # Metadata filters are applied while scanning the embedding table, with
+    # iterative index scans so that selective filters still return
+    # max_documents rows
+    filter_join, filter_conditions, filter_params = metadata_filter_sql(
+        semantic_search_params.get("filters")
+    )
+    filter_where = " AND ".join(filter_conditions)
+    settings = vector_search_settings(
+        semantic_search_params=semantic_search_params,
+        filtered=bool(filter_conditions),
+    )
+
+    # Only the chunk id, article id, content and distance are fetched unless
+    # the vectors are requested
+    include_embedding = semantic_search_params.get("include_embedding", False)
+    distance_sql = f"embedding {similarity_metric} %(query)s::{precision}"
+    nearest_columns = "chunk_id, embedding" if include_embedding else "chunk_id"
+    result_columns = "c.id, a.arxiv_id, c.content"
+    if include_embedding:
+        result_columns += ", nearest.embedding"
+
+    # The nearest chunk ids are found on the embedding table alone, then
+    # joined with their text and paper
+    result_sql = f"""
+        SELECT {result_columns}, nearest.distance FROM nearest
+        JOIN {CHUNKS_TABLE} c ON c.id = nearest.chunk_id
+        JOIN {ARTICLES_TABLE} a ON a.id = c.article_id
+        ORDER BY nearest.distance
+    """
+
+    if filter_id:
+        # Exact search on the chunks of a few articles: index lookups on
+        # arxiv_id and article_id plus a small sort, instead of an ANN
+        # scan that discards most of the rows it visits
+        max_chunks_per_article = semantic_search_params.get("max_chunks_per_article")
+        if max_chunks_per_article:
+            # Same cap as the LATERAL join of the hierarchical search
+            nearest_sql = f"""
+                SELECT {nearest_columns}, distance FROM (
+                    SELECT {nearest_columns}, {distance_sql} AS distance,
+                        row_number() OVER (
+                            PARTITION BY article_id ORDER BY {distance_sql}
+                        ) AS article_rank
+                    FROM filtered
+                ) ranked
+                WHERE article_rank <= {max_chunks_per_article}
+                ORDER BY distance LIMIT {max_documents}
+            """
+        else:
+            nearest_sql = f"""
+                SELECT {nearest_columns}, {distance_sql} AS distance FROM filtered
+                ORDER BY distance LIMIT {max_documents}
+            """
+        sql = f"""
+            WITH filtered AS MATERIALIZED (
+                SELECT e.chunk_id, e.embedding, fc.article_id
+                FROM {ARTICLES_TABLE} fa
+                JOIN {CHUNKS_TABLE} fc ON fc.article_id = fa.id
+                JOIN {table_name} e ON e.chunk_id = fc.id
+                {filter_join}
+                WHERE fa.arxiv_id = ANY(%(filter_id)s)
+                    {"AND " + filter_where if filter_where else ""}
+            ),
+            nearest AS ({nearest_sql})
+            {result_sql}
+        """
+        params = {"query": query_embedding, "filter_id": list(filter_id)}
+    elif first_stage is None:
+        sql = f"""
+            WITH nearest AS (
+                SELECT {nearest_columns}, {distance_sql} AS distance
+                FROM {table_name} e
+                {filter_join}
+                {"WHERE " + filter_where if filter_where else ""}
+                ORDER BY {distance_sql} LIMIT {max_documents}
+            )
+            {result_sql}
+        """
+        params = {"query": query_embedding}
+    else:
+        # Oversampled candidates on the reduced or binary column, re-ranked
+        # on the full-precision embeddings
+        order_sql, oversampling = first_stage
+        sql = f"""
+            WITH nearest AS (
+                SELECT {nearest_columns}, {distance_sql} AS distance FROM (
+                    SELECT chunk_id, embedding FROM {table_name} e
+                    {filter_join}
+                    {"WHERE " + filter_where if filter_where else ""}
+                    ORDER BY {order_sql}
+                    LIMIT {max_documents * oversampling}
+                ) candidates
+                ORDER BY distance LIMIT {max_documents}
+            )
+            {result_sql}
+        """
+        params = {"query": query_embedding}
+        if projection is not None:
+            params["query_reduced"] = apply_projection(projection, query_embedding)
+    return sql, {**params, **filter_params}, settings
+
+
+def semantic_search_postgres(
+    conn: psycopg.Connection,
+    semantic_search_params: SemanticSearch,
+    filter_id: Optional[List[str]] = None,
+) -> Tuple[List[SearchResult], np.ndarray]:
+    query_embedding = encode_query(
+        query=semantic_search_params["query"],
+        embedding_model=semantic_search_params["embedding_model"],
+        backend=semantic_search_params.get("embedding_backend", EMBEDDING_BACKEND),
+    )
+    sql, params, settings = semantic_search_query(
+        semantic_search_params=semantic_search_params,
+        query_embedding=query_embedding,
+        filter_id=filter_id,
+    )
+
+    ensure_vector_registered(conn)
+
+    # Settings only last for the transaction of this search
+    transaction = conn.transaction() if settings else contextlib.nullcontext()
+
+    # Statements only depend on the table and search parameters, so they
+    # are prepared once per connection and their plans reused
+    with transaction, conn.cursor() as cur:
+        for name, value in settings.items():
+            cur.execute("SELECT set_config(%s, %s, true)", (name, str(value)))
+        cur.execute(sql, params, prepare=True)
+        rows = cur.fetchall()
+
+    similarity_metric = semantic_search_params["similarity_metric"]
+    include_embedding = semantic_search_params.get("include_embedding", False)
+    search_results = [
+        search_result_from_row(
+            row,
+            include_embedding=include_embedding,
+            similarity_metric=similarity_metric,
+        )
+        for row in rows
+    ]
+    return search_results, query_embedding
+
+
+async def semantic_search_postgres_async(
+    conn: psycopg.AsyncConnection | AsyncConnectionPool,
+    semantic_search_params: SemanticSearch,
+    filter_id: Optional[List[str]] = None,
+) -> Tuple[List[SearchResult], np.ndarray]:
+    """Async version of `semantic_search_postgres`
+
+    The query is encoded in the default executor, so the event loop keeps
+    serving other tasks meanwhile. Given a pool, the search checks out its
+    own connection, so several searches can run concurrently with
+    asyncio.gather.
+    """
+    query_embedding = await encode_query_async(
+        query=semantic_search_params["query"],
+        embedding_model=semantic_search_params["embedding_model"],
+        backend=semantic_search_params.get("embedding_backend", EMBEDDING_BACKEND),
+    )
+    sql, params, settings = semantic_search_query(
+        semantic_search_params=semantic_search_params,
+        query_embedding=query_embedding,
+        filter_id=filter_id,
+    )
+
+    async with async_db_connection(conn) as conn:
+        await ensure_vector_registered_async(conn)
+        transaction = conn.transaction() if settings else contextlib.nullcontext()
+        async with transaction, conn.cursor() as cur:
+            for name, value in settings.items():
+                await cur.execute("SELECT set_config(%s, %s, true)", (name, str(value)))
+            await cur.execute(sql, params, prepare=True)
+            rows = await cur.fetchall()
+
+    similarity_metric = semantic_search_params["similarity_metric"]
+    include_embedding = semantic_search_params.get("include_embedding", False)
+    search_results = [
+        search_result_from_row(
+            row,
+            include_embedding=include_embedding,
+            similarity_metric=similarity_metric,
+        )
+        for row in rows
+    ]
+    return search_results, query_embedding
+
+
+def semantic_search_batch_query(
+    semantic_search_params: SemanticSearch, query_embeddings: np.ndarray
+) -> Tuple[str, dict, dict]:
+    """SQL statement searching the top-k chunks of many queries at once
+
+    The query vectors are passed as one array and unnested WITH ORDINALITY;
+    a LATERAL subquery runs the index scan of each of them. Rows are
+    returned with the position of their query (starting at 1).
+
+    Args:
+        semantic_search_params (SemanticSearch): Search parameters, its
+            query is ignored
+        query_embeddings (np.ndarray): Query embeddings, one row per query
+
+    Returns:
+        Tuple[str, dict, dict]: Statement, its named parameters and the
+            pgvector settings to apply for the search
+    """
+    table_name = semantic_search_params["table"]
+    max_documents = semantic_search_params["max_documents"]
+    similarity_metric = semantic_search_params["similarity_metric"]
+    precision = semantic_search_params.get("embedding_precision", EMBEDDING_PRECISION)
+    projection = search_projection(semantic_search_params)
+    first_stage = first_stage_search(
+        semantic_search_params=semantic_search_params,
+        projection=projection,
+        query_sql="queries.query",
+        query_reduced_sql="queries.query_reduced",
+    )
+
+    filter_join, filter_conditions, filter_params = metadata_filter_sql(
+        semantic_search_params.get("filters")
+    )
+    filter_where = (
+        "WHERE " + " AND ".join(filter_conditions) if filter_conditions else ""
+    )
+    settings = vector_search_settings(
+        semantic_search_params=semantic_search_params,
+        filtered=bool(filter_conditions),
+    )
+
+    include_embedding = semantic_search_params.get("include_embedding", False)
+    distance_sql = f"embedding {similarity_metric} queries.query::{precision}"
+    nearest_columns = "chunk_id, embedding" if include_embedding else "chunk_id"
+    result_columns = "queries.ord, c.id, a.arxiv_id, c.content"
+    if include_embedding:
+        result_columns += ", nearest.embedding"
+
+    params = {"queries": [as_float32(embedding) for embedding in query_embeddings]}
+    queries_sql = (
+        "unnest(%(queries)s::vector[]) WITH ORDINALITY AS queries (query, ord)"
+    )
+    if projection is not None:
+        queries_sql = (
+            "unnest(%(queries)s::vector[], %(queries_reduced)s::vector[]) "
+            "WITH ORDINALITY AS queries (query, query_reduced, ord)"
+        )
+        params["queries_reduced"] = [
+            as_float32(apply_projection(projection, embedding))
+            for embedding in query_embeddings
+        ]
+
+    if first_stage is None:
+        nearest_sql = f"""
+            SELECT {nearest_columns}, {distance_sql} AS distance
+            FROM {table_name} e
+            {filter_join}
+            {filter_where}
+            ORDER BY {distance_sql} LIMIT {max_documents}
+        """
+    else:
+        # Oversampled candidates on the reduced or binary column, re-ranked
+        # on the full-precision embeddings
+        order_sql, oversampling = first_stage
+        nearest_sql = f"""
+            SELECT {nearest_columns}, {distance_sql} AS distance FROM (
+                SELECT chunk_id, embedding FROM {table_name} e
+                {filter_join}
+                {filter_where}
+                ORDER BY {order_sql}
+                LIMIT {max_documents * oversampling}
+            ) candidates
+            ORDER BY distance LIMIT {max_documents}
+        """
+
+    sql = f"""
+        SELECT {result_columns}, nearest.distance
+        FROM {queries_sql}
+        CROSS JOIN LATERAL ({nearest_sql}) nearest
+        JOIN {CHUNKS_TABLE} c ON c.id = nearest.chunk_id
+        JOIN {ARTICLES_TABLE} a ON a.id = c.article_id
+        ORDER BY queries.ord, nearest.distance
+    """
+    return sql, {**params, **filter_params}, settings
+
+
+def semantic_search_postgres_batch(
+    conn: psycopg.Connection,
+    queries: List[str],
+    semantic_search_params: SemanticSearch,
+    batch_size: int = SEARCH_BATCH_SIZE,
+    encode_batch_size: int = EMBEDDING_BATCH_SIZE,
+) -> Tuple[List[List[SearchResult]], np.ndarray]:
+    """Semantic search of many queries, for offline jobs
+
+    Queries are encoded with batched forward passes (see `encode_queries`),
+    and the top-k chunks of `batch_size` queries are found by a single
+    statement (see `semantic_search_batch_query`), instead of one encode
+    and one round trip per query.
+
+    Args:
+        conn (psycopg.Connection): Connection to the database
+        queries (List[str]): Questions to search
+        semantic_search_params (SemanticSearch): Search parameters shared
+            by every query, its query is ignored
+        batch_size (int, optional): Queries searched per statement.
+            Defaults to SEARCH_BATCH_SIZE.
+        encode_batch_size (int, optional): Queries encoded per forward
+            pass. Defaults to EMBEDDING_BATCH_SIZE.
+
+    Returns:
+        Tuple[List[List[SearchResult]], np.ndarray]: Results of each query,
+            in the order of `queries`, and the query embeddings
+    """
+    if not queries:
+        return [], np.empty((0, 0), dtype=np.float32)
+
+    query_embeddings = encode_queries(
+        queries=queries,
+        embedding_model=semantic_search_params["embedding_model"],
+        backend=semantic_search_params.get("embedding_backend", EMBEDDING_BACKEND),
+        batch_size=encode_batch_size,
+    )
+
+    ensure_vector_registered(conn)
+
+    similarity_metric = semantic_search_params["similarity_metric"]
+    include_embedding = semantic_search_params.get("include_embedding", False)
+    search_results: List[List[SearchResult]] = [[] for _ in queries]
+    for start in range(0, len(queries), batch_size):
+        sql, params, settings = semantic_search_batch_query(
+            semantic_search_params=semantic_search_params,
+            query_embeddings=query_embeddings[start : start + batch_size],
+        )
+        transaction = conn.transaction() if settings else contextlib.nullcontext()
+        with transaction, conn.cursor() as cur:
+            for name, value in settings.items():
+                cur.execute("SELECT set_config(%s, %s, true)", (name, str(value)))
+            cur.execute(sql, params, prepare=True)
+            rows = cur.fetchall()
+
+        for row in rows:
+            search_results[start + row[0] - 1].append(
+                search_result_from_row(
+                    row[1:],
+                    include_embedding=include_embedding,
+                    similarity_metric=similarity_metric,
+                )
+            )
+    return search_results, query_embeddings
+
+
+def distance_to_score(distance: float, similarity_metric: SimilarityMetric) -> float:
+    """Convert a pgvector distance to a score where higher is more similar
+
+    <#> returns the negative inner product and <=> the cosine distance, so
+    their scores are the inner product and the cosine similarity. L2 and L1
+    distances are negated.
+    """
+    if similarity_metric == "<=>":
+        return 1 - distance
+    return -distance
+
+
+def search_result_from_row(
+    row: tuple,
+    include_embedding: bool,
+    similarity_metric: Optional[SimilarityMetric] = None,
+) -> SearchResult:
+    """Build a search result from an (id, article_id, content[, embedding],
+    score) row. The embedding column is only present if the search set
+    `include_embedding`. If `similarity_metric` is given, the last column
+    is a distance and is converted with `distance_to_score`.
+    """
+    score = float(row[-1])
+    if similarity_metric is not None:
+        score = distance_to_score(score, similarity_metric=similarity_metric)
+    search_result = SearchResult(
+        article_id=row[1], chunk_id=row[0], content=row[2], score=score
+    )
+    if include_embedding:
+        search_result["embedding"] = row[3]
+    return search_result
+
+
+def hierarchical_include_embedding(
+    abstract_search_params: SemanticSearch, article_search_params: SemanticSearch
+) -> bool:
+    """Whether the rows of a hierarchical search have an embedding column,
+    which is the case if either search sets include_embedding"""
+    return abstract_search_params.get(
+        "include_embedding", False
+    ) or article_search_params.get("include_embedding", False)
+
+
+def hierarchical_search_query(
+    abstract_search_params: SemanticSearch,
+    article_search_params: SemanticSearch,
+    query_embedding_abstract: np.ndarray,
+    query_embedding_article: np.ndarray,
+) -> Tuple[str, dict, dict]:
+    """SQL statement of a hierarchical search, shared by the sync and async
+    APIs (see `hierarchical_search_postgres`)
+
+    Returns:
+        Tuple[str, dict, dict]: Statement, its named parameters and the
+            pgvector settings to apply for the search
+    """
+    precision_abstract = abstract_search_params.get(
+        "embedding_precision", EMBEDDING_PRECISION
+    )
+    precision_article = article_search_params.get(
+        "embedding_precision", EMBEDDING_PRECISION
+    )
+    max_chunks_per_article = article_search_params.get("max_chunks_per_article")
+    limit_per_article = (
+        f"LIMIT {max_chunks_per_article}" if max_chunks_per_article else ""
+    )
+    metric_abstract = abstract_search_params["similarity_metric"]
+    metric_article = article_search_params["similarity_metric"]
+    include_embedding = hierarchical_include_embedding(
+        abstract_search_params=abstract_search_params,
+        article_search_params=article_search_params,
+    )
+    # Both tables may store a different precision, while the branches of the
+    # UNION ALL need the same column type
+    embedding_column = ", e.embedding::vector AS embedding" if include_embedding else ""
+    nearest_embedding_column = ", nearest.embedding" if include_embedding else ""
+    output_columns = "id, arxiv_id, content"
+    if include_embedding:
+        output_columns += ", embedding"
+
+    # Filters restrict the abstracts, and so the articles searched
+    filter_join, filter_conditions, filter_params = metadata_filter_sql(
+        abstract_search_params.get("filters")
+    )
+    filter_where = (
+        "WHERE " + " AND ".join(filter_conditions) if filter_conditions else ""
+    )
+    settings = vector_search_settings(
+        semantic_search_params=abstract_search_params,
+        filtered=bool(filter_conditions),
+    )
+
+    sql = f"""
+        WITH nearest AS (
+            SELECT chunk_id{embedding_column},
+                e.embedding {metric_abstract} %(query_abstract)s::{precision_abstract} AS distance
+            FROM {abstract_search_params["table"]} e
+            {filter_join}
+            {filter_where}
+            ORDER BY e.embedding {metric_abstract} %(query_abstract)s::{precision_abstract}
+            LIMIT {abstract_search_params["max_documents"]}
+        ),
+        abstracts AS MATERIALIZED (
+            SELECT c.id, c.article_id, a.arxiv_id, c.content{nearest_embedding_column}, nearest.distance
+            FROM nearest
+            JOIN {CHUNKS_TABLE} c ON c.id = nearest.chunk_id
+            JOIN {ARTICLES_TABLE} a ON a.id = c.article_id
+        ),
+        article_chunks AS (
+            SELECT chunk.*
+            FROM (SELECT DISTINCT article_id, arxiv_id FROM abstracts) selected
+            CROSS JOIN LATERAL (
+                SELECT c.id, c.article_id, selected.arxiv_id, c.content{embedding_column},
+                    e.embedding {metric_article} %(query_article)s::{precision_article} AS distance
+                FROM {CHUNKS_TABLE} c
+                JOIN {article_search_params["table"]} e ON e.chunk_id = c.id
+                WHERE c.article_id = selected.article_id
+                ORDER BY distance
+                {limit_per_article}
+            ) chunk
+            ORDER BY chunk.distance
+            LIMIT {article_search_params["max_documents"]}
+        )
+        SELECT 'abstract' AS source, {output_columns}, distance FROM abstracts
+        UNION ALL
+        SELECT 'article' AS source, {output_columns}, distance FROM article_chunks
+        ORDER BY source, distance
+    """
+    params = {
+        "query_abstract": query_embedding_abstract,
+        "query_article": query_embedding_article,
+        **filter_params,
+    }
+    return sql, params, settings
+
+
+def hierarchical_results_from_rows(
+    rows: List[tuple],
+    abstract_search_params: SemanticSearch,
+    article_search_params: SemanticSearch,
+) -> Tuple[List[SearchResult], List[SearchResult]]:
+    """Split the rows of a hierarchical search into abstract and chunk results"""
+    include_embedding = hierarchical_include_embedding(
+        abstract_search_params=abstract_search_params,
+        article_search_params=article_search_params,
+    )
+    abstract_results = [
+        search_result_from_row(
+            row[1:],
+            include_embedding=include_embedding,
+            similarity_metric=abstract_search_params["similarity_metric"],
+        )
+        for row in rows
+        if row[0] == "abstract"
+    ]
+    article_results = [
+        search_result_from_row(
+            row[1:],
+            include_embedding=include_embedding,
+            similarity_metric=article_search_params["similarity_metric"],
+        )
+        for row in rows
+        if row[0] == "article"
+    ]
+    return abstract_results, article_results
+
+
+def hierarchical_search_postgres(
+    conn: psycopg.Connection,
+    abstract_search_params: SemanticSearch,
+    article_search_params: SemanticSearch,
+) -> Tuple[List[SearchResult], List[SearchResult], np.ndarray]:
+    """Search abstracts and the best chunks of their articles in one query
+
+    Equivalent to a semantic search on the abstracts followed by a search on
+    the article chunks filtered by the retrieved article ids, but run as a
+    single statement (a LATERAL join per selected article), so retrieval
+    costs one round trip.
+
+    Args:
+        conn (psycopg.Connection): Connection to the database
+        abstract_search_params (SemanticSearch): Search on the abstract
+            table, its max_documents abstracts are returned
+        article_search_params (SemanticSearch): Search on the article table,
+            its max_documents chunks are returned. If max_chunks_per_article
+            is set, at most that many chunks of each article are kept.
+
+    Returns:
+        Tuple[List[SearchResult], List[SearchResult], np.ndarray]: Abstract
+            and chunk results, sorted by score, and the query embedding of
+            the abstract search. Vectors are included, as vector (float32)
+            whatever the precision of each table, if either search sets
+            include_embedding.
+    """
+    query_embedding_abstract = encode_query(
+        query=abstract_search_params["query"],
+        embedding_model=abstract_search_params["embedding_model"],
+        backend=abstract_search_params.get("embedding_backend", EMBEDDING_BACKEND),
+    )
+    query_embedding_article = encode_query(
+        query=article_search_params["query"],
+        embedding_model=article_search_params["embedding_model"],
+        backend=article_search_params.get("embedding_backend", EMBEDDING_BACKEND),
+    )
+    sql, params, settings = hierarchical_search_query(
+        abstract_search_params=abstract_search_params,
+        article_search_params=article_search_params,
+        query_embedding_abstract=query_embedding_abstract,
+        query_embedding_article=query_embedding_article,
+    )
+
+    ensure_vector_registered(conn)
+
+    transaction = conn.transaction() if settings else contextlib.nullcontext()
+    with transaction, conn.cursor() as cur:
+        for name, value in settings.items():
+            cur.execute("SELECT set_config(%s, %s, true)", (name, str(value)))
+        cur.execute(sql, params, prepare=True)
+        rows = cur.fetchall()
+
+    abstract_results, article_results = hierarchical_results_from_rows(
+        rows=rows,
+        abstract_search_params=abstract_search_params,
+        article_search_params=article_search_params,
+    )
+    return abstract_results, article_results, query_embedding_abstract
+
+
+async def hierarchical_search_postgres_async(
+    conn: psycopg.AsyncConnection | AsyncConnectionPool,
+    abstract_search_params: SemanticSearch,
+    article_search_params: SemanticSearch,
+) -> Tuple[List[SearchResult], List[SearchResult], np.ndarray]:
+    """Async version of `hierarchical_search_postgres`
+
+    Both queries are encoded concurrently in the default executor.
+    """
+    query_embedding_abstract, query_embedding_article = await asyncio.gather(
+        encode_query_async(
+            query=abstract_search_params["query"],
+            embedding_model=abstract_search_params["embedding_model"],
+            backend=abstract_search_params.get("embedding_backend", EMBEDDING_BACKEND),
+        ),
+        encode_query_async(
+            query=article_search_params["query"],
+            embedding_model=article_search_params["embedding_model"],
+            backend=article_search_params.get("embedding_backend", EMBEDDING_BACKEND),
+        ),
+    )
+    sql, params, settings = hierarchical_search_query(
+        abstract_search_params=abstract_search_params,
+        article_search_params=article_search_params,
+        query_embedding_abstract=query_embedding_abstract,
+        query_embedding_article=query_embedding_article,
+    )
+
+    async with async_db_connection(conn) as conn:
+        await ensure_vector_registered_async(conn)
+        transaction = conn.transaction() if settings else contextlib.nullcontext()
+        async with transaction, conn.cursor() as cur:
+            for name, value in settings.items():
+                await cur.execute("SELECT set_config(%s, %s, true)", (name, str(value)))
+            await cur.execute(sql, params, prepare=True)
+            rows = await cur.fetchall()
+
+    abstract_results, article_results = hierarchical_results_from_rows(
+        rows=rows,
+        abstract_search_params=abstract_search_params,
+        article_search_params=article_search_params,
+    )
+    return abstract_results, article_results, query_embedding_abstract
+
+
+def split_excluded_terms(query: str) -> Tuple[str, str]:
+    """Split a websearch query into its included and excluded terms
+
+    Following websearch_to_tsquery, a dash at the start of a word or quoted
+    phrase excludes it; dashes inside words (risk-parity) do not.
+
+    Args:
+        query (str): User query
+
+    Returns:
+        Tuple[str, str]: Query without its exclusions, and the excluded
+            words and phrases without their dash
+    """
+    exclusion = re.compile(r'(?:^|(?<=\s))-+("[^"]*"?|[^\s"]+)')
+    excluded = " ".join(match.group(1) for match in exclusion.finditer(query))
+    return exclusion.sub("", query), excluded
+
+
+def has_included_terms(query: str) -> bool:
+    """Whether a websearch query has words or phrases that are not excluded"""
+    included, _ = split_excluded_terms(query)
+    return bool(re.search(r"\w", included))
+
+
+def keyword_search_query(text_search_params: TextSearch) -> Tuple[str, dict]:
+    """SQL statement of a keyword search, shared by the sync and async APIs
+
+    Raises:
+        ValueError: The selected query mode has not been implemented yet
+
+    Returns:
+        Tuple[str, dict]: Statement and its named parameters
+    """
+    table_name = text_search_params["table"]
+    max_documents = text_search_params["max_documents"]
+    query_mode = text_search_params.get("query_mode", TEXT_QUERY_MODE)
+    max_candidates = text_search_params.get(
+        "max_candidates", TEXT_SEARCH_MAX_CANDIDATES
+    )
+
+    query_params = {"query": text_search_params["query"]}
+    if query_mode == "websearch":
+        tsquery_sql = "websearch_to_tsquery('english', %(query)s)"
+    elif query_mode == "any":
+        # OR the included terms only: an exclusion ORed with them would
+        # match almost every chunk. Excluded terms are still ruled out
+        included, excluded = split_excluded_terms(text_search_params["query"])
+        query_params = {"query": included, "excluded": excluded}
+        tsquery_sql = "replace(websearch_to_tsquery('english', %(query)s)::text, ' & ', ' | ')::tsquery"
+        if excluded:
+            tsquery_sql = f"({tsquery_sql}) && !!(replace(websearch_to_tsquery('english', %(excluded)s)::text, ' & ', ' | ')::tsquery)"
+    else:
+        raise ValueError(f"TextQueryMode {query_mode} not implemented")
+
+    include_embedding = text_search_params.get("include_embedding", False)
+    embedding_join = (
+        f"JOIN {table_name} e ON e.chunk_id = candidates.id"
+        if include_embedding
+        else ""
+    )
+    embedding_column = ", e.embedding" if include_embedding else ""
+
+    filter_join, filter_conditions, filter_params = metadata_filter_sql(
+        text_search_params.get("filters"), alias="t"
+    )
+    filter_where = "".join(f" AND {condition}" for condition in filter_conditions)
+
+    # Bounded searches only rank the most recently stored matches (highest
+    # chunk keys), which is faster for common terms but may miss the best
+    # ranked chunks. The order keeps the candidates the same between runs
+    candidates_limit = (
+        f"ORDER BY c.id DESC LIMIT {max_candidates}"
+        if max_candidates is not None
+        else ""
+    )
+
+    # Only chunks embedded in `table_name` (e.g. article chunks and not
+    # abstracts) of papers matching the filters are searched
+    sql = f"""
+        WITH query AS (SELECT {tsquery_sql} AS tsquery),
+        candidates AS (
+            SELECT c.id, c.article_id, c.content, c.{TEXT_SEARCH_COLUMN}
+            FROM {CHUNKS_TABLE} c, query
+            WHERE c.{TEXT_SEARCH_COLUMN} @@ query.tsquery
+                AND EXISTS (
+                    SELECT 1 FROM {table_name} t {filter_join}
+                    WHERE t.chunk_id = c.id{filter_where}
+                )
+            {candidates_limit}
+        )
+        SELECT candidates.id, a.arxiv_id, candidates.content{embedding_column},
+            ts_rank_cd(candidates.{TEXT_SEARCH_COLUMN}, query.tsquery) AS rank
+        FROM candidates
+        JOIN {ARTICLES_TABLE} a ON a.id = candidates.article_id
+        {embedding_join}
+        CROSS JOIN query
+        ORDER BY rank DESC
+        LIMIT {max_documents}
+    """
+    return sql, {**query_params, **filter_params}
+
+
+def keyword_search_postgres(
+    conn: psycopg.Connection, text_search_params: TextSearch
+) -> List[SearchResult]:
+    """Keyword search ranked with ts_rank_cd on the stored tsvector column
+
+    The query is parsed with websearch_to_tsquery, which accepts any user
+    input ("quoted phrases", -exclusions, or). In 'any' mode (default) its
+    terms are combined with OR instead of AND, so that questions match
+    chunks containing some of their words, and excluded terms are ruled
+    out. Queries without included terms (only -exclusions) return no
+    results, since they would match almost every chunk. Only the
+    max_candidates most recently stored matches are ranked
+    (TEXT_SEARCH_MAX_CANDIDATES by default, an approximation, see
+    scripts/benchmark_keyword_search.py); max_candidates=None ranks every
+    match. The score of each result is its ts_rank_cd.
+    """
+    if not has_included_terms(text_search_params["query"]):
+        return []
+    sql, params = keyword_search_query(text_search_params=text_search_params)
+    include_embedding = text_search_params.get("include_embedding", False)
+    with conn.cursor() as cur:
+        cur.execute(sql, params, prepare=True)
+        return [
+            search_result_from_row(row, include_embedding=include_embedding)
+            for row in cur.fetchall()
+        ]
+
+
+async def keyword_search_postgres_async(
+    conn: psycopg.AsyncConnection | AsyncConnectionPool,
+    text_search_params: TextSearch,
+) -> List[SearchResult]:
+    """Async version of `keyword_search_postgres`"""
+    if not has_included_terms(text_search_params["query"]):
+        return []
+    sql, params = keyword_search_query(text_search_params=text_search_params)
+    include_embedding = text_search_params.get("include_embedding", False)
+    async with async_db_connection(conn) as conn, conn.cursor() as cur:
+        await cur.execute(sql, params, prepare=True)
+        return [
+            search_result_from_row(row, include_embedding=include_embedding)
+            for row in await cur.fetchall()
+        ]
@@ -1,11 +1,36 @@
 """Chunk documents and obtain embeddings"""
 
+import os
+import re
+import time
+import asyncio
+import functools
+import threading
+import concurrent.futures
+from collections import OrderedDict, deque
+from functools import lru_cache
 from tqdm.auto import tqdm
-from typing import List, Literal, TypedDict, get_args
+from typing import (
+    List,
+    Literal,
+    NotRequired,
+    Optional,
+    Tuple,
+    TypedDict,
+    get_args,
+)
 import numpy as np
 from langchain.text_splitter import MarkdownTextSplitter
-from sentence_transformers import SentenceTransformer
-from ragxiv.utils import normalize_vector
+from ragxiv.backends import (
+    EMBEDDING_BACKEND,
+    EmbeddingBackend,
+    EncoderModel,
+    OnnxSentenceTransformer,
+    load_model_backend,
+    model_key,
+)
+from ragxiv.cache import ChunkEmbeddingCache, get_query_cache
+from ragxiv.utils import normalize_matrix
 
 
 # Default embedding parameters
@@ -13,8 +38,23 @@ CHUNK_SIZE = 500
 CHUNK_OVERLAP = 50
 CHUNK_METHOD = "MarkdownTextSplitter"
 EMBEDDING_MODEL_NAME = "multi-qa-mpnet-base-dot-v1"
-
-ChunkMethod = Literal["MarkdownTextSplitter"]
+EMBEDDING_BATCH_SIZE = 32
+MAX_LOADED_MODELS = 2
+EMBEDDING_MAX_CHUNKS_IN_FLIGHT = 4096
+
+# Markdown structure used by MarkdownTokenSplitter, from coarse to fine:
+# headings, paragraphs, lines, sentences and words. Headings are split
+# before the separator, the rest after it, so pieces concatenate back to
+# the original text
+MARKDOWN_TOKEN_SEPARATORS = [
+    r"(?=\n#{1,6} )",
+    r"(?<=\n\n)",
+    r"(?<=\n)",
+    r"(?<=[.!?] )",
+    r"(?<= )",
+]
+
+ChunkMethod = Literal["MarkdownTextSplitter", "MarkdownTokenSplitter"]
 SentenceTransformerModels = Literal["multi-qa-mpnet-base-dot-v1",]
 EmbeddingModel = Literal[SentenceTransformerModels]
 
@@ -23,19 +63,240 @@ class ChunkParams(TypedDict):
     method: ChunkMethod
     size: int
     overlap: int
+    tokenizer_model: NotRequired[str]
+
+
+class EncodingStats(TypedDict):
+    chunks: int
+    tokens: int
+    padded_tokens: int
+    padding_overhead: float
+    elapsed_time: float
+    tokens_per_sec: float
 
 
 class Embedding(TypedDict):
-    model: EmbeddingModel
+    model: EncoderModel
     dimension: int
     content: List[str]
     embedding: np.ndarray
+    stats: NotRequired[EncodingStats]
 
 
 class PaperEmbedding(TypedDict):
     id: str
     content: str
     embeddings: np.ndarray
+    chunk_index: NotRequired[int]
+
+
+class EmbeddingModelRegistry:
+    """Process-wide cache of loaded embedding models
+
+    Each model (and inference backend) is loaded once and shared by
+    ingestion and retrieval. When more than `max_models` models are
+    loaded, the least recently used one is evicted. Access is guarded by
+    a lock so the registry can be shared between threads (e.g. Streamlit
+    sessions).
+    """
+
+    def __init__(self, max_models: int = MAX_LOADED_MODELS):
+        self.max_models = max_models
+        self._models: OrderedDict[Tuple[str, str], EncoderModel] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self, model_name: str, backend: EmbeddingBackend = EMBEDDING_BACKEND
+    ) -> EncoderModel:
+        """Return a loaded model, loading it on first use
+
+        Args:
+            model_name (str): Name of the embedding model
+            backend (EmbeddingBackend, optional): Inference backend.
+                Defaults to EMBEDDING_BACKEND.
+
+        Returns:
+            EncoderModel: Loaded embedding model
+        """
+        key = (model_name, backend)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+
+            model = load_model_backend(model_name=model_name, backend=backend)
+            self._models[key] = model
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+            return model
+
+    def clear(self):
+        """Unload every cached model"""
+        with self._lock:
+            self._models.clear()
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        with self._lock:
+            return key in self._models
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._models)
+
+
+MODEL_REGISTRY = EmbeddingModelRegistry()
+
+
+def load_embedding_model(
+    model_name: str, backend: EmbeddingBackend = EMBEDDING_BACKEND
+) -> EncoderModel:
+    """Get an embedding model from the process-wide registry
+
+    Args:
+        model_name (str): Name of the embedding model
+        backend (EmbeddingBackend, optional): Inference backend.
+            Defaults to EMBEDDING_BACKEND.
+
+    Returns:
+        EncoderModel: Loaded embedding model
+    """
+    return MODEL_REGISTRY.get(model_name, backend)
+
+
+def encode_query(
+    query: str,
+    embedding_model: str | EncoderModel,
+    backend: EmbeddingBackend = EMBEDDING_BACKEND,
+) -> np.ndarray:
+    """Encode a user query, using the query embedding cache when possible
+
+    Embeddings are only cached when the model is given by name, since the
+    name is part of the cache key.
+
+    Args:
+        query (str): User question
+        embedding_model (str | EncoderModel): Name of the embedding
+            model or an already loaded model
+        backend (EmbeddingBackend, optional): Inference backend used when
+            the model is given by name. Defaults to EMBEDDING_BACKEND.
+
+    Raises:
+        ValueError: The embedding model could not be loaded
+
+    Returns:
+        np.ndarray: Query embedding
+    """
+    if not isinstance(embedding_model, str):
+        return embedding_model.encode(query)
+
+    query_cache = get_query_cache()
+    cache_key = model_key(model_name=embedding_model, backend=backend)
+    query_embedding = query_cache.get(cache_key, query)
+    if query_embedding is None:
+        try:
+            embedding_transformer = load_embedding_model(embedding_model, backend)
+        except Exception as e:
+            print(e)
+            raise ValueError(f"Unable to load embedding model {embedding_model}")
+        query_embedding = embedding_transformer.encode(query)
+        query_cache.put(cache_key, query, query_embedding)
+    return query_embedding
+
+
+def encode_queries(
+    queries: List[str],
+    embedding_model: str | EncoderModel,
+    backend: EmbeddingBackend = EMBEDDING_BACKEND,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+) -> np.ndarray:
+    """Encode many user queries, batching those not in the query cache
+
+    The model is loaded once and the missing queries are encoded together,
+    `batch_size` per forward pass, instead of one call per query.
+
+    Args:
+        queries (List[str]): User questions
+        embedding_model (str | EncoderModel): Name of the embedding
+            model or an already loaded model
+        backend (EmbeddingBackend, optional): Inference backend used when
+            the model is given by name. Defaults to EMBEDDING_BACKEND.
+        batch_size (int, optional): Queries encoded per forward pass.
+            Defaults to EMBEDDING_BATCH_SIZE.
+
+    Raises:
+        ValueError: The embedding model could not be loaded
+
+    Returns:
+        np.ndarray: Query embeddings, one row per query
+    """
+    if not isinstance(embedding_model, str):
+        return np.asarray(embedding_model.encode(queries, batch_size=batch_size))
+
+    query_cache = get_query_cache()
+    cache_key = model_key(model_name=embedding_model, backend=backend)
+    query_embeddings = [query_cache.get(cache_key, query) for query in queries]
+
+    # Repeated queries are only encoded once
+    missing_queries = list(
+        dict.fromkeys(
+            query
+            for query, embedding in zip(queries, query_embeddings)
+            if embedding is None
+        )
+    )
+    if missing_queries:
+        try:
+            embedding_transformer = load_embedding_model(embedding_model, backend)
+        except Exception as e:
+            print(e)
+            raise ValueError(f"Unable to load embedding model {embedding_model}")
+        missing_embeddings = embedding_transformer.encode(
+            missing_queries, batch_size=batch_size
+        )
+        encoded = {}
+        for query, embedding in zip(missing_queries, missing_embeddings):
+            query_cache.put(cache_key, query, embedding)
+            encoded[query] = embedding
+        query_embeddings = [
+            encoded[query] if embedding is None else embedding
+            for query, embedding in zip(queries, query_embeddings)
+        ]
+    return np.stack(query_embeddings)
+
+
+async def encode_query_async(
+    query: str,
+    embedding_model: str | EncoderModel,
+    backend: EmbeddingBackend = EMBEDDING_BACKEND,
+    executor: Optional[concurrent.futures.Executor] = None,
+) -> np.ndarray:
+    """Encode a user query without blocking the event loop
+
+    `encode_query` runs in `executor` (the loop's default thread pool if
+    None), so other tasks keep running while the model computes.
+
+    Args:
+        query (str): User question
+        embedding_model (str | EncoderModel): Name of the embedding
+            model or an already loaded model
+        backend (EmbeddingBackend, optional): Inference backend used when
+            the model is given by name. Defaults to EMBEDDING_BACKEND.
+        executor (Optional[concurrent.futures.Executor], optional):
+            Executor running the encoding. Defaults to None.
+
+    Returns:
+        np.ndarray: Query embedding
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor,
+        functools.partial(
+            encode_query,
+            query=query,
+            embedding_model=embedding_model,
+            backend=backend,
+        ),
+    )
 
 
 def chunk_document(document: str, chunk_params: ChunkParams) -> List[str]:
@@ -56,11 +317,25 @@ def chunk_document(document: str, chunk_params: ChunkParams) -> List[str]:
     """
     if chunk_params["method"] == "MarkdownTextSplitter":
         chunks = chunk_markdown_recursive(document=document, chunk_params=chunk_params)
+    elif chunk_params["method"] == "MarkdownTokenSplitter":
+        chunks = chunk_markdown_tokens(document=document, chunk_params=chunk_params)
     else:
         raise ValueError(f"ChunkMethod {chunk_params['method']} not implemented")
     return chunks
 
 
+def chunk_set_name(chunk_params: ChunkParams) -> str:
+    """Name of the chunks produced by a chunking, e.g. MarkdownTextSplitter_500_50
+
+    Chunks of the same paper and chunking are keyed by their position, so
+    chunkings with different parameters must have different names.
+    """
+    name = f"{chunk_params['method']}_{chunk_params['size']}_{chunk_params['overlap']}"
+    if chunk_params.get("tokenizer_model"):
+        name += f"_{chunk_params['tokenizer_model']}"
+    return name
+
+
 def chunk_markdown_recursive(document: str, chunk_params: ChunkParams) -> List[str]:
     """Recursive Character Text Splitter using Markdown separators
 
@@ -75,8 +350,8 @@ def chunk_markdown_recursive(document: str, chunk_params: ChunkParams) -> List[s
     chunk_size = chunk_params["size"]
     chunk_overlap = chunk_params["overlap"]
 
-    # Initialize splitter
-    splitter = MarkdownTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    # Get splitter
+    splitter = get_markdown_splitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
 
     chunks = splitter.create_documents([document])
 
@@ -86,13 +361,134 @@ def chunk_markdown_recursive(document: str, chunk_params: ChunkParams) -> List[s
     return chunks
 
 
-def document_embedding(chunks: List[str], embedding_model: EmbeddingModel) -> Embedding:
+@lru_cache(maxsize=8)
+def get_markdown_splitter(chunk_size: int, chunk_overlap: int) -> MarkdownTextSplitter:
+    """Shared MarkdownTextSplitter for a given chunk size and overlap"""
+    return MarkdownTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def chunk_markdown_tokens(document: str, chunk_params: ChunkParams) -> List[str]:
+    """Markdown-aware splitter that measures chunk size in model tokens
+
+    The document is recursively split on MARKDOWN_TOKEN_SEPARATORS until
+    every piece fits in `size` tokens, counting tokens for all pieces of
+    a level in a single batch call to the fast tokenizer. Pieces are then
+    merged back into chunks of at most `size` tokens, overlapping by up to
+    `overlap` tokens. `size` is capped so that chunks are never truncated
+    by the model's max_seq_length.
+
+    Args:
+        document (str): Markdown text of a document
+        chunk_params (ChunkParams): Specification of the chunking
+            method that will be used. `size` and `overlap` are given in
+            tokens of `tokenizer_model` (defaults to EMBEDDING_MODEL_NAME)
+    Returns:
+        List[str]: List of strings containing the different
+            document chunks
+    """
+    model = load_embedding_model(
+        chunk_params.get("tokenizer_model", EMBEDDING_MODEL_NAME)
+    )
+    tokenizer = model.tokenizer
+    chunk_size = min(
+        chunk_params["size"],
+        model.max_seq_length - tokenizer.num_special_tokens_to_add(),
+    )
+    chunk_overlap = chunk_params["overlap"]
+
+    def token_lengths(texts: List[str]) -> List[int]:
+        input_ids = tokenizer(texts, add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in input_ids]
+
+    # Split level by level until every piece fits in chunk_size. Each item
+    # is (text, next separator level, token length or None if not counted)
+    items: List[Tuple[str, int, Optional[int]]] = [(document, 0, None)]
+    while any(length is None for _, _, length in items):
+        uncounted = [i for i, (_, _, length) in enumerate(items) if length is None]
+        lengths = token_lengths([items[i][0] for i in uncounted])
+        for i, counted_length in zip(uncounted, lengths):
+            items[i] = (items[i][0], items[i][1], counted_length)
+
+        split_items: List[Tuple[str, int, Optional[int]]] = []
+        for text, level, length in items:
+            if length is not None and length <= chunk_size:
+                split_items.append((text, level, length))
+                continue
+            # Find the coarsest remaining separator present in the text
+            split_text = [text]
+            while len(split_text) == 1 and level < len(MARKDOWN_TOKEN_SEPARATORS):
+                split_text = [
+                    piece
+                    for piece in re.split(MARKDOWN_TOKEN_SEPARATORS[level], text)
+                    if piece
+                ]
+                level += 1
+            if len(split_text) > 1:
+                split_items += [(piece, level, None) for piece in split_text]
+            else:
+                split_items += [
+                    (piece, level, piece_length)
+                    for piece, piece_length in split_token_window(
+                        text, tokenizer, chunk_size
+                    )
+                ]
+        items = split_items
+    # Every piece is counted once the loop ends
+    pieces = [(text, length) for text, _, length in items if length is not None]
+
+    # Merge pieces into chunks
+    chunks = []
+    current: deque = deque()
+    current_length = 0
+    for text, length in pieces:
+        if current and current_length + length > chunk_size:
+            chunks.append("".join(piece for piece, _ in current).strip())
+            while current and (
+                current_length > chunk_overlap or current_length + length > chunk_size
+            ):
+                current_length -= current.popleft()[1]
+        current.append((text, length))
+        current_length += length
+    if current:
+        chunks.append("".join(piece for piece, _ in current).strip())
+
+    return [chunk for chunk in chunks if chunk]
+
+
+def split_token_window(text: str, tokenizer, window: int) -> List[Tuple[str, int]]:
+    """Cut a text without separators into consecutive windows of tokens"""
+    offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)[
+        "offset_mapping"
+    ]
+    pieces = []
+    for start in range(0, len(offsets), window):
+        end = min(start + window, len(offsets))
+        char_start = offsets[start][0] if start > 0 else 0
+        char_end = offsets[end][0] if end < len(offsets) else len(text)
+        pieces.append((text[char_start:char_end], end - start))
+    return pieces
+
+
+def document_embedding(
+    chunks: List[str],
+    embedding_model: EmbeddingModel,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    cache: Optional[ChunkEmbeddingCache] = None,
+    backend: EmbeddingBackend = EMBEDDING_BACKEND,
+) -> Embedding:
     """Create a vector embedding for a list of document chunks
 
     Args:
         chunks (List[str]): List of strings containing the different
             document chunks
         embedding_model (EmbeddingModel): Name of the embedding model
+        batch_size (int, optional): Number of chunks encoded in each
+            forward pass. Defaults to EMBEDDING_BATCH_SIZE.
+        cache (Optional[ChunkEmbeddingCache], optional): Content-addressed
+            cache of chunk embeddings; only chunks missing from it are
+            encoded. Defaults to None.
+        backend (EmbeddingBackend, optional): Inference backend.
+            Defaults to EMBEDDING_BACKEND.
 
     Raises:
         ValueError: The selected embedding method has not been
@@ -103,43 +499,414 @@ def document_embedding(chunks: List[str], embedding_model: EmbeddingModel) -> Em
             the original chunks and model details
 
     """
+    if cache is not None:
+        return document_embedding_cached(
+            chunks=chunks,
+            embedding_model=embedding_model,
+            batch_size=batch_size,
+            cache=cache,
+            backend=backend,
+        )
+
     if embedding_model in get_args(SentenceTransformerModels):
         embedding = document_embedding_sentence_transformers(
-            chunks=chunks, embedding_model=embedding_model
+            chunks=chunks,
+            embedding_model=embedding_model,
+            batch_size=batch_size,
+            backend=backend,
         )
     else:
         raise ValueError(f"EmbeddingModel {embedding_model} not implemented")
     return embedding
 
 
+def document_embedding_cached(
+    chunks: List[str],
+    embedding_model: EmbeddingModel,
+    batch_size: int,
+    cache: ChunkEmbeddingCache,
+    backend: EmbeddingBackend = EMBEDDING_BACKEND,
+) -> Embedding:
+    """Create a vector embedding, only encoding chunks missing from the cache
+
+    Args:
+        chunks (List[str]): List of strings containing the different
+            document chunks
+        embedding_model (EmbeddingModel): Name of the embedding model
+        batch_size (int): Number of chunks encoded in each forward pass
+        cache (ChunkEmbeddingCache): Content-addressed cache of chunk
+            embeddings for `embedding_model` and `backend`
+        backend (EmbeddingBackend, optional): Inference backend.
+            Defaults to EMBEDDING_BACKEND.
+
+    Returns:
+        Embedding: Normalized vector embedding as an np.array together with
+            the original chunks and model details
+    """
+
+    # Shared model, also when every chunk is cached
+    embedding_transformer = load_embedding_model(embedding_model, backend)
+
+    cached_embeddings = cache.get_many(chunks)
+    missing_chunks = [
+        chunk for chunk, value in zip(chunks, cached_embeddings) if value is None
+    ]
+
+    missing_embedding = None
+    if missing_chunks:
+        missing_embedding = document_embedding(
+            chunks=missing_chunks,
+            embedding_model=embedding_model,
+            batch_size=batch_size,
+            backend=backend,
+        )
+        cache.put_many(missing_chunks, missing_embedding["embedding"])
+
+    document_embeddings = fill_from_cache(
+        cached_embeddings=cached_embeddings,
+        missing_embeddings=(
+            missing_embedding["embedding"] if missing_embedding is not None else None
+        ),
+        dimension=embedding_transformer.get_sentence_embedding_dimension(),
+    )
+    embedding = Embedding(
+        model=embedding_transformer,
+        dimension=document_embeddings.shape[1],
+        content=chunks,
+        embedding=document_embeddings,
+    )
+    if missing_embedding is not None and "stats" in missing_embedding:
+        embedding["stats"] = missing_embedding["stats"]
+    return embedding
+
+
+def fill_from_cache(
+    cached_embeddings: List[Optional[np.ndarray]],
+    missing_embeddings: Optional[np.ndarray],
+    dimension: int,
+) -> np.ndarray:
+    """Assemble the embeddings of a list of chunks from the cache and fresh encodings
+
+    Args:
+        cached_embeddings (List[Optional[np.ndarray]]): Cached embedding of
+            each chunk, None for the chunks missing from the cache
+        missing_embeddings (Optional[np.ndarray]): Normalized embeddings of
+            the missing chunks, in order. None if every chunk is cached.
+        dimension (int): Embedding dimension
+
+    Returns:
+        np.ndarray: float32 matrix with one normalized embedding per chunk
+    """
+    document_embeddings = np.empty(
+        shape=(len(cached_embeddings), dimension), dtype=np.float32
+    )
+    missing_index = []
+    for i, value in enumerate(cached_embeddings):
+        if value is None:
+            missing_index.append(i)
+        else:
+            document_embeddings[i] = value
+    if missing_embeddings is not None:
+        document_embeddings[missing_index] = missing_embeddings
+    return document_embeddings
+
+
 def document_embedding_sentence_transformers(
-    chunks: List[str], embedding_model: EmbeddingModel
+    chunks: List[str],
+    embedding_model: EmbeddingModel,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    backend: EmbeddingBackend = EMBEDDING_BACKEND,
 ) -> Embedding:
     """Sentence Transformer embedding
 
+    Chunks are sorted by token length and encoded in batches of
+    `batch_size`, so each batch is padded to a similar length. Embeddings
+    are written into a preallocated float32 matrix in the original chunk
+    order, which is normalized once at the end. Padding overhead and
+    tokens/sec are reported in the `stats` field of the output.
+
     Args:
         chunks (List[str]): List of strings containing the different
             document chunks
         embedding_model (EmbeddingModel): Name of the embedding model
+        batch_size (int, optional): Number of chunks encoded in each
+            forward pass. Defaults to EMBEDDING_BATCH_SIZE.
+        backend (EmbeddingBackend, optional): Inference backend.
+            Defaults to EMBEDDING_BACKEND.
 
     Returns:
         Embedding: Normalized vector embedding as an np.array together with
             the original chunks and model details
     """
-    # Initialize embedding
-    embedding_transformer = SentenceTransformer(embedding_model)
+    # Get shared embedding model
+    embedding_transformer = load_embedding_model(embedding_model, backend)
     word_embedding_dimension = embedding_transformer.get_sentence_embedding_dimension()
 
-    document_embeddings = np.empty(shape=(0, word_embedding_dimension))
-    for chunk in tqdm(chunks, total=len(chunks)):
-        chunk_embedding = embedding_transformer.encode(chunk)
-        chunk_embedding = normalize_vector(chunk_embedding)
-        document_embeddings = np.vstack((document_embeddings, chunk_embedding))
+    # Sort chunks by token length so that each batch is padded to a
+    # similar length; embeddings are written back in the original order
+    token_lengths = chunk_token_lengths(chunks, embedding_transformer)
+    order = np.argsort(-token_lengths, kind="stable")
+
+    ini_time = time.perf_counter()
+    padded_tokens = 0
+    document_embeddings = np.empty(
+        shape=(len(chunks), word_embedding_dimension), dtype=np.float32
+    )
+    for start in tqdm(range(0, len(chunks), batch_size)):
+        batch_index = order[start : start + batch_size]
+        batch = [chunks[i] for i in batch_index]
+        document_embeddings[batch_index] = embedding_transformer.encode(
+            batch, batch_size=batch_size, convert_to_numpy=True
+        )
+        padded_tokens += int(token_lengths[batch_index].max()) * len(batch_index)
+    document_embeddings = normalize_matrix(document_embeddings)
+    elapsed_time = time.perf_counter() - ini_time
 
     embedding = Embedding(
         model=embedding_transformer,
         dimension=word_embedding_dimension,
         content=chunks,
         embedding=document_embeddings,
+        stats=encoding_stats(
+            tokens=int(token_lengths.sum()),
+            padded_tokens=padded_tokens,
+            chunks=len(chunks),
+            elapsed_time=elapsed_time,
+        ),
     )
     return embedding
+
+
+def chunk_token_lengths(chunks: List[str], embedding_model: EncoderModel) -> np.ndarray:
+    """Number of tokens each chunk occupies in the model input
+
+    Lengths include special tokens and are capped at max_seq_length, i.e.
+    they are the lengths the chunks are padded or truncated against.
+
+    Args:
+        chunks (List[str]): List of strings containing the different
+            document chunks
+        embedding_model (EncoderModel): Loaded embedding model
+
+    Returns:
+        np.ndarray: Integer array with one token length per chunk
+    """
+    if not chunks:
+        return np.zeros(shape=0, dtype=np.int64)
+    input_ids = embedding_model.tokenizer(chunks, add_special_tokens=True)["input_ids"]
+    token_lengths = np.array([len(ids) for ids in input_ids], dtype=np.int64)
+    return np.minimum(token_lengths, embedding_model.max_seq_length)
+
+
+def encoding_stats(
+    tokens: int, padded_tokens: int, chunks: int, elapsed_time: float
+) -> EncodingStats:
+    """Build the padding and throughput report of an encoding run
+
+    Args:
+        tokens (int): Real (non-padding) tokens encoded
+        padded_tokens (int): Tokens encoded including padding
+        chunks (int): Number of chunks encoded
+        elapsed_time (float): Encoding time in seconds
+
+    Returns:
+        EncodingStats: Padding overhead (share of padding tokens) and
+            achieved real tokens/sec
+    """
+    return EncodingStats(
+        chunks=chunks,
+        tokens=tokens,
+        padded_tokens=padded_tokens,
+        padding_overhead=1 - tokens / padded_tokens if padded_tokens else 0.0,
+        elapsed_time=elapsed_time,
+        tokens_per_sec=tokens / elapsed_time if elapsed_time else 0.0,
+    )
+
+
+def summarize_encoding_stats(embeddings: List[Embedding]) -> EncodingStats:
+    """Aggregate the encoding stats of several embeddings
+
+    Args:
+        embeddings (List[Embedding]): Embeddings, possibly without stats
+            (e.g. when every chunk came from the cache)
+
+    Returns:
+        EncodingStats: Combined padding overhead and tokens/sec
+    """
+    stats = [embedding["stats"] for embedding in embeddings if "stats" in embedding]
+    return encoding_stats(
+        tokens=sum(stat["tokens"] for stat in stats),
+        padded_tokens=sum(stat["padded_tokens"] for stat in stats),
+        chunks=sum(stat["chunks"] for stat in stats),
+        elapsed_time=sum(stat["elapsed_time"] for stat in stats),
+    )
+
+
+def document_embedding_parallel(
+    documents: List[List[str]],
+    embedding_model: EmbeddingModel,
+    num_workers: int,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    max_chunks_in_flight: int = EMBEDDING_MAX_CHUNKS_IN_FLIGHT,
+    cache: Optional[ChunkEmbeddingCache] = None,
+    backend: EmbeddingBackend = EMBEDDING_BACKEND,
+) -> List[Embedding]:
+    """Embed the chunks of many documents using a pool of CPU worker processes
+
+    Chunks from consecutive documents are pooled together so that every
+    worker receives full batches. At most `max_chunks_in_flight` chunks
+    (and their embeddings) are held in memory at once. Padding overhead and
+    tokens/sec of the encoded chunks are reported in the `stats` field of
+    each document, as in `document_embedding`.
+
+    Args:
+        documents (List[List[str]]): List of documents, each one given as
+            its list of chunks
+        embedding_model (EmbeddingModel): Name of the embedding model
+        num_workers (int): Number of worker processes
+        batch_size (int, optional): Number of chunks encoded in each
+            forward pass. Defaults to EMBEDDING_BATCH_SIZE.
+        max_chunks_in_flight (int, optional): Maximum number of chunks
+            sent to the pool at once. Defaults to
+            EMBEDDING_MAX_CHUNKS_IN_FLIGHT.
+        cache (Optional[ChunkEmbeddingCache], optional): Content-addressed
+            cache of chunk embeddings; only chunks missing from it are sent
+            to the pool. Defaults to None.
+        backend (EmbeddingBackend, optional): Inference backend, either
+            "torch" or "int8". Defaults to EMBEDDING_BACKEND.
+
+    Raises:
+        ValueError: The selected embedding method or backend is not
+            supported by the worker pool
+
+    Returns:
+        List[Embedding]: One normalized embedding per document, in the
+            same order as `documents`
+    """
+    if embedding_model not in get_args(SentenceTransformerModels):
+        raise ValueError(f"EmbeddingModel {embedding_model} not implemented")
+    if backend not in ("torch", "int8"):
+        raise ValueError(f"EmbeddingBackend {backend} not supported by worker pool")
+
+    embedding_transformer = load_embedding_model(embedding_model, backend)
+    if isinstance(embedding_transformer, OnnxSentenceTransformer):
+        raise ValueError(f"EmbeddingBackend {backend} not supported by worker pool")
+    word_embedding_dimension = embedding_transformer.get_sentence_embedding_dimension()
+
+    # Each worker runs single-threaded torch; otherwise workers compete
+    # for the same cores
+    omp_num_threads = os.environ.get("OMP_NUM_THREADS")
+    os.environ["OMP_NUM_THREADS"] = "1"
+    try:
+        pool = embedding_transformer.start_multi_process_pool(
+            target_devices=["cpu"] * num_workers
+        )
+    finally:
+        if omp_num_threads is None:
+            del os.environ["OMP_NUM_THREADS"]
+        else:
+            os.environ["OMP_NUM_THREADS"] = omp_num_threads
+
+    def encode_pool(
+        pool_chunks: List[str],
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, float]:
+        # Embeddings, token and padded length of each chunk, and encoding time
+        pool_embeddings = np.empty(
+            shape=(len(pool_chunks), word_embedding_dimension), dtype=np.float32
+        )
+        token_lengths = chunk_token_lengths(pool_chunks, embedding_transformer)
+        padded_lengths = np.zeros_like(token_lengths)
+        ini_time = time.perf_counter()
+        if pool_chunks:
+            # Send chunks sorted by token length so that every worker batch
+            # holds chunks of similar length, then restore original order
+            order = np.argsort(-token_lengths, kind="stable")
+            pool_embeddings[order] = embedding_transformer.encode_multi_process(
+                [pool_chunks[i] for i in order],
+                pool=pool,
+                batch_size=batch_size,
+                chunk_size=batch_size,
+            )
+            # Workers encode consecutive slices of batch_size sorted chunks,
+            # each padded to its longest chunk
+            for start in range(0, len(order), batch_size):
+                batch_index = order[start : start + batch_size]
+                padded_lengths[batch_index] = token_lengths[batch_index].max()
+        elapsed_time = time.perf_counter() - ini_time
+        return (
+            normalize_matrix(pool_embeddings),
+            token_lengths,
+            padded_lengths,
+            elapsed_time,
+        )
+
+    embeddings: List[Embedding] = []
+    try:
+        window: List[List[str]] = []
+        window_size = 0
+        for i, chunks in enumerate(tqdm(documents, total=len(documents))):
+            window.append(chunks)
+            window_size += len(chunks)
+            if window_size < max_chunks_in_flight and i < len(documents) - 1:
+                continue
+
+            # Encode every chunk in the window at once. Cached chunks are
+            # not encoded, so they have no token or padded length
+            window_chunks = [chunk for document in window for chunk in document]
+            if cache is not None:
+                cached_embeddings = cache.get_many(window_chunks)
+                missing_index = [
+                    i for i, value in enumerate(cached_embeddings) if value is None
+                ]
+                window_tokens = np.zeros(shape=len(window_chunks), dtype=np.int64)
+                window_padded = np.zeros(shape=len(window_chunks), dtype=np.int64)
+                missing_embeddings = None
+                elapsed_time = 0.0
+                if missing_index:
+                    missing_chunks = [window_chunks[i] for i in missing_index]
+                    missing_embeddings, token_lengths, padded_lengths, elapsed_time = (
+                        encode_pool(missing_chunks)
+                    )
+                    window_tokens[missing_index] = token_lengths
+                    window_padded[missing_index] = padded_lengths
+                    cache.put_many(missing_chunks, missing_embeddings)
+                window_embeddings = fill_from_cache(
+                    cached_embeddings=cached_embeddings,
+                    missing_embeddings=missing_embeddings,
+                    dimension=word_embedding_dimension,
+                )
+            else:
+                window_embeddings, window_tokens, window_padded, elapsed_time = (
+                    encode_pool(window_chunks)
+                )
+
+            # Split back into documents, each with the stats of its chunks
+            # and a share of the window time proportional to its padded tokens
+            window_padded_tokens = int(window_padded.sum())
+            start = 0
+            for document in window:
+                end = start + len(document)
+                embedding = Embedding(
+                    model=embedding_transformer,
+                    dimension=word_embedding_dimension,
+                    content=document,
+                    embedding=window_embeddings[start:end],
+                )
+                padded_tokens = int(window_padded[start:end].sum())
+                if padded_tokens:
+                    embedding["stats"] = encoding_stats(
+                        tokens=int(window_tokens[start:end].sum()),
+                        padded_tokens=padded_tokens,
+                        chunks=int(np.count_nonzero(window_padded[start:end])),
+                        elapsed_time=elapsed_time
+                        * padded_tokens
+                        / window_padded_tokens,
+                    )
+                embeddings.append(embedding)
+                start = end
+            window = []
+            window_size = 0
+    finally:
+        embedding_transformer.stop_multi_process_pool(pool)
+
+    return embeddings
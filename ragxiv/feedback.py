@@ -0,0 +1,178 @@
+"""Write user feedback to the database in the background"""
+
+import time
+import queue
+import threading
+from typing import List, Optional, Tuple, TypedDict
+import psycopg
+from psycopg_pool import ConnectionPool
+from ragxiv.database import UserFeedback, copy_user_feedback
+
+# Default write-behind parameters: a batch is flushed when it reaches
+# FEEDBACK_BATCH_SIZE records or its oldest record has waited
+# FEEDBACK_FLUSH_INTERVAL seconds
+FEEDBACK_BATCH_SIZE = 50
+FEEDBACK_FLUSH_INTERVAL = 2.0
+FEEDBACK_CLOSE_TIMEOUT = 10.0
+
+
+class FeedbackStats(TypedDict):
+    queue_depth: int
+    submitted: int
+    written: int
+    failed: int
+    flushes: int
+    last_flush_ms: float
+    mean_flush_ms: float
+    max_flush_ms: float
+    mean_write_delay_ms: float
+
+
+class FeedbackWriter:
+    """Write-behind queue of user feedback records
+
+    `submit` only enqueues the record, so capturing feedback adds no
+    database latency to the interactive path. A daemon thread flushes the
+    queue in batches with a single COPY (see `copy_user_feedback`), when
+    the batch is full or its oldest record has waited `flush_interval`
+    seconds. `close` drains and flushes the pending records.
+
+    A batch that fails to be written is logged and dropped, so that a
+    database outage does not grow the queue without bound.
+    """
+
+    def __init__(
+        self,
+        conn: psycopg.Connection | ConnectionPool,
+        table_name: str = "user_feedback",
+        batch_size: int = FEEDBACK_BATCH_SIZE,
+        flush_interval: float = FEEDBACK_FLUSH_INTERVAL,
+    ):
+        self.conn = conn
+        self.table_name = table_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Optional[Tuple[UserFeedback, float]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._submitted = 0
+        self._written = 0
+        self._failed = 0
+        self._flushes = 0
+        self._last_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+        self._total_write_delay_ms = 0.0
+
+        self._thread = threading.Thread(
+            target=self._run, name="feedback-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, feedback: UserFeedback):
+        """Enqueue a feedback record to be written in the background
+
+        Args:
+            feedback (UserFeedback): Feedback record
+
+        Raises:
+            RuntimeError: The writer has been closed
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("FeedbackWriter is closed")
+            self._submitted += 1
+        self._queue.put((feedback, time.monotonic()))
+
+    def close(self, timeout: float = FEEDBACK_CLOSE_TIMEOUT):
+        """Flush the pending records and stop the background thread
+
+        Args:
+            timeout (float, optional): Seconds to wait for the pending
+                records to be written. Defaults to FEEDBACK_CLOSE_TIMEOUT.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        # Records submitted before close are ahead of the stop marker
+        self._queue.put(None)
+        self._thread.join(timeout=timeout)
+        if self._thread.is_alive():
+            print(
+                f"Feedback writer did not finish in {timeout} s, {self._queue.qsize()} records pending"
+            )
+
+    def stats(self) -> FeedbackStats:
+        """Queue depth and flush latency of the writer
+
+        Flush times measure the COPY of a batch; write delays go from
+        `submit` to the end of the flush of the record.
+        """
+        with self._lock:
+            flushes = self._flushes
+            written = self._written
+            return FeedbackStats(
+                queue_depth=self._submitted - written - self._failed,
+                submitted=self._submitted,
+                written=written,
+                failed=self._failed,
+                flushes=flushes,
+                last_flush_ms=self._last_flush_ms,
+                mean_flush_ms=self._total_flush_ms / flushes if flushes else 0.0,
+                max_flush_ms=self._max_flush_ms,
+                mean_write_delay_ms=(
+                    self._total_write_delay_ms / written if written else 0.0
+                ),
+            )
+
+    def _run(self):
+        batch: List[Tuple[UserFeedback, float]] = []
+        deadline = 0.0
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if batch else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+
+            if item is None:
+                self._flush(batch)
+                return
+            if item:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+            if batch and (
+                len(batch) >= self.batch_size or time.monotonic() >= deadline
+            ):
+                self._flush(batch)
+                batch = []
+
+    def _flush(self, batch: List[Tuple[UserFeedback, float]]):
+        if not batch:
+            return
+        ini_time = time.monotonic()
+        try:
+            copy_user_feedback(
+                conn=self.conn,
+                feedbacks=[feedback for feedback, _ in batch],
+                table_name=self.table_name,
+            )
+        except Exception as e:
+            print(f"Error while writing {len(batch)} feedback records: {e}")
+            with self._lock:
+                self._failed += len(batch)
+            return
+        end_time = time.monotonic()
+
+        flush_ms = (end_time - ini_time) * 1000
+        with self._lock:
+            self._written += len(batch)
+            self._flushes += 1
+            self._last_flush_ms = flush_ms
+            self._total_flush_ms += flush_ms
+            self._max_flush_ms = max(self._max_flush_ms, flush_ms)
+            self._total_write_delay_ms += sum(
+                (end_time - submitted) * 1000 for _, submitted in batch
+            )
@@ -1,5 +1,6 @@
 """Fetch data from sources and store them into the knowledge base"""
 
+import re
 import time
 import datetime
 from typing import List, Optional, TypedDict
@@ -87,20 +88,71 @@ def retrieve_arxiv_metadata(
             if result.entry_id in exclude_ids:
                 continue
 
-        paper = PaperID(
-            id=result.entry_id,
-            summary=result.summary,
-            authors=[name.name for name in result.authors],
-            entry_url=result.entry_id,
-            published=result.published,
-            primary_category=result.primary_category,
-            categories=result.categories,
+        metadata.append(paper_from_result(result))
+
+    return metadata
+
+
+def retrieve_arxiv_metadata_by_id(
+    paper_ids: List[str], batch_size: int = 100, verbose: bool = False
+) -> List[PaperID]:
+    """
+    Fetch the metadata of given arXiv documents, e.g. to fill the metadata
+    of papers stored without it
+
+    Args:
+        paper_ids (List[str]): Article ids as stored in the database (entry
+            URLs such as 'http://arxiv.org/abs/2401.00001v1') or short ids.
+            The returned papers keep these ids.
+        batch_size (int, optional): Ids requested per API query. Defaults
+            to 100.
+        verbose (bool): If True, show progress with tqdm. Defaults to False
+
+    Returns:
+        List[PaperID]: Metadata of the documents found, papers withdrawn
+            from arXiv are missing
+    """
+    client = arxiv.Client(
+        page_size=batch_size,
+        delay_seconds=3.0,
+        num_retries=3,
+    )
+
+    metadata = []
+    batches = range(0, len(paper_ids), batch_size)
+    for start in tqdm(batches) if verbose else batches:
+        # Results are matched to the requested ids without their version,
+        # so that each paper keeps the id it is stored with
+        requested = {
+            re.sub(r"v\d+$", "", paper_id.split("/abs/")[-1]): paper_id
+            for paper_id in paper_ids[start : start + batch_size]
+        }
+        search = arxiv.Search(
+            id_list=[paper_id.split("/abs/")[-1] for paper_id in requested.values()],
+            max_results=len(requested),
         )
-        metadata.append(paper)
+        for result in client.results(search):
+            paper = paper_from_result(result)
+            short_id = re.sub(r"v\d+$", "", result.get_short_id())
+            paper["id"] = requested.get(short_id, paper["id"])
+            metadata.append(paper)
 
     return metadata
 
 
+def paper_from_result(result: arxiv.Result) -> PaperID:
+    """Metadata of a paper returned by the arXiv API"""
+    return PaperID(
+        id=result.entry_id,
+        summary=result.summary,
+        authors=[name.name for name in result.authors],
+        entry_url=result.entry_id,
+        published=result.published,
+        primary_category=result.primary_category,
+        categories=result.categories,
+    )
+
+
 def paper_html_to_markdown(paper_id: PaperID, verbose: bool = False) -> str | None:
     """
     Fetch the html version of a paper, process it and return as Markdown format
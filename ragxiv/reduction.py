@@ -0,0 +1,186 @@
+"""Fit and apply dimensionality reductions of stored embeddings"""
+
+import os
+import re
+from functools import lru_cache
+from typing import List, Literal, Optional, TypedDict, cast
+import numpy as np
+
+ReductionMethod = Literal["pca", "random_projection"]
+
+# Default reduction parameters
+REDUCTION_METHOD: ReductionMethod = "pca"
+REDUCED_DIMENSION = 192
+REDUCTION_OVERSAMPLING = 4
+PROJECTIONS_DIR = "projections"
+
+
+class Projection(TypedDict):
+    table: str
+    version: int
+    method: ReductionMethod
+    input_dimension: int
+    output_dimension: int
+    components: np.ndarray
+
+
+def fit_projection(
+    embeddings: np.ndarray,
+    table: str,
+    method: ReductionMethod = REDUCTION_METHOD,
+    output_dimension: int = REDUCED_DIMENSION,
+    seed: int = 42,
+    directory: str = PROJECTIONS_DIR,
+) -> Projection:
+    """Fit a linear projection on the embeddings stored in a table
+
+    Vectors are projected without centering, so that inner products in
+    the reduced space approximate those in the original space.
+
+    Args:
+        embeddings (np.ndarray): Matrix with the stored embeddings (or a
+            sample of them)
+        table (str): Name of the embedding table the projection is for
+        method (ReductionMethod, optional): 'pca' (principal directions of
+            the corpus) or 'random_projection' (Gaussian random matrix).
+            Defaults to REDUCTION_METHOD.
+        output_dimension (int, optional): Dimension of the reduced vectors.
+            Defaults to REDUCED_DIMENSION.
+        seed (int, optional): Seed of the random projection. Defaults to 42.
+        directory (str, optional): Directory where projections are saved,
+            used to assign the next version. Defaults to PROJECTIONS_DIR.
+
+    Raises:
+        ValueError: The selected reduction method has not been
+            implemented yet
+
+    Returns:
+        Projection: Fitted projection, with the next free version number
+            for `table`
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    input_dimension = embeddings.shape[1]
+    if method == "pca":
+        centered = embeddings - embeddings.mean(axis=0)
+        _, _, vt = np.linalg.svd(centered, full_matrices=False)
+        components = vt[:output_dimension].T
+    elif method == "random_projection":
+        rng = np.random.default_rng(seed)
+        components = rng.normal(
+            scale=1 / np.sqrt(output_dimension),
+            size=(input_dimension, output_dimension),
+        )
+    else:
+        raise ValueError(f"ReductionMethod {method} not implemented")
+
+    versions = list_projection_versions(table=table, directory=directory)
+    projection = Projection(
+        table=table,
+        version=max(versions, default=0) + 1,
+        method=method,
+        input_dimension=input_dimension,
+        output_dimension=output_dimension,
+        components=components.astype(np.float32),
+    )
+    return projection
+
+
+def apply_projection(projection: Projection, embeddings: np.ndarray) -> np.ndarray:
+    """Project one embedding or a matrix of embeddings"""
+    return np.asarray(embeddings, dtype=np.float32) @ projection["components"]
+
+
+def reduced_column_name(projection: Projection) -> str:
+    """Name of the table column that stores the reduced embeddings
+
+    The version is part of the name, so refitting never mixes vectors
+    produced by different projections.
+    """
+    return f"embedding_reduced_v{projection['version']}"
+
+
+def projection_path(table: str, version: int, directory: str = PROJECTIONS_DIR) -> str:
+    return os.path.join(directory, f"{table}_v{version}.npz")
+
+
+def list_projection_versions(table: str, directory: str = PROJECTIONS_DIR) -> List[int]:
+    """Versions of the projections saved for a table"""
+    if not os.path.isdir(directory):
+        return []
+    pattern = re.compile(rf"^{re.escape(table)}_v(\d+)\.npz$")
+    matches = [pattern.match(file_name) for file_name in os.listdir(directory)]
+    return sorted(int(match.group(1)) for match in matches if match)
+
+
+def save_projection(projection: Projection, directory: str = PROJECTIONS_DIR) -> str:
+    """Save a projection next to the other versions for its table
+
+    Returns:
+        str: Path of the saved file
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = projection_path(projection["table"], projection["version"], directory)
+    np.savez(
+        path,
+        table=projection["table"],
+        version=projection["version"],
+        method=projection["method"],
+        input_dimension=projection["input_dimension"],
+        output_dimension=projection["output_dimension"],
+        components=projection["components"],
+    )
+    return path
+
+
+def load_projection(
+    table: str, version: Optional[int] = None, directory: str = PROJECTIONS_DIR
+) -> Optional[Projection]:
+    """Load a saved projection
+
+    The latest version is looked up on every call, so projections fitted
+    while the process runs (e.g. the Streamlit server) are picked up. Files
+    are only read once per modification time (see `read_projection`).
+
+    Args:
+        table (str): Name of the embedding table
+        version (Optional[int], optional): Version to load. If None, the
+            latest version is loaded. Defaults to None.
+        directory (str, optional): Directory where projections are saved.
+            Defaults to PROJECTIONS_DIR.
+
+    Returns:
+        Optional[Projection]: The projection, or None if no projection has
+            been saved for `table`
+    """
+    if version is None:
+        version = max(list_projection_versions(table, directory), default=None)
+        if version is None:
+            return None
+    path = projection_path(table, version, directory)
+    if not os.path.exists(path):
+        return None
+    return read_projection(path, os.path.getmtime(path))
+
+
+@lru_cache(maxsize=16)
+def read_projection(path: str, mtime: float) -> Projection:
+    """Read a projection file
+
+    Args:
+        path (str): Path of the projection file
+        mtime (float): Modification time of the file, part of the cache key
+            so that a rewritten file is read again
+
+    Returns:
+        Projection: The projection saved in `path`
+    """
+    data = np.load(path)
+    projection = Projection(
+        table=str(data["table"]),
+        version=int(data["version"]),
+        method=cast(ReductionMethod, str(data["method"])),
+        input_dimension=int(data["input_dimension"]),
+        output_dimension=int(data["output_dimension"]),
+        components=data["components"],
+    )
+    return projection
@@ -2,10 +2,18 @@
 
 from typing import List, Literal, TypedDict, Union, Optional, Any, get_args
 import psycopg
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
 from ragxiv.database import (
+    SearchFilters,
+    SearchResult,
     SemanticSearch,
+    db_connection,
+    hierarchical_search_postgres,
+    hierarchical_search_postgres_async,
     semantic_search_postgres,
+    semantic_search_postgres_async,
     keyword_search_postgres,
+    keyword_search_postgres_async,
     TextSearch,
 )
 
@@ -21,36 +29,41 @@ class RelevantDocuments(TypedDict):
     question: str
     documents: List[str]
     references: List[str]
+    scores: List[float]
 
 
 def retrieve_similar_documents(
     retrieval_method: RetrievalMethod | str,
     retrieval_parameters: List[Any],
-    conn: Optional[psycopg.Connection],
+    conn: Optional[psycopg.Connection | ConnectionPool],
+    filters: Optional[SearchFilters] = None,
 ) -> RelevantDocuments:
-    if retrieval_method == "pg_semantic_abstract+article":
-        if isinstance(conn, psycopg.Connection):
+    if not isinstance(conn, (psycopg.Connection, ConnectionPool)):
+        raise ValueError("Database connection not opened")
+
+    # Date range and category filters apply to every search of the method
+    if filters:
+        retrieval_parameters = [
+            {**search_parameters, "filters": filters}
+            for search_parameters in retrieval_parameters
+        ]
+
+    # A pool checks out a connection for this retrieval only
+    with db_connection(conn) as conn:
+        if retrieval_method == "pg_semantic_abstract+article":
             relevant_documents = pg_semantic_retrieval_hierarchical(
                 conn=conn, retrieval_parameters=retrieval_parameters
             )
-        else:
-            raise ValueError("Database connection not opened")
-    elif retrieval_method == "pg_semantic_article":
-        if isinstance(conn, psycopg.Connection):
+        elif retrieval_method == "pg_semantic_article":
             relevant_documents = pg_semantic_retrieval(
                 conn=conn, retrieval_parameters=retrieval_parameters
             )
-        else:
-            raise ValueError("Database connection not opened")
-    elif retrieval_method == "pg_text_article":
-        if isinstance(conn, psycopg.Connection):
+        elif retrieval_method == "pg_text_article":
             relevant_documents = pg_text_retrieval(
                 conn=conn, retrieval_parameters=retrieval_parameters
             )
         else:
-            raise ValueError("Database connection not opened")
-    else:
-        raise ValueError(f"Retrieval method {retrieval_method} not implemented")
+            raise ValueError(f"Retrieval method {retrieval_method} not implemented")
     return relevant_documents
 
 
@@ -58,34 +71,42 @@ def pg_semantic_retrieval_hierarchical(
     conn: psycopg.Connection, retrieval_parameters: List[SemanticSearch]
 ) -> RelevantDocuments:
     if conn:
-        # Semantic search on abstracts
         semantic_search_abstract = retrieval_parameters[0]
-        semantic_search_results_abstract, question_embedding = semantic_search_postgres(
-            conn=conn,
-            semantic_search_params=semantic_search_abstract,
-        )
+        semantic_search_article = retrieval_parameters[1]
 
-        # Get ID of relevant documents
-        id_relevant_documents = [
-            result[0] for result in semantic_search_results_abstract
-        ]
+        if not is_two_stage_search(semantic_search_abstract):
+            # Abstracts and chunks of their articles in a single round trip
+            semantic_search_results_abstract, semantic_search_results_articles, _ = (
+                hierarchical_search_postgres(
+                    conn=conn,
+                    abstract_search_params=semantic_search_abstract,
+                    article_search_params=semantic_search_article,
+                )
+            )
+        else:
+            # Semantic search on abstracts (reduced or binary column, then
+            # re-rank)
+            semantic_search_results_abstract, question_embedding = (
+                semantic_search_postgres(
+                    conn=conn,
+                    semantic_search_params=semantic_search_abstract,
+                )
+            )
 
-        # Semantic search on articles filtered by ID
-        semantic_search_article = retrieval_parameters[1]
-        semantic_search_results_articles, _ = semantic_search_postgres(
-            conn=conn,
-            semantic_search_params=semantic_search_article,
-            filter_id=id_relevant_documents,
-        )
+            # Semantic search on articles filtered by ID, with the settings
+            # and max_chunks_per_article of the article search
+            semantic_search_results_articles, _ = semantic_search_postgres(
+                conn=conn,
+                semantic_search_params=semantic_search_article,
+                filter_id=[
+                    result["article_id"] for result in semantic_search_results_abstract
+                ],
+            )
 
-        # Prepare output
-        final_documents = [
-            document[1] for document in semantic_search_results_abstract
-        ] + [document[1] for document in semantic_search_results_articles]
-        relevant_documents = RelevantDocuments(
+        relevant_documents = build_relevant_documents(
             question=semantic_search_abstract["query"],
-            documents=final_documents,
-            references=id_relevant_documents,
+            reference_results=semantic_search_results_abstract,
+            results=semantic_search_results_abstract + semantic_search_results_articles,
         )
     else:
         raise ValueError("Database connection not opened")
@@ -103,18 +124,10 @@ def pg_semantic_retrieval(
             semantic_search_params=semantic_search_article,
         )
 
-        # Get ID of relevant documents
-        id_relevant_documents = [
-            result[0] for result in semantic_search_results_article
-        ]
-
-        # Prepare output
-        final_documents = [document[1] for document in semantic_search_results_article]
-
-        relevant_documents = RelevantDocuments(
+        relevant_documents = build_relevant_documents(
             question=semantic_search_article["query"],
-            documents=final_documents,
-            references=id_relevant_documents,
+            reference_results=semantic_search_results_article,
+            results=semantic_search_results_article,
         )
     else:
         raise ValueError("Database connection not opened")
@@ -132,17 +145,141 @@ def pg_text_retrieval(
             text_search_params=text_search_article,
         )
 
-        # Get ID of relevant documents
-        id_relevant_documents = [result[0] for result in text_search_results_article]
-
-        # Prepare output
-        final_documents = [document[1] for document in text_search_results_article]
-
-        relevant_documents = RelevantDocuments(
+        relevant_documents = build_relevant_documents(
             question=text_search_article["query"],
-            documents=final_documents,
-            references=id_relevant_documents,
+            reference_results=text_search_results_article,
+            results=text_search_results_article,
         )
     else:
         raise ValueError("Database connection not opened")
     return relevant_documents
+
+
+def is_two_stage_search(semantic_search: SemanticSearch) -> bool:
+    """Whether a search first scans the reduced or binary column, which the
+    single-statement hierarchical search does not support"""
+    return semantic_search.get("reduction_version") is not None or semantic_search.get(
+        "binary_quantization", False
+    )
+
+
+def build_relevant_documents(
+    question: str,
+    reference_results: List[SearchResult],
+    results: List[SearchResult],
+) -> RelevantDocuments:
+    """Relevant documents of a retrieval: the content and score of every
+    result, and the article ids of `reference_results` as references"""
+    return RelevantDocuments(
+        question=question,
+        documents=[document["content"] for document in results],
+        references=[result["article_id"] for result in reference_results],
+        scores=[document["score"] for document in results],
+    )
+
+
+async def retrieve_similar_documents_async(
+    retrieval_method: RetrievalMethod | str,
+    retrieval_parameters: List[Any],
+    conn: Optional[psycopg.AsyncConnection | AsyncConnectionPool],
+    filters: Optional[SearchFilters] = None,
+) -> RelevantDocuments:
+    """Async version of `retrieve_similar_documents`
+
+    With an AsyncConnectionPool, every search checks out its own
+    connection, so several retrievals (e.g. semantic and keyword) can run
+    concurrently with asyncio.gather.
+    """
+    if not isinstance(conn, (psycopg.AsyncConnection, AsyncConnectionPool)):
+        raise ValueError("Database connection not opened")
+
+    if filters:
+        retrieval_parameters = [
+            {**search_parameters, "filters": filters}
+            for search_parameters in retrieval_parameters
+        ]
+
+    if retrieval_method == "pg_semantic_abstract+article":
+        relevant_documents = await pg_semantic_retrieval_hierarchical_async(
+            conn=conn, retrieval_parameters=retrieval_parameters
+        )
+    elif retrieval_method == "pg_semantic_article":
+        relevant_documents = await pg_semantic_retrieval_async(
+            conn=conn, retrieval_parameters=retrieval_parameters
+        )
+    elif retrieval_method == "pg_text_article":
+        relevant_documents = await pg_text_retrieval_async(
+            conn=conn, retrieval_parameters=retrieval_parameters
+        )
+    else:
+        raise ValueError(f"Retrieval method {retrieval_method} not implemented")
+    return relevant_documents
+
+
+async def pg_semantic_retrieval_hierarchical_async(
+    conn: psycopg.AsyncConnection | AsyncConnectionPool,
+    retrieval_parameters: List[SemanticSearch],
+) -> RelevantDocuments:
+    semantic_search_abstract = retrieval_parameters[0]
+    semantic_search_article = retrieval_parameters[1]
+
+    if not is_two_stage_search(semantic_search_abstract):
+        semantic_search_results_abstract, semantic_search_results_articles, _ = (
+            await hierarchical_search_postgres_async(
+                conn=conn,
+                abstract_search_params=semantic_search_abstract,
+                article_search_params=semantic_search_article,
+            )
+        )
+    else:
+        # The article search depends on the abstracts found, and keeps its
+        # own settings and max_chunks_per_article
+        semantic_search_results_abstract, _ = await semantic_search_postgres_async(
+            conn=conn,
+            semantic_search_params=semantic_search_abstract,
+        )
+        semantic_search_results_articles, _ = await semantic_search_postgres_async(
+            conn=conn,
+            semantic_search_params=semantic_search_article,
+            filter_id=[
+                result["article_id"] for result in semantic_search_results_abstract
+            ],
+        )
+
+    return build_relevant_documents(
+        question=semantic_search_abstract["query"],
+        reference_results=semantic_search_results_abstract,
+        results=semantic_search_results_abstract + semantic_search_results_articles,
+    )
+
+
+async def pg_semantic_retrieval_async(
+    conn: psycopg.AsyncConnection | AsyncConnectionPool,
+    retrieval_parameters: List[SemanticSearch],
+) -> RelevantDocuments:
+    semantic_search_article = retrieval_parameters[0]
+    semantic_search_results_article, _ = await semantic_search_postgres_async(
+        conn=conn,
+        semantic_search_params=semantic_search_article,
+    )
+    return build_relevant_documents(
+        question=semantic_search_article["query"],
+        reference_results=semantic_search_results_article,
+        results=semantic_search_results_article,
+    )
+
+
+async def pg_text_retrieval_async(
+    conn: psycopg.AsyncConnection | AsyncConnectionPool,
+    retrieval_parameters: List[TextSearch],
+) -> RelevantDocuments:
+    text_search_article = retrieval_parameters[0]
+    text_search_results_article = await keyword_search_postgres_async(
+        conn=conn,
+        text_search_params=text_search_article,
+    )
+    return build_relevant_documents(
+        question=text_search_article["query"],
+        reference_results=text_search_results_article,
+        results=text_search_results_article,
+    )
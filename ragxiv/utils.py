@@ -21,3 +21,11 @@ def normalize_vector(v):
     norm = np.sqrt((v * v).sum())
     v_norm = v / norm
     return v_norm
+
+
+def normalize_matrix(m: np.ndarray) -> np.ndarray:
+    """Normalize every row of a matrix to unit length in place"""
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    m /= norms
+    return m
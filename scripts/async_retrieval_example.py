@@ -0,0 +1,105 @@
+"""
+Illustrate async document retrieval: the hierarchical semantic search, a
+semantic search on article chunks and a keyword search run concurrently,
+each on its own connection of an async pool
+"""
+
+import os
+import sys
+import time
+import asyncio
+from dotenv import load_dotenv
+from typing import Final
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ragxiv.database import (
+    open_db_pool_async,
+    PostgresParams,
+    SemanticSearch,
+    TextSearch,
+)
+from ragxiv.retrieval import retrieve_similar_documents_async
+
+
+load_dotenv("./.env")
+
+# Default embedding parameters
+EMBEDDING_MODEL_NAME: Final = "multi-qa-mpnet-base-dot-v1"
+
+TABLE_EMBEDDING_ARTICLE = f"embedding_article_{EMBEDDING_MODEL_NAME}".replace("-", "_")
+TABLE_EMBEDDING_ABSTRACT = f"embedding_abstract_{EMBEDDING_MODEL_NAME}".replace(
+    "-", "_"
+)
+
+POSTGRES_USER = os.environ["POSTGRES_USER"]
+POSTGRES_PWD = os.environ["POSTGRES_PWD"]
+POSTGRES_DB = os.environ["POSTGRES_DB"]
+POSTGRES_HOST = os.environ["POSTGRES_HOST"]
+POSTGRES_PORT = os.environ["POSTGRES_PORT"]
+
+postgres_connection_params = PostgresParams(
+    host=POSTGRES_HOST,
+    port=POSTGRES_PORT,
+    user=POSTGRES_USER,
+    pwd=POSTGRES_PWD,
+    database=POSTGRES_DB,
+)
+
+user_question = "What are risk parity portfolios?"
+semantic_search_abstract = SemanticSearch(
+    query=user_question,
+    table=TABLE_EMBEDDING_ABSTRACT,
+    similarity_metric="<#>",
+    embedding_model=EMBEDDING_MODEL_NAME,
+    max_documents=5,
+)
+semantic_search_article = SemanticSearch(
+    query=user_question,
+    table=TABLE_EMBEDDING_ARTICLE,
+    similarity_metric="<#>",
+    embedding_model=EMBEDDING_MODEL_NAME,
+    max_documents=5,
+)
+text_search_article = TextSearch(
+    query=user_question,
+    table=TABLE_EMBEDDING_ARTICLE,
+    max_documents=5,
+)
+
+
+async def main():
+    pool = await open_db_pool_async(connection_params=postgres_connection_params)
+    async with pool:
+        ini_time = time.perf_counter()
+        hierarchical, semantic, keyword = await asyncio.gather(
+            retrieve_similar_documents_async(
+                retrieval_method="pg_semantic_abstract+article",
+                retrieval_parameters=[
+                    semantic_search_abstract,
+                    semantic_search_article,
+                ],
+                conn=pool,
+            ),
+            retrieve_similar_documents_async(
+                retrieval_method="pg_semantic_article",
+                retrieval_parameters=[semantic_search_article],
+                conn=pool,
+            ),
+            retrieve_similar_documents_async(
+                retrieval_method="pg_text_article",
+                retrieval_parameters=[text_search_article],
+                conn=pool,
+            ),
+        )
+        elapsed_time = time.perf_counter() - ini_time
+
+    print(f"Three retrievals in {elapsed_time:.3f} s")
+    for name, relevant_documents in [
+        ("hierarchical", hierarchical),
+        ("semantic", semantic),
+        ("keyword", keyword),
+    ]:
+        print(f"{name}: {relevant_documents['references']}")
+
+
+asyncio.run(main())
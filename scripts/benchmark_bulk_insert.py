@@ -0,0 +1,140 @@
+"""
+Compare the rows/sec of the ways of loading embeddings into PostgreSQL:
+- row: one INSERT per chunk (previous behaviour of insert_embedding_data)
+- executemany: batched INSERT ... ON CONFLICT with executemany
+- copy: COPY ... FROM STDIN in binary format into a staging table, merged
+  with a single INSERT ... ON CONFLICT
+
+Every method first stores the chunk text in the chunks table
+
+Rows are random unit vectors of fake papers (arXiv ids starting with
+"benchmark-"), written to a scratch embedding table. The table and the fake
+papers and chunks are deleted at the end. Run it against a local Postgres
+with the pgvector extension
+"""
+
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from typing import List, Literal
+import psycopg
+from pgvector.psycopg import register_vector
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ragxiv.database import (
+    ARTICLES_TABLE,
+    EmbeddingPrecision,
+    PostgresParams,
+    create_embedding_table,
+    get_chunk_ids,
+    insert_embedding_data,
+    open_db_connection,
+)
+from ragxiv.embedding import PaperEmbedding
+from ragxiv.utils import normalize_matrix
+
+load_dotenv("./.env")
+
+TABLE_BENCHMARK = "benchmark_bulk_insert"
+EMBEDDING_DIMENSION = 768
+NUMBER_ROWS = [100, 1_000, 10_000]
+EMBEDDING_PRECISION: EmbeddingPrecision = "vector"
+METHODS: List[Literal["row", "executemany", "copy"]] = ["row", "executemany", "copy"]
+
+postgres_connection_params = PostgresParams(
+    host=os.environ["POSTGRES_HOST"],
+    port=os.environ["POSTGRES_PORT"],
+    user=os.environ["POSTGRES_USER"],
+    pwd=os.environ["POSTGRES_PWD"],
+    database=os.environ["POSTGRES_DB"],
+)
+conn = open_db_connection(connection_params=postgres_connection_params, autocommit=True)
+if conn is None:
+    sys.exit("Unable to connect to the database")
+
+
+def make_rows(number_rows: int) -> List[PaperEmbedding]:
+    rng = np.random.default_rng(42)
+    embeddings = normalize_matrix(
+        rng.normal(size=(number_rows, EMBEDDING_DIMENSION)).astype(np.float32)
+    )
+    return [
+        PaperEmbedding(
+            id=f"benchmark-{i // 20:05d}",
+            content=f"Chunk {i}. "
+            + "Momentum strategies rank assets by their past returns. " * 8,
+            embeddings=embeddings[i],
+            chunk_index=i % 20,
+        )
+        for i in range(number_rows)
+    ]
+
+
+def insert_row_by_row(conn: psycopg.Connection, rows: List[PaperEmbedding]):
+    chunk_ids = get_chunk_ids(
+        conn=conn,
+        paper_chunks=[(row["id"], row["chunk_index"], row["content"]) for row in rows],
+        chunk_set=TABLE_BENCHMARK,
+    )
+    register_vector(conn)
+    with conn.cursor() as curs:
+        for chunk_id, row in zip(chunk_ids, rows):
+            curs.execute(
+                f"INSERT INTO {TABLE_BENCHMARK} (chunk_id, embedding) VALUES (%s, %s::{EMBEDDING_PRECISION})",
+                (chunk_id, row["embeddings"]),
+            )
+
+
+def delete_benchmark_data():
+    conn.execute(f"DROP TABLE IF EXISTS {TABLE_BENCHMARK}")
+    conn.execute(f"DELETE FROM {ARTICLES_TABLE} WHERE arxiv_id LIKE 'benchmark-%'")
+
+
+results = []
+for number_rows in NUMBER_ROWS:
+    rows = make_rows(number_rows)
+    for method in METHODS:
+        delete_benchmark_data()
+        create_embedding_table(
+            conn=conn,
+            table_name=TABLE_BENCHMARK,
+            embedding_dimension=EMBEDDING_DIMENSION,
+            precision=EMBEDDING_PRECISION,
+        )
+
+        ini_time = time.perf_counter()
+        if method == "row":
+            insert_row_by_row(conn=conn, rows=rows)
+        else:
+            insert_embedding_data(
+                conn=conn,
+                table_name=TABLE_BENCHMARK,
+                paper_embedding=rows,
+                precision=EMBEDDING_PRECISION,
+                method=method,
+            )
+        elapsed_time = time.perf_counter() - ini_time
+
+        stored_rows = conn.execute(
+            f"SELECT count(*) FROM {TABLE_BENCHMARK}"
+        ).fetchone()[0]
+        assert stored_rows == number_rows
+        results.append(
+            {
+                "rows": number_rows,
+                "method": method,
+                "seconds": elapsed_time,
+                "rows_per_sec": number_rows / elapsed_time,
+            }
+        )
+
+delete_benchmark_data()
+
+print(
+    pd.DataFrame(results)
+    .pivot(index="rows", columns="method", values="rows_per_sec")
+    .round(1)
+)
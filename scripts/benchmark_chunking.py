@@ -0,0 +1,83 @@
+"""
+Compare chunking throughput (MB/s) between MarkdownTextSplitter, which
+measures chunk size in characters, and MarkdownTokenSplitter, which
+measures it in tokens of the embedding model
+
+Also reports the share of chunks that exceed the model's max_seq_length,
+i.e. that would be silently truncated when embedded
+
+If article_markdown.csv (see get_markdown_papers.py) is available, its
+papers are used; otherwise a synthetic markdown document is used
+"""
+
+import os
+import sys
+import time
+import pandas as pd
+from typing import Final, List
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ragxiv.embedding import ChunkParams, chunk_document, load_embedding_model
+
+EMBEDDING_MODEL_NAME: Final = "multi-qa-mpnet-base-dot-v1"
+MARKDOWN_ARTICLES_PATH = "article_markdown.csv"
+NUMBER_DOCUMENTS = 50
+
+CHUNK_PARAMETERS = {
+    "MarkdownTextSplitter": ChunkParams(
+        method="MarkdownTextSplitter", size=500, overlap=50
+    ),
+    "MarkdownTokenSplitter": ChunkParams(
+        method="MarkdownTokenSplitter",
+        size=128,
+        overlap=12,
+        tokenizer_model=EMBEDDING_MODEL_NAME,
+    ),
+}
+
+
+def load_benchmark_documents(number_documents: int) -> List[str]:
+    if os.path.exists(MARKDOWN_ARTICLES_PATH):
+        markdown_text = pd.read_csv(MARKDOWN_ARTICLES_PATH, sep=";")
+        return markdown_text["article"].iloc[:number_documents].tolist()
+    paragraph = (
+        "Momentum strategies rank assets by their past returns and buy the "
+        "winners while selling the losers. "
+    ) * 6
+    section = "\n\n".join([paragraph] * 8)
+    document = "\n\n".join(f"## Section {i}\n\n{section}" for i in range(10))
+    return [document] * number_documents
+
+
+documents = load_benchmark_documents(number_documents=NUMBER_DOCUMENTS)
+megabytes = sum(len(document.encode("utf-8")) for document in documents) / 1e6
+
+model = load_embedding_model(EMBEDDING_MODEL_NAME)
+max_tokens = model.max_seq_length - model.tokenizer.num_special_tokens_to_add()
+
+# Load tokenizer and splitters before timing
+for chunk_parameters in CHUNK_PARAMETERS.values():
+    chunk_document(document=documents[0], chunk_params=chunk_parameters)
+
+results = {}
+for method, chunk_parameters in CHUNK_PARAMETERS.items():
+    ini_time = time.perf_counter()
+    chunks = []
+    for document in documents:
+        chunks += chunk_document(document=document, chunk_params=chunk_parameters)
+    elapsed_time = time.perf_counter() - ini_time
+
+    token_lengths = [
+        len(ids)
+        for ids in model.tokenizer(chunks, add_special_tokens=False)["input_ids"]
+    ]
+    results[method] = {
+        "MB_per_sec": megabytes / elapsed_time,
+        "chunks": len(chunks),
+        "mean_tokens": sum(token_lengths) / len(token_lengths),
+        "max_tokens": max(token_lengths),
+        "truncated_share": sum(n > max_tokens for n in token_lengths) / len(chunks),
+    }
+
+print(f"{len(documents)} documents, {megabytes:.2f} MB")
+print(pd.DataFrame(results).T.round(4))
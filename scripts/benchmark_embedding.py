@@ -0,0 +1,107 @@
+"""
+Compare chunk encoding throughput (chunks/sec) on CPU between the former
+one-chunk-at-a-time loop and the batched document_embedding
+
+For the batched encoding, also report tokens/sec and the padding overhead
+of length-sorted batches against batches built in arrival order
+
+If article_markdown.csv (see get_markdown_papers.py) is available, chunks
+are taken from the stored papers; otherwise synthetic chunks are used
+"""
+
+import os
+
+# Hide GPUs so that the benchmark measures CPU throughput
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+import sys
+import time
+import numpy as np
+import pandas as pd
+from typing import Final, List
+from sentence_transformers import SentenceTransformer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ragxiv.embedding import (
+    ChunkParams,
+    chunk_document,
+    chunk_token_lengths,
+    document_embedding,
+    load_embedding_model,
+)
+from ragxiv.utils import normalize_vector
+
+EMBEDDING_MODEL_NAME: Final = "multi-qa-mpnet-base-dot-v1"
+MARKDOWN_ARTICLES_PATH = "article_markdown.csv"
+NUMBER_CHUNKS = 300
+BATCH_SIZES = [8, 16, 32, 64]
+
+
+def load_benchmark_chunks(number_chunks: int) -> List[str]:
+    chunk_parameters = ChunkParams(method="MarkdownTextSplitter", size=500, overlap=50)
+    chunks: List[str] = []
+    if os.path.exists(MARKDOWN_ARTICLES_PATH):
+        markdown_text = pd.read_csv(MARKDOWN_ARTICLES_PATH, sep=";")
+        for document in markdown_text["article"]:
+            chunks += chunk_document(document=document, chunk_params=chunk_parameters)
+            if len(chunks) >= number_chunks:
+                break
+    else:
+        sentence = "Momentum strategies rank assets by their past returns. "
+        chunks = [sentence * (1 + i % 9) for i in range(number_chunks)]
+    return chunks[:number_chunks]
+
+
+def legacy_embedding(chunks: List[str], embedding_model: str) -> np.ndarray:
+    """Former implementation: one forward pass and one copy per chunk"""
+    embedding_transformer = SentenceTransformer(embedding_model)
+    word_embedding_dimension = embedding_transformer.get_sentence_embedding_dimension()
+
+    document_embeddings = np.empty(shape=(0, word_embedding_dimension))
+    for chunk in chunks:
+        chunk_embedding = embedding_transformer.encode(chunk)
+        chunk_embedding = normalize_vector(chunk_embedding)
+        document_embeddings = np.vstack((document_embeddings, chunk_embedding))
+    return document_embeddings
+
+
+def arrival_order_padding_overhead(token_lengths: np.ndarray, batch_size: int) -> float:
+    """Share of padding tokens if batches were built in arrival order"""
+    padded_tokens = sum(
+        token_lengths[start : start + batch_size].max()
+        * len(token_lengths[start : start + batch_size])
+        for start in range(0, len(token_lengths), batch_size)
+    )
+    return 1 - token_lengths.sum() / padded_tokens
+
+
+chunks = load_benchmark_chunks(number_chunks=NUMBER_CHUNKS)
+print(f"Benchmarking {len(chunks)} chunks with {EMBEDDING_MODEL_NAME} on CPU")
+
+# Load the model once so that download time is not measured
+token_lengths = chunk_token_lengths(chunks, load_embedding_model(EMBEDDING_MODEL_NAME))
+
+ini_time = time.perf_counter()
+reference_embeddings = legacy_embedding(
+    chunks=chunks, embedding_model=EMBEDDING_MODEL_NAME
+)
+elapsed_time = time.perf_counter() - ini_time
+print(f"- one chunk at a time: {len(chunks) / elapsed_time:.1f} chunks/sec")
+
+for batch_size in BATCH_SIZES:
+    ini_time = time.perf_counter()
+    embedding = document_embedding(
+        chunks=chunks, embedding_model=EMBEDDING_MODEL_NAME, batch_size=batch_size
+    )
+    elapsed_time = time.perf_counter() - ini_time
+
+    # Batched and single encodings should agree up to padding noise
+    max_difference = np.abs(embedding["embedding"] - reference_embeddings).max()
+    stats = embedding["stats"]
+    print(
+        f"- batch_size={batch_size}: {len(chunks) / elapsed_time:.1f} chunks/sec,"
+        f" {stats['tokens_per_sec']:.0f} tokens/sec,"
+        f" padding overhead {stats['padding_overhead']:.1%}"
+        f" (arrival order: {arrival_order_padding_overhead(token_lengths, batch_size):.1%}),"
+        f" max abs difference {max_difference:.2e}"
+    )
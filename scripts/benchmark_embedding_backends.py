@@ -0,0 +1,99 @@
+"""
+Compare the CPU inference backends available for embedding models
+
+For each backend, report:
+- parity: cosine agreement of its embeddings against the FP32 torch model
+- latency of single query encoding (p50 / p95)
+- throughput of batched chunk encoding (chunks/sec)
+
+The onnx backend requires onnxruntime and onnx to be installed
+"""
+
+import os
+
+# Hide GPUs so that every backend is measured on CPU
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+import sys
+import time
+import numpy as np
+import pandas as pd
+from typing import Final, List
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ragxiv.backends import EmbeddingBackend, load_model_backend
+from ragxiv.embedding import ChunkParams, chunk_document
+from ragxiv.utils import normalize_matrix
+
+EMBEDDING_MODEL_NAME: Final = "multi-qa-mpnet-base-dot-v1"
+BACKENDS: List[EmbeddingBackend] = ["torch", "onnx", "int8"]
+MARKDOWN_ARTICLES_PATH = "article_markdown.csv"
+NUMBER_CHUNKS = 256
+NUMBER_QUERIES = 50
+BATCH_SIZE = 32
+
+QUERIES = [
+    "What are risk parity portfolios?",
+    "How are financial derivatives priced?",
+    "How is risk measured in finance?",
+    "What is the momentum of a stock?",
+    "How detect trend (or momentum) in financial assets?",
+]
+
+
+def load_benchmark_chunks(number_chunks: int) -> List[str]:
+    chunk_parameters = ChunkParams(method="MarkdownTextSplitter", size=500, overlap=50)
+    chunks: List[str] = []
+    if os.path.exists(MARKDOWN_ARTICLES_PATH):
+        markdown_text = pd.read_csv(MARKDOWN_ARTICLES_PATH, sep=";")
+        for document in markdown_text["article"]:
+            chunks += chunk_document(document=document, chunk_params=chunk_parameters)
+            if len(chunks) >= number_chunks:
+                break
+    else:
+        sentence = "Momentum strategies rank assets by their past returns. "
+        chunks = [sentence * (1 + i % 9) for i in range(number_chunks)]
+    return chunks[:number_chunks]
+
+
+chunks = load_benchmark_chunks(number_chunks=NUMBER_CHUNKS)
+
+results = {}
+reference_embeddings = None
+for backend in BACKENDS:
+    try:
+        model = load_model_backend(model_name=EMBEDDING_MODEL_NAME, backend=backend)
+    except ImportError as e:
+        print(f"Skipping {backend}: {e}")
+        continue
+
+    # Warm-up
+    model.encode(QUERIES[0])
+
+    # Query latency
+    latencies = []
+    for i in range(NUMBER_QUERIES):
+        ini_time = time.perf_counter()
+        model.encode(QUERIES[i % len(QUERIES)])
+        latencies.append(1000 * (time.perf_counter() - ini_time))
+
+    # Chunk throughput
+    ini_time = time.perf_counter()
+    embeddings = model.encode(chunks, batch_size=BATCH_SIZE, convert_to_numpy=True)
+    elapsed_time = time.perf_counter() - ini_time
+    embeddings = normalize_matrix(np.asarray(embeddings, dtype=np.float32))
+
+    # Parity against FP32 torch (first backend)
+    if reference_embeddings is None:
+        reference_embeddings = embeddings
+    cosine = (embeddings * reference_embeddings).sum(axis=1)
+
+    results[backend] = {
+        "query_p50_ms": np.percentile(latencies, 50),
+        "query_p95_ms": np.percentile(latencies, 95),
+        "chunks_per_sec": len(chunks) / elapsed_time,
+        "cosine_mean": cosine.mean(),
+        "cosine_min": cosine.min(),
+    }
+
+print(pd.DataFrame(results).T.round(4))
@@ -0,0 +1,175 @@
+"""
+Compare keyword search latency (pg_text_article) before and after the
+stored tsvector column, using the evaluation questions as queries
+
+- before: to_tsvector computed per row in both WHERE and ts_rank_cd, with
+  an OR-query built by regex (on the chunks embedded in the article table)
+- after: keyword_search_postgres, ranking every match on the GIN-indexed
+  content_tsv column with websearch_to_tsquery
+- bounded: keyword_search_postgres ranking only the
+  TEXT_SEARCH_MAX_CANDIDATES most recently stored matches (the default),
+  an approximation compared against the "after" results
+
+Every run also reports the hit rate (relevant paper among the results) and
+the overlap of its results with the "after" results
+"""
+
+import os
+import re
+import sys
+import ast
+import time
+import numpy as np
+import pandas as pd
+from dotenv import dotenv_values
+from typing import Callable, Dict, Final, List, Optional, Tuple
+import psycopg
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ragxiv.database import (
+    ARTICLES_TABLE,
+    CHUNKS_TABLE,
+    TEXT_SEARCH_MAX_CANDIDATES,
+    PostgresParams,
+    TextSearch,
+    add_text_search_column,
+    get_article_id_data,
+    keyword_search_postgres,
+    open_db_connection,
+)
+
+environment = dotenv_values("./local_env")
+
+PATH_EVALUATION_QUESTIONS = "metadata_evaluation_questions_725_fixed.csv"
+EMBEDDING_MODEL_NAME: Final = "multi-qa-mpnet-base-dot-v1"
+TABLE_EMBEDDING_ARTICLE = f"embedding_article_{EMBEDDING_MODEL_NAME}".replace("-", "_")
+NUMBER_QUESTIONS = 300
+MAX_DOCUMENTS = 3
+
+postgres_connection_params = PostgresParams(
+    host=environment["POSTGRES_HOST"],
+    port=environment["POSTGRES_PORT"],
+    user=environment["POSTGRES_USER"],
+    pwd=environment["POSTGRES_PWD"],
+    database=environment["POSTGRES_DB"],
+)
+conn = open_db_connection(connection_params=postgres_connection_params, autocommit=True)
+if conn is None:
+    sys.exit("Unable to connect to the database")
+
+
+def load_evaluation_questions(
+    conn: psycopg.Connection, number_questions: int
+) -> List[Tuple[str, str]]:
+    """(article_id, question) pairs of papers stored in the database"""
+    evaluation_questions = pd.read_csv(
+        PATH_EVALUATION_QUESTIONS, index_col=[0], sep=";"
+    )
+    stored_ids = set(get_article_id_data(conn=conn, table_name=TABLE_EMBEDDING_ARTICLE))
+    pairs = []
+    for _, row in evaluation_questions.iterrows():
+        if row["document_id"] not in stored_ids:
+            continue
+        raw_questions = row["questions"].replace('"["', '["').replace('"]"', '"]')
+        try:
+            questions = ast.literal_eval(raw_questions)
+        except Exception:
+            questions = ast.literal_eval(raw_questions.replace("[", '["'))
+        pairs += [(row["document_id"], question) for question in questions]
+    return pairs[:number_questions]
+
+
+def keyword_search_legacy(
+    conn: psycopg.Connection, query: str, table_name: str, max_documents: int
+) -> List[str]:
+    """keyword_search_postgres before the stored tsvector column"""
+    query = re.sub(r"[^a-zA-Z0-9\s]", "", query)
+    query_use = query.replace(" ", " | ")
+    query_use = re.sub(r"\|\s*$", "", query_use)
+    query_use = query_use.replace(" |  | ", " | ")
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT a.arxiv_id, c.content, e.embedding FROM {CHUNKS_TABLE} c JOIN {table_name} e ON e.chunk_id = c.id JOIN {ARTICLES_TABLE} a ON a.id = c.article_id, to_tsquery('english', %s) query WHERE to_tsvector('english', c.content) @@ query ORDER BY ts_rank_cd(to_tsvector('english', c.content), query) DESC LIMIT {max_documents}",
+            (query_use,),
+        )
+        return [row[0] for row in cur.fetchall()]
+
+
+def keyword_search_stored(
+    conn: psycopg.Connection,
+    query: str,
+    table_name: str,
+    max_documents: int,
+    max_candidates: Optional[int] = None,
+) -> List[str]:
+    search_results = keyword_search_postgres(
+        conn=conn,
+        text_search_params=TextSearch(
+            query=query,
+            table=table_name,
+            max_documents=max_documents,
+            max_candidates=max_candidates,
+        ),
+    )
+    return [result["article_id"] for result in search_results]
+
+
+def keyword_search_bounded(
+    conn: psycopg.Connection, query: str, table_name: str, max_documents: int
+) -> List[str]:
+    return keyword_search_stored(
+        conn,
+        query,
+        table_name,
+        max_documents,
+        max_candidates=TEXT_SEARCH_MAX_CANDIDATES,
+    )
+
+
+add_text_search_column(conn=conn)
+conn.execute(f"ANALYZE {CHUNKS_TABLE}")
+evaluation_pairs = load_evaluation_questions(
+    conn=conn, number_questions=NUMBER_QUESTIONS
+)
+
+searches: List[Tuple[str, Callable[[psycopg.Connection, str, str, int], List[str]]]] = [
+    ("after", keyword_search_stored),
+    ("before", keyword_search_legacy),
+    ("bounded", keyword_search_bounded),
+]
+results = {}
+retrieved: Dict[str, List[List[str]]] = {}
+for name, search in searches:
+    latencies = []
+    hits = []
+    retrieved[name] = []
+    for article_id, question in evaluation_pairs:
+        ini_time = time.perf_counter()
+        try:
+            retrieved_ids = search(
+                conn, question, TABLE_EMBEDDING_ARTICLE, MAX_DOCUMENTS
+            )
+        except Exception as e:
+            # The legacy regex can still produce invalid tsquery syntax
+            print(f"{name}: {e}")
+            retrieved_ids = []
+        latencies.append(1000 * (time.perf_counter() - ini_time))
+        hits.append(article_id in retrieved_ids)
+        retrieved[name].append(retrieved_ids)
+
+    results[name] = {
+        "p50_ms": np.percentile(latencies, 50),
+        "p95_ms": np.percentile(latencies, 95),
+        "mean_ms": np.mean(latencies),
+        "hit_rate": np.mean(hits),
+        # Share of the results of ranking every match that are also found
+        "overlap_after": np.mean(
+            [
+                len(set(found) & set(full)) / max(len(set(full)), 1)
+                for found, full in zip(retrieved[name], retrieved["after"])
+            ]
+        ),
+    }
+
+print(f"{len(evaluation_pairs)} questions")
+print(pd.DataFrame(results).T.round(4))
@@ -0,0 +1,131 @@
+"""
+Compare the binary-quantized prefilter against the full-vector search of
+the article embeddings
+
+The binary column and its Hamming index are added to the article table if
+missing. For the evaluation questions, the script reports for the full
+vectors and for several binary oversampling factors:
+- recall@k against the full-vector results
+- hit rate of the article the question was generated from
+- mean query latency
+- size of the index searched first
+"""
+
+import os
+import sys
+import ast
+import time
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from typing import Dict, Final, List, Optional, Set
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ragxiv.database import (
+    BINARY_EMBEDDING_COLUMN,
+    PostgresParams,
+    SemanticSearch,
+    add_binary_embedding_column,
+    get_article_id_data,
+    open_db_connection,
+    semantic_search_postgres,
+)
+from ragxiv.embedding import encode_queries
+
+load_dotenv("./.env")
+
+PATH_EVALUATION_QUESTIONS = "metadata_evaluation_questions_725_fixed.csv"
+EMBEDDING_MODEL_NAME: Final = "multi-qa-mpnet-base-dot-v1"
+TABLE_EMBEDDING_ARTICLE = f"embedding_article_{EMBEDDING_MODEL_NAME}".replace("-", "_")
+SIMILARITY_METRIC: Final = "<#>"
+MAX_DOCUMENTS = 10
+OVERSAMPLING_FACTORS = [1, 4, 10, 20]
+
+postgres_connection_params = PostgresParams(
+    host=os.environ["POSTGRES_HOST"],
+    port=os.environ["POSTGRES_PORT"],
+    user=os.environ["POSTGRES_USER"],
+    pwd=os.environ["POSTGRES_PWD"],
+    database=os.environ["POSTGRES_DB"],
+)
+conn = open_db_connection(connection_params=postgres_connection_params, autocommit=True)
+if conn is None:
+    sys.exit("Unable to connect to the database")
+
+add_binary_embedding_column(conn=conn, table_name=TABLE_EMBEDDING_ARTICLE)
+conn.execute(f"ANALYZE {TABLE_EMBEDDING_ARTICLE}")
+
+# Evaluation questions of the papers stored in the database
+evaluation_questions = pd.read_csv(PATH_EVALUATION_QUESTIONS, index_col=[0], sep=";")
+document_ids = set(get_article_id_data(conn=conn, table_name=TABLE_EMBEDDING_ARTICLE))
+evaluation_pairs = []
+for _, row in evaluation_questions.iterrows():
+    if row["document_id"] not in document_ids:
+        continue
+    try:
+        questions = ast.literal_eval(
+            row["questions"].replace('"["', '["').replace('"]"', '"]')
+        )
+    except Exception:
+        continue
+    evaluation_pairs += [(row["document_id"], question) for question in questions]
+
+# Encode every question once so that latency only measures the search
+encode_queries(
+    queries=[question for _, question in evaluation_pairs],
+    embedding_model=EMBEDDING_MODEL_NAME,
+)
+
+configurations: Dict[str, Optional[int]] = {"vector": None}
+for factor in OVERSAMPLING_FACTORS:
+    configurations[f"binary_x{factor}"] = factor
+
+results = {}
+retrieved: Dict[str, List[Set[int]]] = {}
+for name, oversampling in configurations.items():
+    latencies = []
+    hits = []
+    retrieved[name] = []
+    for original_id, question in evaluation_pairs:
+        semantic_search = SemanticSearch(
+            query=question,
+            table=TABLE_EMBEDDING_ARTICLE,
+            similarity_metric=SIMILARITY_METRIC,
+            embedding_model=EMBEDDING_MODEL_NAME,
+            max_documents=MAX_DOCUMENTS,
+        )
+        if oversampling is not None:
+            semantic_search["binary_quantization"] = True
+            semantic_search["binary_oversampling"] = oversampling
+
+        ini_time = time.perf_counter()
+        search_results, _ = semantic_search_postgres(
+            conn=conn, semantic_search_params=semantic_search
+        )
+        latencies.append(1000 * (time.perf_counter() - ini_time))
+        retrieved[name].append({row["chunk_id"] for row in search_results})
+        hits.append(original_id in {row["article_id"] for row in search_results})
+
+    index_name = (
+        f"{TABLE_EMBEDDING_ARTICLE}_embedding_idx"
+        if oversampling is None
+        else f"{TABLE_EMBEDDING_ARTICLE}_{BINARY_EMBEDDING_COLUMN}_idx"
+    )
+    index_size = conn.execute(
+        "SELECT pg_relation_size(to_regclass(%s))", (index_name,)
+    ).fetchone()[0]
+    results[name] = {
+        f"recall@{MAX_DOCUMENTS}": np.mean(
+            [
+                len(found & full) / max(len(full), 1)
+                for found, full in zip(retrieved[name], retrieved["vector"])
+            ]
+        ),
+        "hit_rate": np.mean(hits),
+        "mean_latency_ms": np.mean(latencies),
+        "p95_latency_ms": np.percentile(latencies, 95),
+        "index_size_mb": (index_size or 0) / 2**20,
+    }
+
+print(f"{len(evaluation_pairs)} evaluation questions")
+print(pd.DataFrame(results).T.round(4))
@@ -0,0 +1,137 @@
+"""
+Compare half-precision (halfvec) against full-precision (vector) storage
+of the article embeddings
+
+A halfvec copy of the article table is created, both tables get an HNSW
+index, and for a sample of queries (abstracts stored in the database) the
+script reports:
+- recall@k of the halfvec results against the full-precision results
+- mean query latency
+- table and index size
+"""
+
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from typing import Dict, Final, List, Set, Tuple
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ragxiv.database import (
+    CHUNKS_TABLE,
+    EmbeddingPrecision,
+    PostgresParams,
+    SemanticSearch,
+    create_vector_index,
+    open_db_connection,
+    semantic_search_postgres,
+)
+
+load_dotenv("./.env")
+
+EMBEDDING_MODEL_NAME: Final = "multi-qa-mpnet-base-dot-v1"
+TABLE_EMBEDDING_ARTICLE = f"embedding_article_{EMBEDDING_MODEL_NAME}".replace("-", "_")
+TABLE_EMBEDDING_ABSTRACT = f"embedding_abstract_{EMBEDDING_MODEL_NAME}".replace(
+    "-", "_"
+)
+TABLE_EMBEDDING_ARTICLE_HALFVEC = f"{TABLE_EMBEDDING_ARTICLE}_halfvec"
+SIMILARITY_METRIC: Final = "<#>"
+NUMBER_QUERIES = 200
+MAX_DOCUMENTS = 10
+
+postgres_connection_params = PostgresParams(
+    host=os.environ["POSTGRES_HOST"],
+    port=os.environ["POSTGRES_PORT"],
+    user=os.environ["POSTGRES_USER"],
+    pwd=os.environ["POSTGRES_PWD"],
+    database=os.environ["POSTGRES_DB"],
+)
+conn = open_db_connection(connection_params=postgres_connection_params, autocommit=True)
+if conn is None:
+    sys.exit("Unable to connect to the database")
+
+# Create half-precision copy of the article table
+embedding_dimension = conn.execute(
+    f"SELECT vector_dims(embedding) FROM {TABLE_EMBEDDING_ARTICLE} LIMIT 1"
+).fetchone()[0]
+conn.execute(f"DROP TABLE IF EXISTS {TABLE_EMBEDDING_ARTICLE_HALFVEC}")
+conn.execute(
+    f"""
+    CREATE TABLE {TABLE_EMBEDDING_ARTICLE_HALFVEC} AS
+    SELECT chunk_id, embedding::halfvec({embedding_dimension}) AS embedding
+    FROM {TABLE_EMBEDDING_ARTICLE}
+    """
+)
+conn.execute(
+    f"ALTER TABLE {TABLE_EMBEDDING_ARTICLE_HALFVEC} ADD PRIMARY KEY (chunk_id)"
+)
+create_vector_index(
+    conn=conn,
+    table_name=TABLE_EMBEDDING_ARTICLE,
+    similarity_metric=SIMILARITY_METRIC,
+    precision="vector",
+)
+create_vector_index(
+    conn=conn,
+    table_name=TABLE_EMBEDDING_ARTICLE_HALFVEC,
+    similarity_metric=SIMILARITY_METRIC,
+    precision="halfvec",
+)
+conn.execute(f"ANALYZE {TABLE_EMBEDDING_ARTICLE}")
+conn.execute(f"ANALYZE {TABLE_EMBEDDING_ARTICLE_HALFVEC}")
+
+# Use stored abstracts as queries
+conn.execute("SELECT setseed(0.42)")
+queries = [
+    row[0]
+    for row in conn.execute(
+        f"SELECT c.content FROM {CHUNKS_TABLE} c JOIN {TABLE_EMBEDDING_ABSTRACT} e ON e.chunk_id = c.id ORDER BY random() LIMIT {NUMBER_QUERIES}"
+    ).fetchall()
+]
+
+precision_tables: List[Tuple[str, EmbeddingPrecision]] = [
+    (TABLE_EMBEDDING_ARTICLE, "vector"),
+    (TABLE_EMBEDDING_ARTICLE_HALFVEC, "halfvec"),
+]
+results = {}
+retrieved: Dict[str, List[Set[int]]] = {}
+for table_name, precision in precision_tables:
+    latencies = []
+    retrieved[precision] = []
+    for query in queries:
+        semantic_search = SemanticSearch(
+            query=query,
+            table=table_name,
+            similarity_metric=SIMILARITY_METRIC,
+            embedding_model=EMBEDDING_MODEL_NAME,
+            max_documents=MAX_DOCUMENTS,
+            embedding_precision=precision,
+        )
+        # Encode once so that latency only measures the database search
+        semantic_search_postgres(conn=conn, semantic_search_params=semantic_search)
+        ini_time = time.perf_counter()
+        search_results, _ = semantic_search_postgres(
+            conn=conn, semantic_search_params=semantic_search
+        )
+        latencies.append(1000 * (time.perf_counter() - ini_time))
+        retrieved[precision].append({row["chunk_id"] for row in search_results})
+
+    table_size, index_size = conn.execute(
+        "SELECT pg_table_size(%s), pg_indexes_size(%s)", (table_name, table_name)
+    ).fetchone()
+    results[precision] = {
+        "mean_latency_ms": np.mean(latencies),
+        "table_size_mb": table_size / 2**20,
+        "index_size_mb": index_size / 2**20,
+    }
+
+recall = [
+    len(half & full) / max(len(full), 1)
+    for half, full in zip(retrieved["halfvec"], retrieved["vector"])
+]
+results["vector"][f"recall@{MAX_DOCUMENTS}"] = 1.0
+results["halfvec"][f"recall@{MAX_DOCUMENTS}"] = np.mean(recall)
+
+print(pd.DataFrame(results).T.round(4))
@@ -0,0 +1,47 @@
+"""
+Remove the duplicated chunks of a database loaded before chunks were keyed
+by paper, chunking and position
+
+Loading the same paper twice used to store its chunks twice. Chunks with
+the same paper and text are merged into one, their embedding rows are moved
+to the kept chunk (or deleted when it already has one), and the number of
+rows removed from each table is reported. The chunk key columns are added
+first if the tables predate them (update_database.py and
+initialize_postgres_database.py add them too, but do not merge the
+duplicates). Run it once
+"""
+
+import os
+import sys
+from dotenv import load_dotenv
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ragxiv.database import (
+    PostgresParams,
+    create_content_tables,
+    deduplicate_chunks,
+    open_db_connection,
+)
+
+load_dotenv("./.env")
+
+postgres_connection_params = PostgresParams(
+    host=os.environ["POSTGRES_HOST"],
+    port=os.environ["POSTGRES_PORT"],
+    user=os.environ["POSTGRES_USER"],
+    pwd=os.environ["POSTGRES_PWD"],
+    database=os.environ["POSTGRES_DB"],
+)
+conn = open_db_connection(connection_params=postgres_connection_params, autocommit=True)
+
+if conn:
+    # Add the chunk key columns if the tables predate them
+    create_content_tables(conn=conn)
+
+    removed = deduplicate_chunks(conn=conn)
+    for table_name, rows in removed.items():
+        print(f"{table_name}: removed {rows} rows")
+    print(f"Removed {sum(removed.values())} rows in total")
+
+    for table_name in removed:
+        conn.execute(f"VACUUM ANALYZE {table_name}")
@@ -12,15 +12,18 @@ import json
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from ragxiv.database import (
     open_db_connection,
+    get_article_id_data,
     PostgresParams,
     SemanticSearch,
 )
 from ragxiv.retrieval import retrieve_similar_documents
+from ragxiv.cache import configure_query_cache
 from ragxiv.llm import llm_chat_completion, GroqParams, build_rag_prompt, GroqModels
 
 environment = dotenv_values("./local_env")
 
 PATH_EVALUATION_QUESTIONS = "metadata_evaluation_questions_725_fixed.csv"
+PATH_QUERY_EMBEDDING_CACHE = "query_embedding_cache.sqlite"
 
 POSTGRES_USER = environment["POSTGRES_USER"]
 POSTGRES_PWD = environment["POSTGRES_PWD"]
@@ -65,6 +68,9 @@ def get_rag_evaluation_prompt(question: str, answer_llm: str) -> str:
     return rag_evaluation_prompt
 
 
+# Reuse question embeddings between evaluation runs
+query_cache = configure_query_cache(path=PATH_QUERY_EMBEDDING_CACHE)
+
 # Read evaluation questions
 evaluation_questions = pd.read_csv(PATH_EVALUATION_QUESTIONS, index_col=[0], sep=";")
 
@@ -109,11 +115,7 @@ conn = open_db_connection(connection_params=postgres_connection_params, autocomm
 
 # Get article_id's from database
 if conn is not None:
-    cur = conn.cursor()
-    cur.execute(f"SELECT article_id FROM {TABLE_EMBEDDING_ABSTRACT}")
-    document_ids = cur.fetchall()
-    document_ids = [doc_id[0] for doc_id in document_ids]
-    cur.close()
+    document_ids = get_article_id_data(conn=conn, table_name=TABLE_EMBEDDING_ABSTRACT)
 
 # Filter evaluation questions using article_id from database
 frame_evaluation_filt = frame_evaluation.loc[document_ids, :]
@@ -231,3 +233,4 @@ print(final_metrics)
 pd.DataFrame(final_metrics).to_csv(
     f"comparison_rag_methods_{frame_evaluation_filt.shape[0]}.csv", sep=";"
 )
+print(f"Query embedding cache: {query_cache.stats()}")
@@ -11,16 +11,20 @@ from tqdm.auto import tqdm
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from ragxiv.database import (
     open_db_connection,
+    get_article_id_data,
     PostgresParams,
     SemanticSearch,
     TextSearch,
+    semantic_search_postgres_batch,
 )
 from ragxiv.retrieval import retrieve_similar_documents
+from ragxiv.cache import configure_query_cache
 
 # load_dotenv("./local_env")
 environment = dotenv_values("./local_env")
 
 PATH_EVALUATION_QUESTIONS = "metadata_evaluation_questions_725_fixed.csv"
+PATH_QUERY_EMBEDDING_CACHE = "query_embedding_cache.sqlite"
 
 # Default embedding parameters
 EMBEDDING_MODEL_NAME: Final = "multi-qa-mpnet-base-dot-v1"
@@ -38,6 +42,13 @@ POSTGRES_PORT = environment["POSTGRES_PORT"]
 
 RETRIEVAL_METHOD: Final = "pg_semantic_abstract+article"
 
+# Version of the fitted dimensionality reduction to search with (see
+# fit_embedding_reduction.py); None searches the full vectors
+REDUCTION_VERSION = None
+
+# Reuse question embeddings between evaluation runs
+query_cache = configure_query_cache(path=PATH_QUERY_EMBEDDING_CACHE)
+
 # Load LLM-generated questions for each id
 evaluation_questions = pd.read_csv(PATH_EVALUATION_QUESTIONS, index_col=[0], sep=";")
 
@@ -83,11 +94,7 @@ conn = open_db_connection(connection_params=postgres_connection_params, autocomm
 
 # Get article_id's from database
 if conn is not None:
-    cur = conn.cursor()
-    cur.execute(f"SELECT article_id FROM {TABLE_EMBEDDING_ABSTRACT}")
-    document_ids = cur.fetchall()
-    document_ids = [doc_id[0] for doc_id in document_ids]
-    cur.close()
+    document_ids = get_article_id_data(conn=conn, table_name=TABLE_EMBEDDING_ABSTRACT)
 
 # Filter evaluation questions using article_id from database
 frame_evaluation_filt = frame_evaluation.loc[document_ids, :]
@@ -124,71 +131,78 @@ for retrieval_method in RETRIEVAL_METHOD_LIST:
         print(f"{retrieval_method} already obtained")
     except Exception as e:
         print(e)
-        # Loop over each article id; for each question
-        # search for similar documents and check if the
+        # Search for similar documents to each question and check if the
         # original document is retrieved
-        retrieved_documents = []
-        for original_id, row in tqdm(
-            frame_evaluation_filt.iterrows(), total=frame_evaluation_filt.shape[0]
-        ):
-            for question in row:
-                if retrieval_method == "pg_semantic_abstract+article":
-                    semantic_search_abstract = SemanticSearch(
-                        query=question,
-                        table=TABLE_EMBEDDING_ABSTRACT,
-                        similarity_metric="<#>",
-                        embedding_model=EMBEDDING_MODEL_NAME,
-                        max_documents=3,
-                    )
-                    retrieval_parameters = [
-                        semantic_search_abstract,
-                        semantic_search_abstract,
-                    ]
-                elif retrieval_method == "pg_semantic_article":
-                    semantic_search_article = SemanticSearch(
-                        query=question,
-                        table=TABLE_EMBEDDING_ARTICLE,
-                        similarity_metric="<#>",
-                        embedding_model=EMBEDDING_MODEL_NAME,
-                        max_documents=3,
-                    )
-                    retrieval_parameters = [semantic_search_article]
-                elif retrieval_method == "pg_text_article":
-                    text_search_article = SemanticSearch(
-                        query=question,
-                        table=TABLE_EMBEDDING_ARTICLE,
-                        similarity_metric="<#>",
-                        embedding_model=EMBEDDING_MODEL_NAME,
-                        max_documents=3,
-                    )
-                    retrieval_parameters = [text_search_article]
-
+        evaluation_pairs = [
+            (original_id, question)
+            for original_id, row in frame_evaluation_filt.iterrows()
+            for question in row
+        ]
+        questions = [question for _, question in evaluation_pairs]
+
+        if retrieval_method == "pg_text_article":
+            list_id_retrieved_documents = []
+            for question in tqdm(questions):
+                text_search_article = TextSearch(
+                    query=question,
+                    table=TABLE_EMBEDDING_ARTICLE,
+                    max_documents=3,
+                )
                 relevant_documents = retrieve_similar_documents(
                     conn=conn,
                     retrieval_method=retrieval_method,
-                    retrieval_parameters=retrieval_parameters,
+                    retrieval_parameters=[text_search_article],
                 )
+                list_id_retrieved_documents.append(relevant_documents["references"])
+        else:
+            # The references of the hierarchical method are the articles of
+            # the abstracts found, so both semantic methods are evaluated
+            # with a batched search on a single table
+            table_name = (
+                TABLE_EMBEDDING_ABSTRACT
+                if retrieval_method == "pg_semantic_abstract+article"
+                else TABLE_EMBEDDING_ARTICLE
+            )
+            semantic_search = SemanticSearch(
+                query="",
+                table=table_name,
+                similarity_metric="<#>",
+                embedding_model=EMBEDDING_MODEL_NAME,
+                max_documents=3,
+                reduction_version=REDUCTION_VERSION,
+            )
+            search_results, _ = semantic_search_postgres_batch(
+                conn=conn,
+                queries=questions,
+                semantic_search_params=semantic_search,
+            )
+            list_id_retrieved_documents = [
+                [result["article_id"] for result in results]
+                for results in search_results
+            ]
 
-                id_retrieved_documents = relevant_documents["references"]
-
-                # Hit rate
-                hit_rate_row = original_id in id_retrieved_documents
-
-                # Mean-reciprocal rank
-                try:
-                    position = id_retrieved_documents.index(original_id)
-                    mean_reciprocal_rank_row = 1 / (position + 1)
-                except ValueError:
-                    mean_reciprocal_rank_row = 0
-
-                evaluation = EvaluationRetrieval(
-                    original_id=original_id,
-                    evaluation_question=question,
-                    id_retrieved_documents=id_retrieved_documents,
-                    hit_rate=hit_rate_row,
-                    mean_reciprocal_rank=mean_reciprocal_rank_row,
-                )
-                retrieved_documents.append(evaluation)
+        retrieved_documents = []
+        for (original_id, question), id_retrieved_documents in zip(
+            evaluation_pairs, list_id_retrieved_documents
+        ):
+            # Hit rate
+            hit_rate_row = original_id in id_retrieved_documents
+
+            # Mean-reciprocal rank
+            try:
+                position = id_retrieved_documents.index(original_id)
+                mean_reciprocal_rank_row = 1 / (position + 1)
+            except ValueError:
+                mean_reciprocal_rank_row = 0
+
+            evaluation = EvaluationRetrieval(
+                original_id=original_id,
+                evaluation_question=question,
+                id_retrieved_documents=id_retrieved_documents,
+                hit_rate=hit_rate_row,
+                mean_reciprocal_rank=mean_reciprocal_rank_row,
+            )
+            retrieved_documents.append(evaluation)
 
         frame_output = pd.DataFrame(retrieved_documents)
         frame_output.to_csv(
@@ -212,3 +226,4 @@ print(final_metrics)
 pd.DataFrame(final_metrics).to_csv(
     f"comparison_retrieval_methods_{frame_evaluation_filt.shape[0]}.csv", sep=";"
 )
+print(f"Query embedding cache: {query_cache.stats()}")
@@ -0,0 +1,77 @@
+"""
+Fit a dimensionality reduction on the stored embeddings and populate the
+reduced search column
+
+For each embedding table:
+- fit a PCA or random projection on (a sample of) its embeddings
+- save it as projections/<table>_v<version>.npz
+- add the versioned reduced column, project every row and index it
+
+Use the printed version as `reduction_version` in SemanticSearch (or
+rag.reduction_version in config.yaml) to search on the reduced column and
+re-rank on the full vectors
+"""
+
+import os
+import sys
+from dotenv import load_dotenv
+from typing import Final
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ragxiv.database import (
+    PostgresParams,
+    backfill_reduced_embeddings,
+    create_vector_index,
+    get_embedding_data,
+    open_db_connection,
+)
+from ragxiv.reduction import fit_projection, reduced_column_name, save_projection
+
+load_dotenv("./.env")
+
+EMBEDDING_MODEL_NAME: Final = "multi-qa-mpnet-base-dot-v1"
+TABLE_EMBEDDING_ARTICLE = f"embedding_article_{EMBEDDING_MODEL_NAME}".replace("-", "_")
+TABLE_EMBEDDING_ABSTRACT = f"embedding_abstract_{EMBEDDING_MODEL_NAME}".replace(
+    "-", "_"
+)
+REDUCTION_METHOD: Final = "pca"
+REDUCED_DIMENSION = 192
+MAX_FIT_ROWS = 50_000
+SIMILARITY_METRIC: Final = "<#>"
+
+postgres_connection_params = PostgresParams(
+    host=os.environ["POSTGRES_HOST"],
+    port=os.environ["POSTGRES_PORT"],
+    user=os.environ["POSTGRES_USER"],
+    pwd=os.environ["POSTGRES_PWD"],
+    database=os.environ["POSTGRES_DB"],
+)
+conn = open_db_connection(connection_params=postgres_connection_params, autocommit=True)
+
+if conn:
+    for table_name in [TABLE_EMBEDDING_ABSTRACT, TABLE_EMBEDDING_ARTICLE]:
+        embeddings = get_embedding_data(
+            conn=conn, table_name=table_name, max_rows=MAX_FIT_ROWS
+        )
+        projection = fit_projection(
+            embeddings=embeddings,
+            table=table_name,
+            method=REDUCTION_METHOD,
+            output_dimension=REDUCED_DIMENSION,
+        )
+        path = save_projection(projection)
+
+        rows_updated = backfill_reduced_embeddings(
+            conn=conn, table_name=table_name, projection=projection
+        )
+        create_vector_index(
+            conn=conn,
+            table_name=table_name,
+            similarity_metric=SIMILARITY_METRIC,
+            precision="vector",
+            column=reduced_column_name(projection),
+        )
+        print(
+            f"{table_name}: {REDUCTION_METHOD} to {REDUCED_DIMENSION} dims,"
+            f" version {projection['version']} ({path}), {rows_updated} rows projected"
+        )
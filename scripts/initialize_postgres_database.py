@@ -7,6 +7,7 @@ have been executed
 
 import os
 import sys
+import ast
 from dotenv import load_dotenv
 import pandas as pd
 from tqdm.auto import tqdm
@@ -14,15 +15,23 @@ from typing import Final
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from ragxiv.database import (
+    ABSTRACT_CHUNK_SET,
+    backfill_saved_projections,
     open_db_connection,
     create_embedding_table,
+    insert_article_metadata,
     insert_embedding_data,
+    create_vector_index,
     PostgresParams,
+    VectorIndexParams,
 )
+from ragxiv.cache import ChunkEmbeddingCache
+from ragxiv.ingest import PaperID
 from ragxiv.embedding import (
     PaperEmbedding,
     ChunkParams,
     chunk_document,
+    chunk_set_name,
     document_embedding,
 )
 
@@ -33,6 +42,10 @@ CHUNK_SIZE = 500
 CHUNK_OVERLAP = 50
 CHUNK_METHOD: Final = "MarkdownTextSplitter"
 EMBEDDING_MODEL_NAME: Final = "multi-qa-mpnet-base-dot-v1"
+EMBEDDING_BATCH_SIZE = 32
+EMBEDDING_PRECISION: Final = "vector"
+CHUNK_CACHE_DIR = "chunk_embedding_cache"
+VECTOR_INDEX_PARAMS = VectorIndexParams(method="hnsw", m=16, ef_construction=64)
 
 TABLE_EMBEDDING_ARTICLE = f"embedding_article_{EMBEDDING_MODEL_NAME}".replace("-", "_")
 TABLE_EMBEDDING_ABSTRACT = f"embedding_abstract_{EMBEDDING_MODEL_NAME}".replace(
@@ -59,6 +72,9 @@ postgres_connection_params = PostgresParams(
 
 # Load documents
 metadata = pd.read_csv(METADATA_PATH, sep=";")
+metadata["published"] = pd.to_datetime(metadata["published"])
+for column in ["authors", "categories"]:
+    metadata[column] = metadata[column].apply(ast.literal_eval)
 markdown_text = pd.read_csv(MARKDOWN_ARTICLES_PATH, sep=";")
 # Filter metadata by id
 metadata = metadata.loc[metadata["id"].isin(markdown_text["id"]), :]
@@ -74,6 +90,11 @@ chunk_parameters = ChunkParams(
     method=CHUNK_METHOD, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP
 )
 
+# Only encode chunks never seen in previous runs
+chunk_cache = ChunkEmbeddingCache(
+    directory=CHUNK_CACHE_DIR, model_name=EMBEDDING_MODEL_NAME
+)
+
 list_article_embeddings = []
 list_abstract_embeddings = []
 embedding_dimension = 0
@@ -87,12 +108,15 @@ for article in tqdm(markdown_text, total=len(markdown_text)):
 
     # Document embedding
     article_embedding = document_embedding(
-        chunks=document_chunks, embedding_model=EMBEDDING_MODEL_NAME
+        chunks=document_chunks,
+        embedding_model=EMBEDDING_MODEL_NAME,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        cache=chunk_cache,
     )
 
     # Abstract embedding
     abstract_embedding = document_embedding(
-        chunks=[abstract], embedding_model=EMBEDDING_MODEL_NAME
+        chunks=[abstract], embedding_model=EMBEDDING_MODEL_NAME, cache=chunk_cache
     )
 
     if embedding_dimension == 0:
@@ -104,6 +128,7 @@ for article in tqdm(markdown_text, total=len(markdown_text)):
             id=article_id,
             content=article_embedding["content"][i],
             embeddings=article_embedding["embedding"][i, :],
+            chunk_index=i,
         )
         list_article_embeddings.append(row_store)
 
@@ -112,9 +137,11 @@ for article in tqdm(markdown_text, total=len(markdown_text)):
             id=article_id,
             content=abstract_embedding["content"][i],
             embeddings=abstract_embedding["embedding"][i, :],
+            chunk_index=i,
         )
         list_abstract_embeddings.append(row_store)
 
+print(f"Chunk embedding cache: {chunk_cache.stats()}")
 
 # Open connection to database
 conn = open_db_connection(connection_params=postgres_connection_params, autocommit=True)
@@ -132,21 +159,62 @@ if conn:
         conn=conn,
         table_name=TABLE_EMBEDDING_ARTICLE,
         embedding_dimension=embedding_dimension,
+        precision=EMBEDDING_PRECISION,
     )
     create_embedding_table(
         conn=conn,
         table_name=TABLE_EMBEDDING_ABSTRACT,
         embedding_dimension=embedding_dimension,
+        precision=EMBEDDING_PRECISION,
     )
 
-    # Insert data into tables
+    # Insert paper metadata and data into tables
+    insert_article_metadata(
+        conn=conn,
+        papers=[
+            PaperID(
+                id=paper_id,
+                summary=paper["summary"],
+                authors=paper["authors"],
+                entry_url=paper["entry_url"],
+                published=paper["published"],
+                primary_category=paper["primary_category"],
+                categories=paper["categories"],
+            )
+            for paper_id, paper in metadata.to_dict(orient="index").items()
+        ],
+    )
     insert_embedding_data(
         conn=conn,
         table_name=TABLE_EMBEDDING_ARTICLE,
         paper_embedding=list_article_embeddings,
+        precision=EMBEDDING_PRECISION,
+        method="copy",
+        chunk_set=chunk_set_name(chunk_parameters),
     )
     insert_embedding_data(
         conn=conn,
         table_name=TABLE_EMBEDDING_ABSTRACT,
         paper_embedding=list_abstract_embeddings,
+        precision=EMBEDDING_PRECISION,
+        method="copy",
+        chunk_set=ABSTRACT_CHUNK_SET,
     )
+
+    # Build the vector indexes after the bulk load, which is faster than
+    # maintaining them row by row
+    for table_name in [TABLE_EMBEDDING_ARTICLE, TABLE_EMBEDDING_ABSTRACT]:
+        create_vector_index(
+            conn=conn,
+            table_name=table_name,
+            similarity_metric="<#>",
+            precision=EMBEDDING_PRECISION,
+            index_params=VECTOR_INDEX_PARAMS,
+        )
+
+    # Project the loaded rows on the projections already saved, otherwise
+    # their reduced columns stay NULL and reduced searches miss them
+    for table_name in [TABLE_EMBEDDING_ARTICLE, TABLE_EMBEDDING_ABSTRACT]:
+        rows_projected = backfill_saved_projections(conn=conn, table_name=table_name)
+        for version, rows in rows_projected.items():
+            print(f"{table_name}: {rows} rows projected on version {version}")
@@ -0,0 +1,169 @@
+"""
+Index maintenance around bulk loads
+
+Building an HNSW or GIN index once over loaded rows is much faster than
+updating it on every insert. Around a large update_database.py or
+initialize_postgres_database.py run:
+
+    python scripts/maintain_database.py defer
+    python update_database.py
+    python scripts/maintain_database.py rebuild
+
+Commands:
+- defer: drop the vector and GIN indexes, remembering their definitions
+- rebuild: build the deferred indexes with MAINTENANCE_WORK_MEM and
+  parallel maintenance workers, then ANALYZE the tables
+- reindex: REINDEX CONCURRENTLY the indexes, an online rebuild that keeps
+  serving searches meanwhile, then ANALYZE the tables
+- analyze: ANALYZE the tables
+- report: size of the indexes of each table
+
+Tables default to the articles, chunks and embedding tables of the model
+in config.yaml. Build time and size are reported per index and table
+"""
+
+import os
+import sys
+import time
+import argparse
+import pandas as pd
+import psycopg
+from dotenv import load_dotenv
+from typing import Final, List
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ragxiv.config import get_config
+from ragxiv.database import (
+    ARTICLES_TABLE,
+    CHUNKS_TABLE,
+    MAINTENANCE_WORK_MEM,
+    MAINTENANCE_WORKERS,
+    IndexReport,
+    PostgresParams,
+    defer_indexes,
+    get_index_size,
+    get_table_indexes,
+    open_db_connection,
+    rebuild_deferred_indexes,
+    reindex_concurrently,
+    set_maintenance_settings,
+)
+
+load_dotenv("./.env")
+
+config = get_config()
+if config:
+    config_ingestion = config["ingestion"]
+
+EMBEDDING_MODEL_NAME: Final = config_ingestion["embedding_model_name"]
+TABLE_EMBEDDING_ARTICLE = f"embedding_article_{EMBEDDING_MODEL_NAME}".replace("-", "_")
+TABLE_EMBEDDING_ABSTRACT = f"embedding_abstract_{EMBEDDING_MODEL_NAME}".replace(
+    "-", "_"
+)
+TABLES = [
+    ARTICLES_TABLE,
+    CHUNKS_TABLE,
+    TABLE_EMBEDDING_ARTICLE,
+    TABLE_EMBEDDING_ABSTRACT,
+]
+
+postgres_connection_params = PostgresParams(
+    host=os.environ["POSTGRES_HOST"],
+    port=os.environ["POSTGRES_PORT"],
+    user=os.environ["POSTGRES_USER"],
+    pwd=os.environ["POSTGRES_PWD"],
+    database=os.environ["POSTGRES_DB"],
+)
+
+parser = argparse.ArgumentParser(description="Index maintenance around bulk loads")
+parser.add_argument(
+    "command", choices=["defer", "rebuild", "reindex", "analyze", "report"]
+)
+parser.add_argument(
+    "--tables", nargs="+", default=TABLES, help="Tables to maintain (default: all)"
+)
+parser.add_argument(
+    "--maintenance-work-mem",
+    default=MAINTENANCE_WORK_MEM,
+    help=f"Memory of each index build (default: {MAINTENANCE_WORK_MEM})",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=MAINTENANCE_WORKERS,
+    help=f"Parallel maintenance workers (default: {MAINTENANCE_WORKERS})",
+)
+args = parser.parse_args()
+
+
+def analyze_tables(conn: psycopg.Connection, tables: List[str]):
+    for table_name in tables:
+        ini_time = time.perf_counter()
+        conn.execute(f"ANALYZE {table_name}")
+        print(f"ANALYZE {table_name}: {time.perf_counter() - ini_time:.1f} s")
+
+
+def print_index_reports(index_reports: List[IndexReport]):
+    if not index_reports:
+        print("No indexes built")
+        return
+    frame_reports = pd.DataFrame(index_reports)
+    print(frame_reports.round(2).to_string(index=False))
+    print(frame_reports.groupby("table")[["seconds", "size_mb"]].sum().round(2))
+
+
+# Autocommit: every index build is committed on its own, and REINDEX
+# CONCURRENTLY can not run inside a transaction
+conn = open_db_connection(connection_params=postgres_connection_params, autocommit=True)
+
+if conn:
+    if args.command == "defer":
+        for table_name in args.tables:
+            dropped = defer_indexes(conn=conn, table_name=table_name)
+            print(f"{table_name}: deferred {dropped}")
+
+    elif args.command == "rebuild":
+        set_maintenance_settings(
+            conn=conn,
+            maintenance_work_mem=args.maintenance_work_mem,
+            parallel_workers=args.workers,
+        )
+        index_reports = []
+        for table_name in args.tables:
+            index_reports += rebuild_deferred_indexes(conn=conn, table_name=table_name)
+        print_index_reports(index_reports)
+        analyze_tables(conn=conn, tables=args.tables)
+
+    elif args.command == "reindex":
+        set_maintenance_settings(
+            conn=conn,
+            maintenance_work_mem=args.maintenance_work_mem,
+            parallel_workers=args.workers,
+        )
+        index_reports = []
+        for table_name in args.tables:
+            index_reports += reindex_concurrently(conn=conn, table_name=table_name)
+        print_index_reports(index_reports)
+        analyze_tables(conn=conn, tables=args.tables)
+
+    elif args.command == "analyze":
+        analyze_tables(conn=conn, tables=args.tables)
+
+    elif args.command == "report":
+        rows = []
+        for table_name in args.tables:
+            for index_name, method, _ in get_table_indexes(
+                conn=conn,
+                table_name=table_name,
+                methods=("btree", "hnsw", "ivfflat", "gin"),
+            ):
+                rows.append(
+                    {
+                        "table": table_name,
+                        "index": index_name,
+                        "method": method,
+                        "size_mb": get_index_size(conn=conn, index_name=index_name)
+                        / 2**20,
+                    }
+                )
+        print(pd.DataFrame(rows).round(2).to_string(index=False))
@@ -0,0 +1,185 @@
+"""
+Migrate embedding tables from the previous schema, where every row stored
+article_id (text), content and embedding, to the normalized schema:
+- articles: one row per paper (arxiv_id plus metadata)
+- chunks: text of every chunk, stored once
+- embedding_<type>_<model>: chunk_id, primary_category and embedding
+
+For each legacy table, the papers and chunks are copied to articles and
+chunks (reusing the chunks already migrated from another table), the table
+is renamed to <table>_legacy and a new embedding table is filled from it.
+Reduced embedding columns are recomputed from their saved projections and
+the vector indexes are rebuilt with the parameters of config.yaml.
+
+Migrated papers have no metadata, which the next run of update_database.py
+fetches from arXiv (their embedding rows get their primary category then).
+Legacy tables are dropped only if DROP_LEGACY_TABLES is True
+"""
+
+import os
+import re
+import sys
+import psycopg
+from dotenv import load_dotenv
+from typing import Final, cast
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ragxiv.config import get_config
+from ragxiv.database import (
+    ARTICLES_TABLE,
+    CHUNKS_TABLE,
+    EmbeddingPrecision,
+    PostgresParams,
+    VectorIndexParams,
+    backfill_reduced_embeddings,
+    create_content_tables,
+    create_embedding_table,
+    create_vector_index,
+    open_db_connection,
+)
+from ragxiv.reduction import load_projection
+
+load_dotenv("./.env")
+
+config = get_config()
+if config:
+    config_ingestion = config["ingestion"]
+    config_index = config["index"]
+
+EMBEDDING_MODEL_NAME: Final = config_ingestion["embedding_model_name"]
+VECTOR_INDEX_PARAMS = VectorIndexParams(
+    method=config_index["method"],
+    m=config_index["m"],
+    ef_construction=config_index["ef_construction"],
+    lists=config_index["lists"],
+    binary_quantization=config_index.get("binary_quantization", False),
+)
+TABLE_EMBEDDING_ARTICLE = f"embedding_article_{EMBEDDING_MODEL_NAME}".replace("-", "_")
+TABLE_EMBEDDING_ABSTRACT = f"embedding_abstract_{EMBEDDING_MODEL_NAME}".replace(
+    "-", "_"
+)
+SIMILARITY_METRIC: Final = "<#>"
+DROP_LEGACY_TABLES = False
+
+postgres_connection_params = PostgresParams(
+    host=os.environ["POSTGRES_HOST"],
+    port=os.environ["POSTGRES_PORT"],
+    user=os.environ["POSTGRES_USER"],
+    pwd=os.environ["POSTGRES_PWD"],
+    database=os.environ["POSTGRES_DB"],
+)
+
+
+def table_columns(conn: psycopg.Connection, table_name: str) -> dict:
+    """Name and type (e.g. 'vector(768)') of the columns of a table"""
+    rows = conn.execute(
+        """
+        SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute
+        WHERE attrelid = to_regclass(%s) AND attnum > 0 AND NOT attisdropped
+        """,
+        (table_name,),
+    ).fetchall()
+    return dict(rows)
+
+
+conn = open_db_connection(connection_params=postgres_connection_params, autocommit=True)
+
+if conn:
+    create_content_tables(conn=conn)
+
+    for table_name in [TABLE_EMBEDDING_ABSTRACT, TABLE_EMBEDDING_ARTICLE]:
+        columns = table_columns(conn=conn, table_name=table_name)
+        if "content" not in columns:
+            print(f"{table_name}: nothing to migrate")
+            continue
+
+        match_type = re.match(r"(vector|halfvec)\((\d+)\)", columns["embedding"])
+        if match_type is None:
+            print(f"{table_name}: unsupported embedding type {columns['embedding']}")
+            continue
+        precision = cast(EmbeddingPrecision, match_type.group(1))
+        dimension = match_type.group(2)
+        legacy_table = f"{table_name}_legacy"
+
+        # One transaction per table, so a failure leaves it untouched
+        with conn.transaction():
+            conn.execute(
+                f"""
+                INSERT INTO {ARTICLES_TABLE} (arxiv_id)
+                SELECT DISTINCT article_id FROM {table_name}
+                ON CONFLICT (arxiv_id) DO NOTHING
+                """
+            )
+            conn.execute(
+                f"""
+                INSERT INTO {CHUNKS_TABLE} (article_id, content)
+                SELECT DISTINCT a.id, t.content
+                FROM {table_name} t
+                JOIN {ARTICLES_TABLE} a ON a.arxiv_id = t.article_id
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {CHUNKS_TABLE} c
+                    WHERE c.article_id = a.id AND c.content = t.content
+                )
+                """
+            )
+
+            # Indexes keep the name of the table they were created for
+            for (index_name,) in conn.execute(
+                "SELECT indexname FROM pg_indexes WHERE tablename = %s",
+                (table_name,),
+            ).fetchall():
+                conn.execute(
+                    f"ALTER INDEX {index_name} RENAME TO {index_name.replace(table_name, legacy_table, 1)}"
+                )
+            conn.execute(f"ALTER TABLE {table_name} RENAME TO {legacy_table}")
+
+            create_embedding_table(
+                conn=conn,
+                table_name=table_name,
+                embedding_dimension=int(dimension),
+                precision=precision,
+            )
+            rows_migrated = conn.execute(
+                f"""
+                INSERT INTO {table_name} (chunk_id, primary_category, embedding)
+                SELECT DISTINCT ON (c.id) c.id, coalesce(a.primary_category, ''), t.embedding
+                FROM {legacy_table} t
+                JOIN {ARTICLES_TABLE} a ON a.arxiv_id = t.article_id
+                JOIN {CHUNKS_TABLE} c ON c.article_id = a.id AND c.content = t.content
+                ORDER BY c.id
+                """
+            ).rowcount
+
+        # Recompute the reduced embeddings of every saved projection
+        for column in columns:
+            match = re.match(r"embedding_reduced_v(\d+)$", column)
+            projection = (
+                load_projection(table=table_name, version=int(match.group(1)))
+                if match
+                else None
+            )
+            if projection is not None:
+                backfill_reduced_embeddings(
+                    conn=conn, table_name=table_name, projection=projection
+                )
+                create_vector_index(
+                    conn=conn,
+                    table_name=table_name,
+                    similarity_metric=SIMILARITY_METRIC,
+                    precision="vector",
+                    column=column,
+                )
+
+        create_vector_index(
+            conn=conn,
+            table_name=table_name,
+            similarity_metric=SIMILARITY_METRIC,
+            precision=precision,
+            index_params=VECTOR_INDEX_PARAMS,
+        )
+        if DROP_LEGACY_TABLES:
+            conn.execute(f"DROP TABLE {legacy_table}")
+        print(f"{table_name}: {rows_migrated} embeddings migrated")
+
+    conn.execute(f"ANALYZE {ARTICLES_TABLE}")
+    conn.execute(f"ANALYZE {CHUNKS_TABLE}")
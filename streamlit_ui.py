@@ -4,18 +4,20 @@ import os
 import sys
 import uuid
 import time
+import atexit
 from dotenv import load_dotenv, dotenv_values
 from typing import List, Final, Generator, Optional
 from datetime import datetime, timedelta
 import streamlit as st
 
 from ragxiv.database import (
-    open_db_connection,
+    open_db_pool,
+    get_pool_stats,
     PostgresParams,
     SemanticSearch,
     UserFeedback,
-    insert_user_feedback,
 )
+from ragxiv.feedback import FeedbackWriter
 from ragxiv.retrieval import retrieve_similar_documents
 from ragxiv.llm import llm_chat_completion, GroqParams, build_rag_prompt
 from ragxiv.config import get_config
@@ -28,6 +30,7 @@ config = get_config()
 if config:
     config_ingestion = config["ingestion"]
     config_rag = config["rag"]
+    config_database = config["database"]
 
 st.set_page_config(
     page_icon="💬",
@@ -37,6 +40,8 @@ st.set_page_config(
 
 # Set variables
 EMBEDDING_MODEL_NAME: Final = config_ingestion["embedding_model_name"]
+EMBEDDING_BACKEND: Final = config_ingestion["embedding_backend"]
+EMBEDDING_PRECISION: Final = config_ingestion["embedding_precision"]
 TABLE_EMBEDDING_ARTICLE = f"embedding_article_{EMBEDDING_MODEL_NAME}".replace("-", "_")
 TABLE_EMBEDDING_ABSTRACT = f"embedding_abstract_{EMBEDDING_MODEL_NAME}".replace(
     "-", "_"
@@ -46,6 +51,11 @@ GROQ_API_KEY = os.environ["GROQ_API_KEY"]
 LLM_MODEL: Final = "groq"
 LLM_MODEL_PARAMS = GroqParams(api_key=GROQ_API_KEY, model=config_rag["llm_model"])
 RETRIEVAL_METHOD: Final = config_rag["retrieval_method"]
+REDUCTION_VERSION: Final = config_rag.get("reduction_version")
+EF_SEARCH: Final = config_rag.get("ef_search")
+PROBES: Final = config_rag.get("probes")
+MAX_CHUNKS_PER_ARTICLE: Final = config_rag.get("max_chunks_per_article")
+BINARY_QUANTIZATION: Final = config_rag.get("binary_quantization", False)
 
 postgres_connection_params = PostgresParams(
     host=os.environ["POSTGRES_HOST"],
@@ -59,11 +69,25 @@ client = Groq(api_key=GROQ_API_KEY)
 
 
 @st.cache_resource
-def open_connection():
-    conn = open_db_connection(
-        connection_params=postgres_connection_params, autocommit=True
+def open_connection_pool():
+    # Shared by every session; each retrieval or feedback write checks out
+    # its own connection
+    pool = open_db_pool(
+        connection_params=postgres_connection_params,
+        min_size=config_database["pool_min_size"],
+        max_size=config_database["pool_max_size"],
+        timeout=config_database["pool_timeout"],
     )
-    return conn
+    return pool
+
+
+@st.cache_resource
+def open_feedback_writer() -> FeedbackWriter:
+    # Feedback is written in the background; pending records are flushed
+    # when the server exits
+    feedback_writer = FeedbackWriter(conn=open_connection_pool())
+    atexit.register(feedback_writer.close)
+    return feedback_writer
 
 
 @st.cache_resource
@@ -73,7 +97,8 @@ def create_unique_id() -> str:
 
 
 unique_id = create_unique_id()
-conn = open_connection()
+pool = open_connection_pool()
+feedback_writer = open_feedback_writer()
 
 # Streamlit app
 st.header(
@@ -113,6 +138,7 @@ def build_user_feedback(
     user_question: str,
     system_answer: str,
     references: Optional[str] = None,
+    similarity: Optional[float] = None,
     satisfied: Optional[int] = None,
     elapsed_time: Optional[timedelta] = None,
     feedback_timestamp: Optional[datetime] = datetime.now(),
@@ -123,7 +149,7 @@ def build_user_feedback(
         answer=system_answer,
         thumbs=satisfied,
         documents_retrieved=references,
-        similarity=None,
+        similarity=similarity,
         relevance=None,
         llm_model=None,
         embedding_model=None,
@@ -162,6 +188,12 @@ if st.session_state.question_state:
                 similarity_metric="<#>",
                 embedding_model=EMBEDDING_MODEL_NAME,
                 max_documents=3,
+                embedding_backend=EMBEDDING_BACKEND,
+                embedding_precision=EMBEDDING_PRECISION,
+                reduction_version=REDUCTION_VERSION,
+                binary_quantization=BINARY_QUANTIZATION,
+                ef_search=EF_SEARCH,
+                probes=PROBES,
             )
 
             semantic_search_article = SemanticSearch(
@@ -170,6 +202,13 @@ if st.session_state.question_state:
                 similarity_metric="<#>",
                 embedding_model=EMBEDDING_MODEL_NAME,
                 max_documents=3,
+                embedding_backend=EMBEDDING_BACKEND,
+                embedding_precision=EMBEDDING_PRECISION,
+                reduction_version=REDUCTION_VERSION,
+                binary_quantization=BINARY_QUANTIZATION,
+                ef_search=EF_SEARCH,
+                probes=PROBES,
+                max_chunks_per_article=MAX_CHUNKS_PER_ARTICLE,
             )
 
             semantic_search_hierarchy = [
@@ -178,7 +217,7 @@ if st.session_state.question_state:
             ]
 
             relevant_documents = retrieve_similar_documents(
-                conn=conn,
+                conn=pool,
                 retrieval_method=RETRIEVAL_METHOD,
                 retrieval_parameters=semantic_search_hierarchy,
             )
@@ -200,6 +239,7 @@ If you would like to learn more about the topic, I suggest you refer to the foll
                 [f"- {url}" for url in relevant_documents["references"]]
             )
             print(references_response)
+            print(get_pool_stats(pool))
 
             # Use the generator function with st.write_stream
             with st.chat_message("assistant", avatar="🤖"):
@@ -240,6 +280,7 @@ If you would like to learn more about the topic, I suggest you refer to the foll
         user_question=user_query,
         system_answer=full_response,
         references=";".join(relevant_documents["references"]),
+        similarity=max(relevant_documents["scores"], default=None),
         satisfied=response,
         elapsed_time=end_time - ini_time,
     )
@@ -255,7 +296,8 @@ if st.session_state.response is not None:
     print(st.session_state.user_feedback)
 
     # Now it can be stored in a database (or appended to a list)
-    insert_user_feedback(conn=conn, feedback=st.session_state.user_feedback)
+    feedback_writer.submit(st.session_state.user_feedback)
+    print(feedback_writer.stats())
 
     st.session_state.feedback.append(st.session_state.user_feedback)
     print(st.session_state.feedback)
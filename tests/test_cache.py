@@ -0,0 +1,25 @@
+"""Tests of the persistent chunk embedding cache"""
+
+import os
+import numpy as np
+
+from ragxiv.cache import ChunkEmbeddingCache
+
+
+def test_put_many_after_interrupted_append(tmp_path):
+    cache = ChunkEmbeddingCache(directory=str(tmp_path), model_name="model")
+    first = np.array([[1.0, 2.0, 3.0]], dtype=np.float32)
+    cache.put_many(["first chunk"], first)
+
+    # A crash after the append and before the commit of the index leaves a
+    # vector no hash points to, here followed by part of another one
+    with open(os.path.join(cache.directory, "vectors.f32"), "ab") as file:
+        file.write(np.array([9.0, 9.0, 9.0, 9.0], dtype=np.float32).tobytes())
+
+    second = np.array([[4.0, 5.0, 6.0]], dtype=np.float32)
+    cache.put_many(["second chunk"], second)
+
+    cached = cache.get_many(["first chunk", "second chunk"])
+    np.testing.assert_array_equal(cached[0], first[0])
+    np.testing.assert_array_equal(cached[1], second[0])
+    cache.close()
@@ -0,0 +1,143 @@
+"""
+Tests of the embedding writes against a PostgreSQL database with pgvector
+
+They run in a temporary schema of the database given by the POSTGRES_*
+environment variables (see .env), and are skipped when it is not set.
+"""
+
+import os
+import uuid
+import datetime
+import numpy as np
+import pytest
+
+pytest.importorskip("pgvector")
+psycopg = pytest.importorskip("psycopg")
+
+from ragxiv.database import (
+    backfill_reduced_embeddings,
+    create_embedding_table,
+    insert_article_metadata,
+    insert_embedding_data,
+)
+from ragxiv.embedding import PaperEmbedding
+from ragxiv.ingest import PaperID
+from ragxiv.reduction import Projection, apply_projection
+
+EMBEDDING_DIMENSION = 4
+TABLE_NAME = "embedding_article_test"
+PAPER_ID = "http://arxiv.org/abs/2401.00001v1"
+
+
+@pytest.fixture
+def conn():
+    if "POSTGRES_HOST" not in os.environ:
+        pytest.skip("POSTGRES_HOST is not set")
+    connection = psycopg.connect(
+        host=os.environ["POSTGRES_HOST"],
+        port=os.environ["POSTGRES_PORT"],
+        user=os.environ["POSTGRES_USER"],
+        password=os.environ["POSTGRES_PWD"],
+        dbname=os.environ["POSTGRES_DB"],
+        autocommit=True,
+    )
+    schema = f"test_{uuid.uuid4().hex[:8]}"
+    connection.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    connection.execute(f"CREATE SCHEMA {schema}")
+    connection.execute(f"SET search_path TO {schema}, public")
+    yield connection
+    connection.execute(f"DROP SCHEMA {schema} CASCADE")
+    connection.close()
+
+
+def paper_embedding(embedding: np.ndarray) -> PaperEmbedding:
+    return PaperEmbedding(
+        id=PAPER_ID,
+        content="Chunk of the paper",
+        embeddings=embedding,
+        chunk_index=0,
+    )
+
+
+@pytest.mark.parametrize("method", ["executemany", "copy"])
+def test_upsert_refreshes_reduced_embedding(conn, method):
+    create_embedding_table(
+        conn=conn, table_name=TABLE_NAME, embedding_dimension=EMBEDDING_DIMENSION
+    )
+    projection = Projection(
+        table=TABLE_NAME,
+        version=1,
+        method="pca",
+        input_dimension=EMBEDDING_DIMENSION,
+        output_dimension=2,
+        components=np.eye(EMBEDDING_DIMENSION, 2, dtype=np.float32),
+    )
+
+    old_embedding = np.array([1.0, 2.0, 3.0, 4.0], dtype=np.float32)
+    insert_embedding_data(
+        conn=conn,
+        table_name=TABLE_NAME,
+        paper_embedding=[paper_embedding(old_embedding)],
+        method=method,
+    )
+    assert backfill_reduced_embeddings(conn, TABLE_NAME, projection) == 1
+
+    new_embedding = np.array([5.0, 6.0, 7.0, 8.0], dtype=np.float32)
+    insert_embedding_data(
+        conn=conn,
+        table_name=TABLE_NAME,
+        paper_embedding=[paper_embedding(new_embedding)],
+        method=method,
+    )
+    assert backfill_reduced_embeddings(conn, TABLE_NAME, projection) == 1
+
+    reduced = conn.execute(f"SELECT embedding_reduced_v1 FROM {TABLE_NAME}").fetchall()
+    assert len(reduced) == 1
+    np.testing.assert_allclose(
+        reduced[0][0], apply_projection(projection, new_embedding)
+    )
+
+
+@pytest.mark.parametrize("method", ["executemany", "copy"])
+def test_upsert_moves_chunk_to_new_category(conn, method):
+    create_embedding_table(
+        conn=conn,
+        table_name=TABLE_NAME,
+        embedding_dimension=EMBEDDING_DIMENSION,
+        partition_by_category=True,
+        partition_categories=["cs.AI", "cs.LG"],
+    )
+    embedding = np.array([1.0, 2.0, 3.0, 4.0], dtype=np.float32)
+
+    # Stored before the metadata of its paper, in the default partition
+    insert_embedding_data(
+        conn=conn,
+        table_name=TABLE_NAME,
+        paper_embedding=[paper_embedding(embedding)],
+        method=method,
+    )
+    for primary_category in ["cs.AI", "cs.LG"]:
+        insert_article_metadata(
+            conn=conn,
+            papers=[
+                PaperID(
+                    id=PAPER_ID,
+                    summary="Abstract of the paper",
+                    authors=["Author"],
+                    entry_url=PAPER_ID,
+                    published=datetime.datetime(2024, 1, 1),
+                    primary_category=primary_category,
+                    categories=[primary_category],
+                )
+            ],
+        )
+        insert_embedding_data(
+            conn=conn,
+            table_name=TABLE_NAME,
+            paper_embedding=[paper_embedding(embedding)],
+            method=method,
+        )
+        rows = conn.execute(
+            f"SELECT chunk_id, primary_category FROM {TABLE_NAME}"
+        ).fetchall()
+        assert [row[1] for row in rows] == [primary_category]
@@ -5,17 +5,36 @@ from dotenv import load_dotenv
 from typing import Final
 from tqdm.auto import tqdm
 from ragxiv.database import (
+    ABSTRACT_CHUNK_SET,
     PostgresParams,
+    create_embedding_table,
     get_article_id_data,
+    get_article_ids_missing_metadata,
     open_db_connection,
+    insert_article_metadata,
     insert_embedding_data,
+    refresh_embedding_categories,
+    backfill_saved_projections,
+    add_binary_embedding_column,
+    create_vector_index,
+    VectorIndexParams,
 )
-from ragxiv.ingest import retrieve_arxiv_metadata, paper_html_to_markdown
+from ragxiv.ingest import (
+    retrieve_arxiv_metadata,
+    retrieve_arxiv_metadata_by_id,
+    paper_html_to_markdown,
+)
+from ragxiv.backends import model_key
+from ragxiv.cache import ChunkEmbeddingCache
 from ragxiv.embedding import (
     PaperEmbedding,
     ChunkParams,
     chunk_document,
+    chunk_set_name,
     document_embedding,
+    load_embedding_model,
+    document_embedding_parallel,
+    summarize_encoding_stats,
 )
 from ragxiv.config import get_config
 
@@ -23,12 +42,26 @@ load_dotenv(".env")
 config = get_config()
 if config:
     config_ingestion = config["ingestion"]
+    config_index = config["index"]
 
 MAX_RESULTS_ARXIV = config_ingestion["max_documents_arxiv"]
 CHUNK_SIZE = config_ingestion["chunk_size"]
 CHUNK_OVERLAP = config_ingestion["chunk_overlap"]
 CHUNK_METHOD: Final = config_ingestion["chunk_method"]
 EMBEDDING_MODEL_NAME: Final = config_ingestion["embedding_model_name"]
+EMBEDDING_BACKEND = config_ingestion["embedding_backend"]
+EMBEDDING_PRECISION = config_ingestion["embedding_precision"]
+EMBEDDING_BATCH_SIZE = config_ingestion["embedding_batch_size"]
+EMBEDDING_WORKERS = config_ingestion["embedding_workers"]
+CHUNK_CACHE_DIR = config_ingestion.get("chunk_cache_dir")
+PARTITION_BY_CATEGORY: Final = config_ingestion.get("partition_by_category", False)
+VECTOR_INDEX_PARAMS = VectorIndexParams(
+    method=config_index["method"],
+    m=config_index["m"],
+    ef_construction=config_index["ef_construction"],
+    lists=config_index["lists"],
+    binary_quantization=config_index.get("binary_quantization", False),
+)
 TABLE_EMBEDDING_ARTICLE = f"embedding_article_{EMBEDDING_MODEL_NAME}".replace("-", "_")
 TABLE_EMBEDDING_ABSTRACT = f"embedding_abstract_{EMBEDDING_MODEL_NAME}".replace(
     "-", "_"
@@ -42,9 +75,39 @@ postgres_connection_params = PostgresParams(
     pwd=os.environ["POSTGRES_PWD"],
     database=os.environ["POSTGRES_DB"],
 )
-conn = open_db_connection(connection_params=postgres_connection_params, autocommit=True)
 
-if MAX_RESULTS_ARXIV > 0:
+# Guard the ingestion so that embedding worker processes can import this module
+if __name__ == "__main__" and MAX_RESULTS_ARXIV > 0:
+    conn = open_db_connection(
+        connection_params=postgres_connection_params, autocommit=True
+    )
+
+    # Bring the schema of databases created by older versions up to date
+    # (columns and indexes added since are created if missing)
+    embedding_dimension = load_embedding_model(
+        EMBEDDING_MODEL_NAME, backend=EMBEDDING_BACKEND
+    ).get_sentence_embedding_dimension()
+    for table_name in [TABLE_EMBEDDING_ARTICLE, TABLE_EMBEDDING_ABSTRACT]:
+        create_embedding_table(
+            conn=conn,
+            table_name=table_name,
+            embedding_dimension=embedding_dimension,
+            precision=EMBEDDING_PRECISION,
+            partition_by_category=PARTITION_BY_CATEGORY,
+        )
+
+    # Fill the metadata of papers stored without it (e.g. migrated from the
+    # previous schema), their rows get its category below
+    ids_missing_metadata = get_article_ids_missing_metadata(conn=conn)
+    if ids_missing_metadata:
+        papers_metadata = retrieve_arxiv_metadata_by_id(
+            paper_ids=ids_missing_metadata, verbose=True
+        )
+        insert_article_metadata(conn=conn, papers=papers_metadata)
+        print(
+            f"Filled metadata of {len(papers_metadata)} of {len(ids_missing_metadata)} papers"
+        )
+
     # Get list of article ids already present in database
     article_ids_stored = get_article_id_data(
         conn=conn, table_name=TABLE_EMBEDDING_ARTICLE
@@ -61,9 +124,7 @@ if MAX_RESULTS_ARXIV > 0:
         article_markdown = paper_html_to_markdown(paper_id=paper_id, verbose=True)
         if article_markdown:
             dict_markdown = dict(id=paper_id["id"], article=article_markdown)
-            dict_markdown["abstract"] = [
-                meta["summary"] for meta in metadata if meta["id"] == paper_id["id"]
-            ]
+            dict_markdown["abstract"] = paper_id["summary"]
             markdown_text.append(dict_markdown)
         else:
             print(f"Unable to parse document {paper_id['id']}")
@@ -73,38 +134,66 @@ if MAX_RESULTS_ARXIV > 0:
         method=CHUNK_METHOD, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP
     )
 
-    list_article_embeddings = []
-    list_abstract_embeddings = []
-    embedding_dimension = 0
+    list_article_chunks = []
+    list_abstract_chunks = []
     for article in tqdm(markdown_text, total=len(markdown_text)):
-        article_id = article["id"]
-        document = article["article"]
-        abstract = article["abstract"]
-
         # Chunk document
         document_chunks = chunk_document(
-            document=document, chunk_params=chunk_parameters
+            document=article["article"], chunk_params=chunk_parameters
         )
+        list_article_chunks.append(document_chunks)
+        list_abstract_chunks.append([article["abstract"]])
 
-        # Document embedding
-        article_embedding = document_embedding(
-            chunks=document_chunks, embedding_model=EMBEDDING_MODEL_NAME
+    chunk_cache = None
+    if CHUNK_CACHE_DIR:
+        chunk_cache = ChunkEmbeddingCache(
+            directory=CHUNK_CACHE_DIR,
+            model_name=model_key(EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND),
         )
 
-        # Abstract embedding
-        abstract_embedding = document_embedding(
-            chunks=[abstract], embedding_model=EMBEDDING_MODEL_NAME
+    if EMBEDDING_WORKERS > 1:
+        # Spread articles and abstracts over a pool of worker processes
+        list_embeddings = document_embedding_parallel(
+            documents=list_article_chunks + list_abstract_chunks,
+            embedding_model=EMBEDDING_MODEL_NAME,
+            num_workers=EMBEDDING_WORKERS,
+            batch_size=EMBEDDING_BATCH_SIZE,
+            cache=chunk_cache,
+            backend=EMBEDDING_BACKEND,
         )
+    else:
+        list_embeddings = [
+            document_embedding(
+                chunks=chunks,
+                embedding_model=EMBEDDING_MODEL_NAME,
+                batch_size=EMBEDDING_BATCH_SIZE,
+                cache=chunk_cache,
+                backend=EMBEDDING_BACKEND,
+            )
+            for chunks in tqdm(
+                list_article_chunks + list_abstract_chunks,
+                total=len(list_article_chunks) + len(list_abstract_chunks),
+            )
+        ]
+    print(f"Encoding stats: {summarize_encoding_stats(list_embeddings)}")
+    if chunk_cache is not None:
+        print(f"Chunk embedding cache: {chunk_cache.stats()}")
+    list_article_embedding = list_embeddings[: len(markdown_text)]
+    list_abstract_embedding = list_embeddings[len(markdown_text) :]
 
-        if embedding_dimension == 0:
-            embedding_dimension = article_embedding["dimension"]
-
-        # Format output
+    # Format output
+    list_article_embeddings = []
+    list_abstract_embeddings = []
+    for article, article_embedding, abstract_embedding in zip(
+        markdown_text, list_article_embedding, list_abstract_embedding
+    ):
+        article_id = article["id"]
         for i in range(len(article_embedding["content"])):
             row_store = PaperEmbedding(
                 id=article_id,
                 content=article_embedding["content"][i],
                 embeddings=article_embedding["embedding"][i, :],
+                chunk_index=i,
             )
             list_article_embeddings.append(row_store)
 
@@ -113,17 +202,58 @@ if MAX_RESULTS_ARXIV > 0:
                 id=article_id,
                 content=abstract_embedding["content"][i],
                 embeddings=abstract_embedding["embedding"][i, :],
+                chunk_index=i,
             )
             list_abstract_embeddings.append(row_store)
 
-    # Store documents and embeddings in the database
-    insert_embedding_data(
+    # Store paper metadata, then chunks and embeddings (binary COPY for
+    # large writes, executemany for small ones)
+    parsed_ids = {article["id"] for article in markdown_text}
+    insert_article_metadata(
+        conn=conn,
+        papers=[paper_id for paper_id in metadata if paper_id["id"] in parsed_ids],
+    )
+    rows_article = insert_embedding_data(
         conn=conn,
         table_name=TABLE_EMBEDDING_ARTICLE,
         paper_embedding=list_article_embeddings,
+        precision=EMBEDDING_PRECISION,
+        chunk_set=chunk_set_name(chunk_parameters),
     )
-    insert_embedding_data(
+    rows_abstract = insert_embedding_data(
         conn=conn,
         table_name=TABLE_EMBEDDING_ABSTRACT,
         paper_embedding=list_abstract_embeddings,
+        precision=EMBEDDING_PRECISION,
+        chunk_set=ABSTRACT_CHUNK_SET,
     )
+    print(
+        f"Inserted or updated {rows_article} article rows and {rows_abstract} abstract rows"
+    )
+
+    # Categories of chunks embedded before their paper metadata was stored
+    for table_name in [TABLE_EMBEDDING_ARTICLE, TABLE_EMBEDDING_ABSTRACT]:
+        refresh_embedding_categories(conn=conn, table_name=table_name)
+
+    # Build the vector indexes if they do not exist yet (IVFFlat needs the
+    # loaded rows to compute its lists). Indexes deferred with
+    # scripts/maintain_database.py are left to its rebuild command
+    for table_name in [TABLE_EMBEDDING_ARTICLE, TABLE_EMBEDDING_ABSTRACT]:
+        create_vector_index(
+            conn=conn,
+            table_name=table_name,
+            similarity_metric="<#>",
+            precision=EMBEDDING_PRECISION,
+            index_params=VECTOR_INDEX_PARAMS,
+        )
+        if VECTOR_INDEX_PARAMS.get("binary_quantization", False):
+            add_binary_embedding_column(
+                conn=conn, table_name=table_name, index_params=VECTOR_INDEX_PARAMS
+            )
+
+    # Project new rows on every reduced search column fitted, since searches
+    # may use any configured reduction_version
+    for table_name in [TABLE_EMBEDDING_ARTICLE, TABLE_EMBEDDING_ABSTRACT]:
+        rows_projected = backfill_saved_projections(conn=conn, table_name=table_name)
+        for version, rows in rows_projected.items():
+            print(f"{table_name}: {rows} rows projected on version {version}")